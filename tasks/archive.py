@@ -0,0 +1,55 @@
+"""
+Moves completed todos out of the todo table into ArchivedTodo, in short
+transactions of `batch_size` rows, so the hot table and the todo list
+queries only carry what users still look at.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .cache import bump_list_version
+from .changes import record_changes
+from .counters import adjust_counts
+from .events import publish_event
+from .models import ArchivedTodo, Todo
+from .search import unindex_todos
+
+
+def archive_batch(completed_before, batch_size=500, using='default'):
+    """
+    Archive up to `batch_size` todos on the `using` shard completed before
+    `completed_before`, oldest first, and return how many were moved. The rows
+    are locked only for the duration of this one batch.
+    """
+    with transaction.atomic(using=using):
+        todos = list(
+            Todo.objects.using(using).select_for_update()
+            .filter(completed=True, completed_at__lt=completed_before)
+            .order_by('completed_at', 'id')
+            .only('id', 'user_id', 'title', 'description', 'completed_at')[:batch_size]
+        )
+        if not todos:
+            return 0
+        ArchivedTodo.objects.using(using).bulk_create([
+            ArchivedTodo(
+                todo_id=todo.id,
+                user_id=todo.user_id,
+                title=todo.title,
+                description=todo.description,
+                completed_at=todo.completed_at,
+            )
+            for todo in todos
+        ])
+        ids_by_user = defaultdict(list)
+        for todo in todos:
+            ids_by_user[todo.user_id].append(todo.id)
+        for user_id, todo_ids in ids_by_user.items():
+            unindex_todos(user_id, todo_ids)
+            adjust_counts(user_id, total=-len(todo_ids), completed=-len(todo_ids))
+            record_changes(user_id, deleted=todo_ids)
+            publish_event(user_id, 'deleted', ids=todo_ids)
+        Todo.objects.using(using).filter(id__in=[todo.id for todo in todos]).delete()
+
+    for user_id in ids_by_user:
+        bump_list_version(user_id)
+    return len(todos)
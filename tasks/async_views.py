@@ -0,0 +1,236 @@
+"""
+Async versions of login_view, todo_page, add_task, toggle_task and delete_task
+that use the async ORM instead of running the sync views in a thread. Enabled
+with TODO_ASYNC_VIEWS = True.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate, alogin
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+from django.utils.cache import get_conditional_response
+
+from .cache import abump_list_version, aget_cached_list, aget_list_state, alist_version, astore_list, astore_list_state
+from .counters import counted_delete, counted_toggle, counted_update, get_counts, list_state
+from .db.sharding import is_sharded, shard_for
+from .changes import record_changes
+from .events import events_options, format_event, get_broker, publish_event, todo_payload
+from .models import LIST_FIELDS, Todo
+from .search import index_new_todos, index_todo, unindex_todos
+from .hashing import PoolSaturated
+from .serializers import LoginSerializer, TodoSerializer
+from .views import (
+    BUSY_ERRORS, _edit_task_id, _find_edit_task, _list_params, _list_rows, _page_context, _page_validators,
+    _require_rows, _with_validators,
+)
+
+
+async def _load_user(request):
+    # The auth context processor reads request.user, whose lazy loader is sync-only.
+    request.user = await request.auser()
+    if request.user.is_authenticated and is_sharded():
+        # Likewise the shard lookup; owned_by() then finds it cached.
+        await sync_to_async(shard_for)(request.user.id)
+    return request.user
+
+
+async def _cached_list_state(user_id):
+    version = await alist_version(user_id)
+    state = await aget_list_state(user_id, version)
+    if state is None:
+        state = await sync_to_async(list_state)(user_id)
+        await astore_list_state(user_id, version, state)
+    return version, state
+
+
+async def _todo_list_context(request, edit_task_id=None):
+    mode, after, page_size, variant = _list_params(request)
+    version = await alist_version(request.user.id)
+    cached = await aget_cached_list(request, version, variant)
+    if cached is not None:
+        todo_list, context = cached
+    else:
+        rows = _list_rows(Todo.objects.owned_by(request.user), edit_task_id).keyset_page(mode, after, page_size + 1)
+        todos = [todo async for todo in rows]
+        context = {
+            **_page_context(todos, mode, after, page_size),
+            'counts': await sync_to_async(get_counts)(request.user.id),
+            'edit_task': _find_edit_task(todos, edit_task_id),
+        }
+        todo_list = await astore_list(request, version, variant, context)
+    return {**context, 'todo_list': todo_list, 'filter': mode}
+
+
+# The write and its search index and counter updates must share a
+# transaction (events are published when it commits), and
+# transaction.atomic() is sync-only, so each runs as one sync_to_async call.
+
+@sync_to_async
+def _save_task(user, task_id, fields):
+    with transaction.atomic(using=shard_for(user.id)):
+        if task_id:
+            _require_rows(counted_update(Todo.objects.owned_by(user).filter(id=task_id), user.id, **fields))
+            index_todo(user.id, task_id, fields['title'], fields.get('description'))
+            record_changes(user.id, changed=[task_id])
+            publish_event(user.id, 'edited', todos=[{'id': int(task_id), **fields}])
+        else:
+            todo = Todo.objects.create(user=user, **fields)
+            index_new_todos([todo])
+            record_changes(user.id, changed=[todo.id])
+            publish_event(user.id, 'created', todos=[todo_payload(todo)])
+
+
+@sync_to_async
+def _toggle_task(user, task_id):
+    with transaction.atomic(using=shard_for(user.id)):
+        _require_rows(counted_toggle(Todo.objects.owned_by(user).filter(id=task_id), user.id))
+        record_changes(user.id, changed=[task_id])
+        publish_event(user.id, 'toggled', ids=[task_id])
+
+
+@sync_to_async
+def _delete_task(user, task_id):
+    with transaction.atomic(using=shard_for(user.id)):
+        unindex_todos(user, [task_id])
+        _require_rows(counted_delete(Todo.objects.owned_by(user).filter(id=task_id), user.id))
+        record_changes(user.id, deleted=[task_id])
+        publish_event(user.id, 'deleted', ids=[task_id])
+
+
+async def login_view(request):
+    await _load_user(request)
+    if request.method == 'POST':
+        serializer = LoginSerializer(data=request.POST)
+
+        if serializer.is_valid():
+            try:
+                # Awaits the hashing pool instead of blocking the event loop.
+                user = await aauthenticate(
+                    request,
+                    username=serializer.validated_data['username'],
+                    password=serializer.validated_data['password'],
+                )
+            except PoolSaturated:
+                return render(request, 'login.html', {
+                    'form_data': request.POST,
+                    'errors': BUSY_ERRORS,
+                }, status=429)
+
+            if user is not None:
+                await alogin(request, user)
+                return redirect('todo')
+            return render(request, 'login.html', {
+                'form_data': request.POST,
+                'errors': {'non_field_errors': ["Invalid username or password."]}
+            })
+
+        return render(request, 'login.html', {
+            'form_data': request.POST,
+            'errors': serializer.errors,
+        })
+
+    return render(request, 'login.html', {
+        'form_data': {},
+        'errors': {}
+    })
+
+
+@login_required
+async def todo_page(request):
+    user = await _load_user(request)
+    edit_task_id = _edit_task_id(request)
+    etag, last_modified = _page_validators(request, *await _cached_list_state(user.id))
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, last_modified)
+    context = await _todo_list_context(request, edit_task_id)
+    if edit_task_id is not None and context.get('edit_task') is None:
+        try:
+            context['edit_task'] = await Todo.objects.owned_by(user).only(*LIST_FIELDS, 'description').aget(id=edit_task_id)
+        except Todo.DoesNotExist:
+            raise Http404('No Todo matches the given query.')
+    return _with_validators(render(request, 'todo.html', context), etag, last_modified)
+
+
+@login_required
+async def add_task(request):
+    user = await _load_user(request)
+    if request.method == 'POST':
+        task_id = request.POST.get('task_id')
+
+        data = {
+            'title': request.POST.get('title'),
+            'description': request.POST.get('description', ''),
+            'completed': request.POST.get('completed', 'false') == 'true',
+        }
+
+        serializer = TodoSerializer(data=data)
+        if serializer.is_valid():
+            await _save_task(user, task_id, serializer.validated_data)
+            await abump_list_version(user.id)
+            return redirect('todo')
+        return render(request, 'todo.html', {
+            **await _todo_list_context(request),
+            'form_data': data,
+            'errors': serializer.errors,
+        })
+
+    return render(request, 'todo.html', await _todo_list_context(request))
+
+
+@login_required
+async def toggle_task(request, task_id):
+    user = await _load_user(request)
+    if request.method == 'POST':
+        await _toggle_task(user, task_id)
+        await abump_list_version(user.id)
+    return redirect('todo')
+
+
+@login_required
+async def delete_task(request, task_id):
+    user = await _load_user(request)
+    if request.method == 'POST':
+        await _delete_task(user, task_id)
+        await abump_list_version(user.id)
+    return redirect('todo')
+
+
+@sync_to_async
+def _release_connections():
+    # An open event stream should not pin a database connection for its whole
+    # lifetime. Connections inside a transaction (as in tests) are left alone.
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+@login_required
+async def todo_events(request):
+    """
+    Server-Sent Events stream of changes to the user's todos. Only served
+    under ASGI, where an idle stream costs a suspended coroutine rather than
+    a worker thread.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('Live updates are only available under ASGI.', status=501, content_type='text/plain')
+    user = await _load_user(request)
+    await _release_connections()
+    heartbeat = events_options()['HEARTBEAT']
+
+    async def stream():
+        subscription = get_broker().subscribe(user.id)
+        try:
+            yield 'retry: 5000\n: connected\n\n'
+            while True:
+                event = await subscription.get(heartbeat)
+                yield ': keepalive\n\n' if event is None else format_event(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
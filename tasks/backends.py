@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+from . import hashing
+
+UserModel = get_user_model()
+
+# Fields kept in the cached user record. The password hash is left out: the
+# record only carries the session auth hash derived from it, which is all a
+# request needs to validate its session. Reading `password` off a cached user
+# loads it from the database.
+CACHED_USER_FIELDS = [
+    field.attname for field in UserModel._meta.concrete_fields if field.attname != 'password'
+]
+
+
+def _user_cache():
+    alias = settings.TODO_USER_CACHE
+    return caches[alias] if alias else None
+
+
+def _user_key(user_id):
+    return f'todo-user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    cache = _user_cache()
+    if cache is not None:
+        cache.delete(_user_key(user_id))
+
+
+class TodoModelBackend(ModelBackend):
+    """
+    ModelBackend that checks passwords on the hashing pool instead of the
+    request worker (hashing.PoolSaturated propagates to the caller), and serves
+    request.user from a cached record instead of an auth_user query.
+    """
+
+    def get_user(self, user_id):
+        cache = _user_cache()
+        if cache is None:
+            return super().get_user(user_id)
+        record = cache.get(_user_key(user_id))
+        if record is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(
+                    _user_key(user_id),
+                    ([getattr(user, name) for name in CACHED_USER_FIELDS], user.get_session_auth_hash()),
+                    settings.TODO_USER_CACHE_TIMEOUT,
+                )
+            return user
+        values, session_auth_hash = record
+        user = UserModel.from_db('default', CACHED_USER_FIELDS, values)
+        # Shadows the method, which would otherwise load the password to derive it.
+        user.get_session_auth_hash = lambda: session_auth_hash
+        return user if self.user_can_authenticate(user) else None
+
+    # Both authenticate methods load the user from the database, password
+    # hash included, instead of from the cached record.
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user (#20760).
+            hashing.make_password(password)
+        else:
+            if hashing.check_password(password, user.password) and self.user_can_authenticate(user):
+                if hashing.must_update(user.password):
+                    user.password = hashing.make_password(password)
+                    user.save(update_fields=['password'])
+                return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            await hashing.amake_password(password)
+        else:
+            if await hashing.acheck_password(password, user.password) and self.user_can_authenticate(user):
+                if hashing.must_update(user.password):
+                    user.password = await hashing.amake_password(password)
+                    await user.asave(update_fields=['password'])
+                return user
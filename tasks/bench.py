@@ -0,0 +1,374 @@
+"""
+Helpers for the `bench` management command: seeding throwaway users, driving
+the views in-process through the WSGI and ASGI handlers, and summarising
+latencies.
+"""
+import asyncio
+import math
+import random
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncClient, Client
+from django.urls import include, path
+from django.utils import timezone
+
+from .db.sharding import group_by_shard
+from .models import Todo
+from .ordering import keys_after
+from .stats import percentile
+from .urls import get_urlpatterns
+
+# Bench usernames carry a token per process, so they never clash with
+# existing accounts; cleanup() only deletes the users the bench created.
+BENCH_USER_PREFIX = f'bench-user-{secrets.token_hex(4)}-'
+BENCH_PASSWORD = 'bench-password'
+LOAD_VIEWS = ('signup', 'login_view', 'todo_page', 'add_task', 'toggle_task', 'delete_task')
+DEFAULT_LOAD_MIX = 'todo_page=60,toggle_task=15,add_task=12,delete_task=8,login_view=3,signup=2'
+
+
+def summarize(latencies, elapsed):
+    """Summarise per-request latencies (in seconds) collected over `elapsed` seconds."""
+    return {
+        'requests': len(latencies),
+        'requests_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+_created_lock = threading.Lock()
+_created_user_ids = set()
+
+
+def _track_users(usernames):
+    """Remember the users just created by the bench under `usernames`, for cleanup()."""
+    ids = User.objects.filter(username__in=usernames).values_list('id', flat=True)
+    with _created_lock:
+        _created_user_ids.update(ids)
+
+
+def seed_users(users, todos_per_user, batch_size=1000):
+    """Create `users` bench users with `todos_per_user` todos each, in bulk."""
+    password = make_password(BENCH_PASSWORD)
+    usernames = [f'{BENCH_USER_PREFIX}{i}' for i in range(users)]
+    created = User.objects.bulk_create([
+        User(username=username, email=f'{username}@example.com', password=password)
+        for username in usernames
+    ], batch_size=batch_size)
+    _track_users(usernames)
+    if any(user.pk is None for user in created):
+        created = list(User.objects.filter(username__in=usernames).order_by('id'))
+    now = timezone.now()
+    positions = keys_after(None, todos_per_user)
+    for alias, user_ids in group_by_shard([user.id for user in created]).items():
+        Todo.objects.using(alias).bulk_create((
+            Todo(
+                user_id=user_id, title=f'Bench todo {n}', description='Seeded by manage.py bench',
+                completed=n % 3 == 0, completed_at=now if n % 3 == 0 else None, position=positions[n],
+            )
+            for user_id in user_ids
+            for n in range(todos_per_user)
+        ), batch_size=batch_size)
+    return created
+
+
+def cleanup():
+    """Delete the users created by the bench so far, with their todos (on any shard; see tasks.signals)."""
+    with _created_lock:
+        user_ids = list(_created_user_ids)
+        _created_user_ids.clear()
+    User.objects.filter(id__in=user_ids).delete()
+
+
+def bench_urlconf(use_async_views):
+    """A root URLconf serving the tasks URLs with either the sync or the async todo views."""
+    return type('BenchUrlconf', (), {'urlpatterns': [path('auth/', include(get_urlpatterns(use_async_views)))]})
+
+
+def todo_workload(user, requests, write_ratio, seed=0):
+    """
+    Build `requests` (method, path) pairs against the user's todo page: mostly
+    page views, with `write_ratio` of them toggling one of the user's todos.
+    """
+    rng = random.Random(seed)
+    task_ids = list(Todo.objects.owned_by(user).values_list('id', flat=True)[:500])
+    workload = []
+    for _ in range(requests):
+        if task_ids and rng.random() < write_ratio:
+            workload.append(('post', f'/auth/toggle-task/{rng.choice(task_ids)}/'))
+        else:
+            workload.append(('get', '/auth/todo/'))
+    return workload
+
+
+def run_wsgi(user, workload, concurrency):
+    """Replay `workload` through the WSGI handler from `concurrency` threads."""
+    chunks = [workload[i::concurrency] for i in range(concurrency)]
+
+    def worker(chunk):
+        client = Client()
+        client.force_login(user)
+        latencies = []
+        for method, url in chunk:
+            start = time.perf_counter()
+            getattr(client, method)(url)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, chunks))
+    elapsed = time.perf_counter() - start
+    return summarize([latency for latencies in results for latency in latencies], elapsed)
+
+
+def run_asgi(user, workload, concurrency):
+    """Replay `workload` through the ASGI handler from `concurrency` concurrent tasks."""
+    chunks = [workload[i::concurrency] for i in range(concurrency)]
+
+    async def worker(chunk):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        latencies = []
+        for method, url in chunk:
+            start = time.perf_counter()
+            await getattr(client, method)(url)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    async def main():
+        return await asyncio.gather(*(worker(chunk) for chunk in chunks))
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    return summarize([latency for latencies in results for latency in latencies], elapsed)
+
+
+def run_signups(count):
+    """POST `count` signups through the signup view and count the queries each one costs."""
+    latencies, query_counts, sample = [], [], []
+    start = time.perf_counter()
+    for i in range(count):
+        username = f'{BENCH_USER_PREFIX}signup-{i}'
+        client = Client()
+        with CaptureQueriesContext(connection) as queries:
+            request_start = time.perf_counter()
+            client.post('/auth/signup/', {
+                'username': username,
+                'email': f'{username}@example.com',
+                'password1': BENCH_PASSWORD,
+                'password2': BENCH_PASSWORD,
+            })
+            latencies.append(time.perf_counter() - request_start)
+        _track_users([username])
+        query_counts.append(len(queries))
+        if not sample:
+            sample = [query['sql'][:120] for query in queries.captured_queries]
+    elapsed = time.perf_counter() - start
+    return {
+        **summarize(latencies, elapsed),
+        'queries_per_signup': {
+            'min': min(query_counts, default=0),
+            'max': max(query_counts, default=0),
+            'mean': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0,
+        },
+        'sample_queries': sample,
+    }
+
+
+def run_page_views(user, count, path='/auth/todo/'):
+    """GET `path` `count` times as `user` and count the queries each request costs."""
+    client = Client()
+    client.force_login(user)
+    client.get(path)
+    latencies, query_counts = [], []
+    start = time.perf_counter()
+    for _ in range(count):
+        with CaptureQueriesContext(connection) as queries:
+            request_start = time.perf_counter()
+            client.get(path)
+            latencies.append(time.perf_counter() - request_start)
+        _track_users([username])
+        query_counts.append(len(queries))
+    elapsed = time.perf_counter() - start
+    return {
+        **summarize(latencies, elapsed),
+        'queries_per_request': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0,
+    }
+
+
+def run_connection_setup(count, alias='default'):
+    """
+    Time opening a fresh connection against checking one out of the pool (and
+    returning it), which is what every request pays with CONN_MAX_AGE = 0.
+    """
+    wrapper = connections[alias]
+    if not hasattr(wrapper, 'pool'):
+        return {'error': f'{alias!r} does not use a pooled engine (tasks.db.backends.*).'}
+    pool = wrapper.pool
+
+    unpooled = []
+    for _ in range(count):
+        start = time.perf_counter()
+        conn = pool.connect()
+        unpooled.append(time.perf_counter() - start)
+        conn.close()
+
+    pooled = []
+    for _ in range(count):
+        start = time.perf_counter()
+        conn = pool.checkout()
+        pooled.append(time.perf_counter() - start)
+        pool.checkin(conn)
+
+    fields = ('mean_ms', 'p50_ms', 'p99_ms')
+    unpooled_summary = {name: summarize(unpooled, 1)[name] for name in fields}
+    pooled_summary = {name: summarize(pooled, 1)[name] for name in fields}
+    return {
+        'unpooled_connect': unpooled_summary,
+        'pooled_checkout': pooled_summary,
+        'saved_per_request_ms': round(unpooled_summary['mean_ms'] - pooled_summary['mean_ms'], 3),
+        'pool': pool.stats(),
+    }
+
+
+def parse_mix(spec):
+    """Parse 'todo_page=60,add_task=10,...' into {view: weight}."""
+    mix = {}
+    for part in filter(None, (part.strip() for part in spec.split(','))):
+        view, _, weight = part.partition('=')
+        view = view.strip()
+        if view not in LOAD_VIEWS:
+            raise ValueError(f"Unknown view {view!r}; choose from {', '.join(LOAD_VIEWS)}.")
+        try:
+            mix[view] = float(weight)
+        except ValueError:
+            raise ValueError(f'Invalid weight {weight!r} for {view}.')
+        if mix[view] < 0:
+            raise ValueError(f'Weight for {view} must not be negative.')
+    if not any(mix.values()):
+        raise ValueError('The mix needs at least one view with a positive weight.')
+    return mix
+
+
+def load_workload(mix, requests, seed=0):
+    """Draw `requests` view names according to the weights in `mix`."""
+    rng = random.Random(seed)
+    return rng.choices(list(mix), weights=list(mix.values()), k=requests)
+
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+def run_load(users, workload, concurrency, trace_memory=False):
+    """
+    Replay a `load_workload` through the WSGI handler from `concurrency`
+    threads. Each thread acts as one of `users` and owns a disjoint share of
+    that user's todos, so toggles and deletes never race for the same row.
+    A toggle or delete with no todo left to act on becomes a todo_page view.
+    """
+    chunks = [workload[i::concurrency] for i in range(concurrency)]
+    workers_per_user = math.ceil(concurrency / len(users))
+    todo_ids = defaultdict(list)
+    for alias, user_ids in group_by_shard([user.id for user in users]).items():
+        for user_id, todo_id in Todo.objects.using(alias).filter(user_id__in=user_ids).order_by('id').values_list('user_id', 'id'):
+            todo_ids[user_id].append(todo_id)
+
+    def worker(index, chunk):
+        user = users[index % len(users)]
+        ids = todo_ids[user.id][index // len(users)::workers_per_user]
+        client = Client()
+        client.force_login(user)
+        samples = []
+        for n, view in enumerate(chunk):
+            if view in ('toggle_task', 'delete_task') and not ids:
+                view = 'todo_page'
+            if view == 'signup':
+                username = f'{BENCH_USER_PREFIX}load-{index}-{n}'
+                request = (Client().post, '/auth/signup/', {
+                    'username': username,
+                    'email': f'{username}@example.com',
+                    'password1': BENCH_PASSWORD,
+                    'password2': BENCH_PASSWORD,
+                })
+            elif view == 'login_view':
+                request = (Client().post, '/auth/login/', {'username': user.username, 'password': BENCH_PASSWORD})
+            elif view == 'todo_page':
+                request = (client.get, '/auth/todo/', None)
+            elif view == 'add_task':
+                request = (client.post, '/auth/add-task/', {'title': f'Load todo {index}-{n}', 'description': 'Added by manage.py bench load'})
+            elif view == 'toggle_task':
+                request = (client.post, f'/auth/toggle-task/{random.choice(ids)}/', None)
+            else:
+                request = (client.post, f'/auth/delete-task/{ids.pop()}/', None)
+
+            method, url, data = request
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = method(url, data)
+                latency = time.perf_counter() - start
+            if view == 'signup':
+                _track_users([username])
+            samples.append((view, latency, len(queries), response.status_code))
+        connection.close()
+        return samples
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(worker, range(concurrency), chunks))
+        elapsed = time.perf_counter() - start
+        traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    samples = [sample for chunk in results for sample in chunk]
+    views = {}
+    for view in LOAD_VIEWS:
+        rows = [sample for sample in samples if sample[0] == view]
+        if not rows:
+            continue
+        query_counts = [row[2] for row in rows]
+        views[view] = {
+            **summarize([row[1] for row in rows], elapsed),
+            'queries': {
+                'min': min(query_counts),
+                'max': max(query_counts),
+                'mean': round(sum(query_counts) / len(query_counts), 2),
+            },
+            'status_codes': dict(sorted(Counter(str(row[3]) for row in rows).items())),
+        }
+    return {
+        'overall': summarize([sample[1] for sample in samples], elapsed),
+        'views': views,
+        'memory': {
+            'max_rss_kb': _max_rss_kb(),
+            'tracemalloc_peak_kb': traced_peak // 1024 if traced_peak is not None else None,
+        },
+    }
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .db.routers import reading_from_replicas
+
+# Rendered fragments are shared between a user's sessions, so the CSRF token is
+# rendered as this placeholder and swapped for the request's own token on the way out.
+CSRF_PLACEHOLDER = '__todo_csrf_token__'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[settings.TODO_FRAGMENT_CACHE]
+
+
+def _version_key(user_id):
+    return f'todo-list-version:{user_id}'
+
+
+def list_version(user_id):
+    """
+    Return the current version of the user's todo list. A missing version (first
+    use or evicted) starts from the current time in ns, so it never falls back
+    to a value that older cached fragments were stored under.
+    """
+    return _cache().get_or_set(_version_key(user_id), time.time_ns, timeout=None)
+
+
+async def alist_version(user_id):
+    return await _cache().aget_or_set(_version_key(user_id), time.time_ns, timeout=None)
+
+
+def bump_list_version(user_id):
+    """Invalidate every cached fragment of the user's list by moving to a new version."""
+    cache = _cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+async def abump_list_version(user_id):
+    cache = _cache()
+    try:
+        await cache.aincr(_version_key(user_id))
+    except ValueError:
+        await cache.aset(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def fragment_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _fragment_key(user_id, version, variant):
+    return 'todo-list:{}:{}:{}'.format(user_id, version, ':'.join(map(str, variant)))
+
+
+def _with_csrf_token(request, html):
+    return mark_safe(html.replace(CSRF_PLACEHOLDER, get_token(request)))
+
+
+def _cached_result(request, entry):
+    if entry is None:
+        _count('misses')
+        return None
+    _count('hits')
+    return _with_csrf_token(request, entry['html']), {'next_cursor': entry['next_cursor']}
+
+
+def _cacheable():
+    # Anything read from a replica may miss a write that is still being
+    # replicated, and a writer pinned to the primary would then be served it
+    # from the cache. Only what was read from the primary is stored.
+    return not reading_from_replicas()
+
+
+def get_cached_list(request, version, variant):
+    """Return `(html, context)` for a cached fragment of the user's list, or None on a miss."""
+    return _cached_result(request, _cache().get(_fragment_key(request.user.id, version, variant)))
+
+
+async def aget_cached_list(request, version, variant):
+    return _cached_result(request, await _cache().aget(_fragment_key(request.user.id, version, variant)))
+
+
+def store_list(request, version, variant, context, template_name='todo_list.html'):
+    """
+    Render the list fragment from `context`, cache it and return the html.
+    `version` must be the list version read before the rows were loaded, so a
+    write that lands in between leaves the fragment under the version it
+    made obsolete.
+    """
+    html = render_to_string(template_name, {**context, 'csrf_token': CSRF_PLACEHOLDER})
+    if _cacheable():
+        _cache().set(_fragment_key(request.user.id, version, variant), {'html': html, 'next_cursor': context.get('next_cursor')})
+    return _with_csrf_token(request, html)
+
+
+async def astore_list(request, version, variant, context, template_name='todo_list.html'):
+    html = render_to_string(template_name, {**context, 'csrf_token': CSRF_PLACEHOLDER})
+    if _cacheable():
+        await _cache().aset(_fragment_key(request.user.id, version, variant), {'html': html, 'next_cursor': context.get('next_cursor')})
+    return _with_csrf_token(request, html)
+
+
+def _state_key(user_id, version):
+    return f'todo-list-state:{user_id}:{version}'
+
+
+def get_list_state(user_id, version):
+    """The list_state() stored for `version` of the user's list, or None."""
+    return _cache().get(_state_key(user_id, version))
+
+
+async def aget_list_state(user_id, version):
+    return await _cache().aget(_state_key(user_id, version))
+
+
+def store_list_state(user_id, version, state):
+    # `version` is the one read before the state was, so a write that lands
+    # in between leaves this entry under the version it made obsolete.
+    if _cacheable():
+        _cache().set(_state_key(user_id, version), state)
+
+
+async def astore_list_state(user_id, version, state):
+    if _cacheable():
+        await _cache().aset(_state_key(user_id, version), state)
+
+
+def cached_todo_list(request, variant, build_context, template_name='todo_list.html'):
+    """
+    Return `(html, context)` for the rendered todo list fragment of the current user.
+
+    `variant` identifies the page being rendered (filter mode, cursor, ...) and
+    `build_context` loads the rows on a miss. On a hit no rows are loaded and
+    `context` holds only what was cached alongside the html.
+    """
+    version = list_version(request.user.id)
+    cached = get_cached_list(request, version, variant)
+    if cached is not None:
+        return cached
+    context = build_context()
+    return store_list(request, version, variant, context, template_name), context
@@ -0,0 +1,110 @@
+"""
+The per-user change log behind the sync API. Every write to a user's todos
+appends one TodoChange per todo it touched, inside the write's transaction,
+numbered from TodoStats.change_seq. Taking the numbers is an UPDATE of the
+user's counters row, which stays locked until commit, so entries become
+visible in sequence order and a client that has seen up to `seq` misses
+nothing by asking for what came after it.
+
+Entries older than a retention period are dropped by
+`manage.py compact_todo_changes`. Clients asking for changes from before the
+last dropped entry, or from before a reset (imports, shard moves), are told
+to download their whole list again.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .counters import get_counts, recount
+from .models import TodoChange, TodoStats
+
+# The most log entries one sync response covers.
+SYNC_PAGE_SIZE = 500
+
+
+def _take_seqs(user_id, count):
+    """Reserve `count` sequence numbers for the user and return the last one."""
+    stats = TodoStats.objects.for_shard_of(user_id).filter(user_id=user_id)
+    if not stats.update(change_seq=F('change_seq') + count):
+        recount([user_id])
+        stats.update(change_seq=F('change_seq') + count)
+    return stats.values_list('change_seq', flat=True).get()
+
+
+def record_changes(user_id, changed=(), deleted=()):
+    """
+    Log the ids of todos created or edited (`changed`) and of todos deleted
+    for the user. Call inside the write's transaction, after the counters
+    were adjusted.
+    """
+    entries = [(int(todo_id), False) for todo_id in changed] + [(int(todo_id), True) for todo_id in deleted]
+    if not entries:
+        return
+    first = _take_seqs(user_id, len(entries)) - len(entries) + 1
+    TodoChange.objects.for_shard_of(user_id).bulk_create([
+        TodoChange(user_id=user_id, seq=first + i, todo_id=todo_id, deleted=is_deleted)
+        for i, (todo_id, is_deleted) in enumerate(entries)
+    ])
+
+
+def reset_changes(user_id):
+    """
+    Make every client of the user download the whole list again, for writes
+    too large to log entry by entry.
+    """
+    # trimmed_seq comes first: MySQL evaluates SET assignments left to right.
+    TodoStats.objects.for_shard_of(user_id).filter(user_id=user_id).update(
+        trimmed_seq=F('change_seq') + 1, change_seq=F('change_seq') + 1,
+    )
+
+
+def changes_since(user_id, since, limit=SYNC_PAGE_SIZE):
+    """
+    The user's changes after sequence number `since`, as a dict of:
+
+    - `seq`: where the next call should continue from;
+    - `reset`: True when the log cannot tell what changed since `since`, so
+      the client must download the whole list (and then sync from `seq`);
+    - `changed` / `deleted`: ids of the todos to reload or drop. A todo
+      changed several times is listed once, by its latest entry;
+    - `more`: whether entries past `seq` were left for the next call.
+    """
+    stats = get_counts(user_id)
+    if not stats.trimmed_seq <= since <= stats.change_seq:
+        return {'seq': stats.change_seq, 'reset': True, 'changed': [], 'deleted': [], 'more': False}
+
+    entries = list(
+        TodoChange.objects.for_shard_of(user_id).filter(user_id=user_id, seq__gt=since)
+        .order_by('seq').values_list('seq', 'todo_id', 'deleted')[:limit + 1]
+    )
+    more = len(entries) > limit
+    entries = entries[:limit]
+    latest = {todo_id: deleted for _, todo_id, deleted in entries}
+    return {
+        'seq': entries[-1][0] if entries else since,
+        'reset': False,
+        'changed': [todo_id for todo_id, deleted in latest.items() if not deleted],
+        'deleted': [todo_id for todo_id, deleted in latest.items() if deleted],
+        'more': more,
+    }
+
+
+def compact_batch(before, batch_size=1000, using='default'):
+    """
+    Drop up to `batch_size` log entries on the `using` shard created before
+    `before`, oldest first, and return how many were dropped. Each user's
+    trimmed_seq is raised past their dropped entries first.
+    """
+    with transaction.atomic(using=using):
+        entries = list(
+            TodoChange.objects.using(using).filter(created_at__lt=before)
+            .order_by('created_at', 'id').values_list('id', 'user_id', 'seq')[:batch_size]
+        )
+        if not entries:
+            return 0
+        trimmed = {}
+        for _, user_id, seq in entries:
+            trimmed[user_id] = max(seq, trimmed.get(user_id, 0))
+        for user_id, seq in trimmed.items():
+            TodoStats.objects.using(using).filter(user_id=user_id, trimmed_seq__lt=seq).update(trimmed_seq=seq)
+        TodoChange.objects.using(using).filter(id__in=[entry_id for entry_id, _, _ in entries]).delete()
+    return len(entries)
@@ -0,0 +1,66 @@
+"""
+System checks for settings that only hold up with a single process. They run
+with `manage.py check --deploy`, against the settings of a deployment.
+"""
+from django.conf import settings
+from django.core import checks
+
+from .db.sharding import is_sharded, shard_options
+
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+def _process_local(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_user_cache(app_configs, **kwargs):
+    """
+    Cached users are dropped by signal handlers in the process that saved the
+    user; with a per-process cache, other workers keep serving the old record
+    (a changed password or a deactivated account) until it expires.
+    """
+    alias = settings.TODO_USER_CACHE
+    if settings.DEBUG or not alias or not _process_local(alias):
+        return []
+    return [checks.Error(
+        f'TODO_USER_CACHE uses the process-local cache {alias!r}.',
+        hint='Point it at a cache shared by all workers (Redis, Memcached, database) or set it to None.',
+        id='tasks.E001',
+    )]
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_fragment_cache(app_configs, **kwargs):
+    """
+    Writes bump the list version in the cache of the process that handled
+    them; with a per-process cache, other workers keep serving their cached
+    fragments and answer conditional GETs of the todo page with a 304 for a
+    list that has changed.
+    """
+    alias = settings.TODO_FRAGMENT_CACHE
+    if settings.DEBUG or not _process_local(alias):
+        return []
+    return [checks.Error(
+        f'TODO_FRAGMENT_CACHE uses the process-local cache {alias!r}.',
+        hint='Point it at a cache shared by all workers (Redis, Memcached, database).',
+        id='tasks.E002',
+    )]
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shard_cache(app_configs, **kwargs):
+    """
+    Each user's shard is cached without expiry and `move_user_shard` updates
+    it in its own process only; with a per-process cache, other workers keep
+    writing to the old shard, and the move then deletes those rows.
+    """
+    alias = shard_options()['CACHE']
+    if settings.DEBUG or not is_sharded() or not _process_local(alias):
+        return []
+    return [checks.Error(
+        f"TODO_SHARDS['CACHE'] uses the process-local cache {alias!r}.",
+        hint='Point it at a cache shared by all workers (Redis, Memcached, database).',
+        id='tasks.E003',
+    )]
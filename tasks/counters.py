@@ -0,0 +1,135 @@
+"""
+Maintenance of the per-user TodoStats counters. New todos are counted by
+Todo.save() and TodoQuerySet.create_many(); every other write to a user's
+todos goes through one of these helpers inside the write's transaction, so
+the counters move together with the rows.
+"""
+from django.db import connections
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .cache import bump_list_version
+from .db.sharding import group_by_shard
+from .models import Todo, TodoStats
+
+
+def adjust_counts(user_id, total=0, completed=0):
+    """Shift the user's counters by the given deltas in one UPDATE."""
+    if total or completed:
+        TodoStats.objects.for_shard_of(user_id).filter(user_id=user_id).update(
+            total=F('total') + total, completed=F('completed') + completed, changed_at=Now(),
+        )
+
+
+def counted_update(queryset, user_id, **fields):
+    """
+    update_todo() the todos in `queryset`, moving them between the open and
+    done counts when `completed` changes. Returns the number of rows updated.
+    """
+    if 'completed' not in fields:
+        return queryset.update_todo(**fields)
+    before = list(queryset.select_for_update().values_list('completed', flat=True))
+    updated = queryset.update_todo(**fields)
+    adjust_counts(user_id, completed=(len(before) if fields['completed'] else 0) - sum(before))
+    return updated
+
+
+def counted_toggle(queryset, user_id):
+    """
+    toggle_completed() the todos in `queryset` and adjust the done count.
+    The rows stay locked by the UPDATE until commit, so reading back how many
+    are done now is race free.
+    """
+    toggled = queryset.toggle_completed()
+    if toggled:
+        now_done = queryset.filter(completed=True).count()
+        adjust_counts(user_id, completed=now_done - (toggled - now_done))
+    return toggled
+
+
+def counted_delete(queryset, user_id):
+    """Delete the todos in `queryset` and take them off the counts. Returns the number deleted."""
+    completed = list(queryset.select_for_update().values_list('completed', flat=True))
+    if completed:
+        queryset.delete()
+        adjust_counts(user_id, total=-len(completed), completed=-sum(completed))
+    return len(completed)
+
+
+def _upsert(stats, using):
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target.
+    unique_fields = ['user'] if connections[using].features.supports_update_conflicts_with_target else None
+    TodoStats.objects.using(using).bulk_create(
+        stats, update_conflicts=True, unique_fields=unique_fields, update_fields=['total', 'completed', 'changed_at'],
+    )
+
+
+def recount(user_ids, using=None):
+    """
+    Recompute the counters of `user_ids` from the todo table with one
+    aggregate query and one upsert per shard, or only on `using` when given.
+    Returns the ids whose stored counts were wrong or missing.
+    """
+    wrong = []
+    for alias, ids in ({using: user_ids} if using else group_by_shard(user_ids)).items():
+        counts = {
+            row['user_id']: (row['total'], row['completed'])
+            for row in Todo.objects.using(alias).filter(user_id__in=ids).values('user_id').annotate(
+                total=Count('id'), completed=Count('id', filter=Q(completed=True)),
+            ).order_by()
+        }
+        stored = {stats.user_id: (stats.total, stats.completed) for stats in TodoStats.objects.using(alias).filter(user_id__in=ids)}
+        shard_wrong = [user_id for user_id in ids if stored.get(user_id) != counts.get(user_id, (0, 0))]
+        if shard_wrong:
+            now = timezone.now()
+            _upsert([
+                TodoStats(user_id=user_id, total=total, completed=completed, changed_at=now)
+                for user_id in shard_wrong
+                for total, completed in [counts.get(user_id, (0, 0))]
+            ], alias)
+        wrong.extend(shard_wrong)
+    return wrong
+
+
+def get_counts(user_id):
+    """
+    The user's TodoStats row: one primary key lookup. Users without a row yet
+    (e.g. created before the counters existed) get one computed on the spot.
+    """
+    stats = TodoStats.objects.for_shard_of(user_id).filter(user_id=user_id).first()
+    if stats is None:
+        recount([user_id])
+        stats = TodoStats.objects.for_shard_of(user_id).get(user_id=user_id)
+    return stats
+
+
+def list_state(user_id):
+    """
+    `(total, completed, last_modified)` for the user's todo list, in one
+    query: their TodoStats row plus a MAX(updated_at) of their todos read
+    off the (user, updated_at) index. `last_modified` is the later of that
+    and the counters' changed_at, so deletes move it too; None for a user
+    who never had a todo.
+    """
+    newest = Todo.objects.filter(user_id=OuterRef('user_id')).order_by('-updated_at').values('updated_at')[:1]
+    row = (
+        TodoStats.objects.for_shard_of(user_id).filter(user_id=user_id)
+        .annotate(last_updated=Subquery(newest))
+        .values_list('total', 'completed', 'changed_at', 'last_updated')
+        .first()
+    )
+    if row is None:
+        recount([user_id])
+        return list_state(user_id)
+    total, completed, *times = row
+    times = [value for value in times if value is not None]
+    return total, completed, max(times) if times else None
+
+
+def repair_counts(user_ids):
+    """recount() and drop the cached todo lists of users whose counts changed."""
+    wrong = recount(user_ids)
+    for user_id in wrong:
+        bump_list_version(user_id)
+    return wrong
@@ -0,0 +1,32 @@
+from ..pool import get_pool
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Check raw connections out of a process-wide ConnectionPool instead of
+    opening one per request, and return them to it where Django would close
+    them. Configured with the 'POOL' key of the DATABASES entry.
+
+    Keep CONN_MAX_AGE at 0 so the connection goes back to the pool at the end
+    of every request.
+    """
+
+    @property
+    def pool(self):
+        conn_params = self.get_connection_params()
+        open_connection = super().get_new_connection
+        # Keyed by NAME as well, so the test database gets its own pool.
+        return get_pool(
+            (self.alias, str(self.settings_dict['NAME'])),
+            lambda: open_connection(conn_params),
+            self.settings_dict.get('POOL', {}),
+        )
+
+    def get_new_connection(self, conn_params):
+        self._checked_out_from = self.pool
+        return self._checked_out_from.checkout()
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._checked_out_from.checkin(self.connection)
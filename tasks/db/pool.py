@@ -0,0 +1,192 @@
+"""
+A small thread-safe pool of raw DB-API connections, used by the pooled
+database backends in tasks.db.backends.
+"""
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    """No connection became free within the pool's timeout."""
+
+
+class ConnectionPool:
+    """
+    Hands out raw connections created by `connect`, at most `max_size` at a
+    time. Idle connections older than `max_idle` seconds are closed, keeping at
+    least `min_size` around, and with `pre_ping` every reused connection is
+    checked with `SELECT 1` before it is handed out.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, max_idle=300, timeout=10, pre_ping=True):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at), most recently returned last
+        self._size = 0
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'closed': 0,
+            'evicted': 0,
+            'failed_pings': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'connect_time_ms': 0.0,
+        }
+
+    def checkout(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            expired = []
+            with self._cond:
+                while True:
+                    expired.extend(self._evict_idle())
+                    if self._idle:
+                        conn, _ = self._idle.pop()
+                        fresh = False
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        conn, fresh = None, True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f'No database connection available within {self.timeout}s.')
+                    waited = True
+                    self._cond.wait(remaining)
+                self._in_use += 1
+            for stale in expired:
+                self._close(stale)
+
+            if fresh:
+                try:
+                    connect_start = time.monotonic()
+                    conn = self.connect()
+                except Exception:
+                    self._discard_slot()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                    self._stats['connect_time_ms'] += (time.monotonic() - connect_start) * 1000
+            elif self.pre_ping and not self._ping(conn):
+                with self._cond:
+                    self._stats['failed_pings'] += 1
+                self._close(conn)
+                self._discard_slot()
+                continue
+
+            with self._cond:
+                wait_ms = (time.monotonic() - start) * 1000
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_ms'] += wait_ms
+                    self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+            return conn
+
+    def checkin(self, conn, discard=False):
+        if not discard:
+            try:
+                # Never hand the next user a half-finished transaction.
+                conn.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self._close(conn)
+            self._discard_slot()
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                **{name: round(value, 3) if isinstance(value, float) else value for name, value in self._stats.items()},
+            }
+
+    def _evict_idle(self):
+        # Called with the lock held; the returned connections are closed outside it.
+        cutoff = time.monotonic() - self.max_idle
+        expired = []
+        while self._idle and self._size > self.min_size and self._idle[0][1] < cutoff:
+            expired.append(self._idle.pop(0)[0])
+            self._size -= 1
+            self._stats['evicted'] += 1
+        return expired
+
+    def _discard_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._cond.notify()
+
+    def _ping(self, conn):
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['closed'] += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, options):
+    """Return the process-wide pool for `key`, creating it from the POOL `options` on first use."""
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                connect,
+                min_size=options.get('MIN_SIZE', 0),
+                max_size=options.get('MAX_SIZE', 10),
+                max_idle=options.get('MAX_IDLE', 300),
+                timeout=options.get('TIMEOUT', 10),
+                pre_ping=options.get('PRE_PING', True),
+            )
+        return _pools[key]
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {f'{alias}:{name}': pool.stats() for (alias, name), pool in pools.items()}
@@ -0,0 +1,91 @@
+"""
+Database routers. ShardRouter keeps the per-user todo tables on their
+user's shard (see tasks.db.sharding).
+
+ReplicaRouter sends reads of the models listed in TODO_REPLICAS['MODELS'] to
+one of the replica aliases, but only while ReplicaReadMiddleware allows it:
+inside a read-only request from a client that has not written recently.
+Everything else (writes, requests that write, management commands, and
+requests within TODO_REPLICAS['PIN_SECONDS'] of the client's last write)
+uses the primary, so a user always reads their own writes.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .sharding import SHARDED_MODELS, is_sharded, shard_for
+
+REPLICA_DEFAULTS = {
+    'ALIASES': [],
+    'MODELS': ['tasks.todo', 'auth.user'],
+    'PIN_SECONDS': 5,
+}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_options():
+    return {**REPLICA_DEFAULTS, **getattr(settings, 'TODO_REPLICAS', {})}
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """Allow (or forbid) routed reads to go to a replica within the block."""
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reading_from_replicas():
+    return _replica_reads.get() and bool(replica_options()['ALIASES'])
+
+
+class ShardRouter:
+    """
+    Routes sharded models when an instance hint tells whose rows they are:
+    saving a new todo, or following a relation from a todo or a user.
+    Querysets carry their shard explicitly (ShardedQuerySet.for_shard_of).
+    """
+
+    def _shard(self, model, instance=None, **hints):
+        if instance is None or model._meta.label_lower not in SHARDED_MODELS or not is_sharded():
+            return None
+        if instance._meta.label_lower in SHARDED_MODELS:
+            return instance._state.db or shard_for(instance.user_id)
+        if isinstance(instance, get_user_model()):
+            return shard_for(instance.pk)
+        return None
+
+    db_for_read = _shard
+    db_for_write = _shard
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Sharded rows point at users on `default`.
+        if is_sharded() and SHARDED_MODELS & {obj1._meta.label_lower, obj2._meta.label_lower}:
+            return True
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+        options = replica_options()
+        if not options['ALIASES'] or model._meta.label_lower not in options['MODELS']:
+            return None
+        return random.choice(options['ALIASES'])
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows.
+        databases = {'default', *replica_options()['ALIASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
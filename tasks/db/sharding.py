@@ -0,0 +1,120 @@
+"""
+Sharding of the per-user todo tables by user id. Each user's todos, search
+terms, counters, change log and archive live together on one of the
+database aliases in TODO_SHARDS['ALIASES']; users and sessions stay on
+`default`.
+
+A user's shard is recorded in UserShard (on `default`) the first time it is
+needed, picked by a stable hash of the user id, so adding a shard later only
+affects new users; `manage.py move_user_shard` moves existing ones. With a
+single alias (the default) nothing is looked up and no query is changed.
+"""
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+
+SHARD_DEFAULTS = {
+    'ALIASES': ['default'],
+    'CACHE': 'default',
+}
+
+# Models whose rows are spread over the shards, all keyed by their `user`.
+SHARDED_MODELS = {'tasks.todo', 'tasks.todoterm', 'tasks.todostats', 'tasks.archivedtodo', 'tasks.todochange'}
+
+
+def shard_options():
+    return {**SHARD_DEFAULTS, **getattr(settings, 'TODO_SHARDS', {})}
+
+
+def shard_aliases():
+    return list(shard_options()['ALIASES'])
+
+
+def is_sharded():
+    return len(shard_options()['ALIASES']) > 1
+
+
+def hashed_shard(user_id, aliases):
+    digest = hashlib.sha1(str(user_id).encode()).digest()
+    return aliases[int.from_bytes(digest[:8], 'big') % len(aliases)]
+
+
+def _cache_key(user_id):
+    return f'todo-shard:{user_id}'
+
+
+def shard_for(user_id):
+    """The database alias holding the user's todos."""
+    options = shard_options()
+    aliases = options['ALIASES']
+    if len(aliases) == 1:
+        return aliases[0]
+    cache = caches[options['CACHE']]
+    alias = cache.get(_cache_key(user_id))
+    if alias is None:
+        from tasks.models import UserShard
+
+        alias = UserShard.objects.get_or_create(user_id=user_id, defaults={'alias': hashed_shard(user_id, aliases)})[0].alias
+        cache.set(_cache_key(user_id), alias, timeout=None)
+    return alias
+
+
+def recorded_shard(user_id):
+    """The user's shard if one was recorded, without recording one like shard_for() does."""
+    options = shard_options()
+    if len(options['ALIASES']) == 1:
+        return options['ALIASES'][0]
+    alias = caches[options['CACHE']].get(_cache_key(user_id))
+    if alias is None:
+        from tasks.models import UserShard
+
+        alias = UserShard.objects.filter(user_id=user_id).values_list('alias', flat=True).first()
+    return alias
+
+
+def set_shard(user_id, alias):
+    """Point the user at `alias`. Their rows must already be there."""
+    from tasks.models import UserShard
+
+    UserShard.objects.update_or_create(user_id=user_id, defaults={'alias': alias})
+    caches[shard_options()['CACHE']].set(_cache_key(user_id), alias, timeout=None)
+
+
+def group_by_shard(user_ids):
+    """Map each shard alias to the ids of `user_ids` that live on it."""
+    groups = defaultdict(list)
+    for user_id in user_ids:
+        groups[shard_for(user_id)].append(user_id)
+    return dict(groups)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet of a sharded model. Querysets are not routed on their own: scope
+    them with for_shard_of() (or .using()). create() and bulk_create() route
+    by the rows' user.
+    """
+
+    def for_shard_of(self, user_id):
+        if self._db is not None or not is_sharded():
+            return self
+        return self.using(shard_for(user_id))
+
+    def create(self, **kwargs):
+        if self._db is None and is_sharded():
+            user_id = kwargs['user'].pk if 'user' in kwargs else kwargs['user_id']
+            return self.for_shard_of(user_id).create(**kwargs)
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._db is None and is_sharded():
+            objs = list(objs)
+            shards = {shard_for(obj.user_id) for obj in objs}
+            if len(shards) > 1:
+                raise ValueError('bulk_create() cannot insert rows of users on different shards.')
+            if shards:
+                return self.using(shards.pop()).bulk_create(objs, *args, **kwargs)
+        return super().bulk_create(objs, *args, **kwargs)
@@ -0,0 +1,146 @@
+"""
+Per-user todo change events, pushed to open pages over Server-Sent Events.
+
+Write views publish an event after their transaction commits; the events
+view (served under ASGI) streams the events of the signed-in user. The
+broker is pluggable through TODO_EVENTS['BROKER']. The default,
+InProcessBroker, only reaches subscribers in the same process, so run a
+single ASGI process or plug in a broker backed by a shared pub/sub.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .db.sharding import shard_for
+
+EVENTS_DEFAULTS = {
+    'BROKER': 'tasks.events.InProcessBroker',
+    'HEARTBEAT': 15,
+    'MAX_QUEUE': 100,
+}
+
+
+def events_options():
+    return {**EVENTS_DEFAULTS, **getattr(settings, 'TODO_EVENTS', {})}
+
+
+class Subscription:
+    """One open event stream: a bounded queue fed from any thread."""
+
+    def __init__(self, broker, user_id, max_queue):
+        self.broker = broker
+        self.user_id = user_id
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=max_queue)
+
+    def deliver(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # The loop is gone; the stream was never closed cleanly.
+            self.close()
+
+    def _put(self, event):
+        if self._queue.full():
+            # A client this far behind cannot catch up on deltas; tell it to reload.
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            event = {'id': event['id'], 'type': 'reset'}
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """The next event, or None if none arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._ids = itertools.count(1)
+        self._published = 0
+
+    def subscribe(self, user_id):
+        """Subscribe to the user's events. Must be called from the event loop that will read them."""
+        subscription = Subscription(self, user_id, self.max_queue)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+            event = {'id': next(self._ids), **event}
+            self._published += 1
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._subscriptions),
+                'subscriptions': sum(len(subscriptions) for subscriptions in self._subscriptions.values()),
+                'published': self._published,
+            }
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            options = events_options()
+            _broker = import_string(options['BROKER'])(max_queue=options['MAX_QUEUE'])
+        return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'TODO_EVENTS':
+        with _broker_lock:
+            _broker = None
+
+
+def todo_payload(todo):
+    return {'id': todo.id, 'title': todo.title, 'description': todo.description, 'completed': todo.completed}
+
+
+def publish_event(user_id, event_type, **payload):
+    """
+    Publish a change to the user's todos once the current transaction on their
+    shard commits: 'created' / 'edited' with `todos`, 'toggled' / 'deleted'
+    with `ids`, 'moved' with `ids` and the `after` id, or 'reset' when the
+    client should reload the list.
+    """
+    event = {'type': event_type, **payload}
+    transaction.on_commit(lambda: get_broker().publish(user_id, event), using=shard_for(user_id))
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: todo\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,54 @@
+"""
+Streaming export of a user's todos as CSV or NDJSON, optionally gzipped on
+the fly. Rows are read in fixed-size keyset chunks and written out chunk by
+chunk, so memory use does not depend on how many todos the user has.
+"""
+import csv
+import io
+import json
+import zlib
+
+from .models import Todo
+
+EXPORT_FIELDS = ('id', 'title', 'description', 'completed')
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _chunks(user, chunk_size):
+    return Todo.objects.owned_by(user).values_in_chunks(*EXPORT_FIELDS[1:], chunk_size=chunk_size)
+
+
+def csv_lines(user, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in _chunks(user, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_lines(user, chunk_size=EXPORT_CHUNK_SIZE):
+    for chunk in _chunks(user, chunk_size):
+        yield ''.join(json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n' for row in chunk)
+
+
+def gzip_stream(pieces):
+    """Gzip a stream of text pieces incrementally, one compressed piece per input piece."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for piece in pieces:
+        data = compressor.compress(piece.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(user, export_format, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    lines = (csv_lines if export_format == 'csv' else ndjson_lines)(user, chunk_size)
+    return gzip_stream(lines) if compress else (piece.encode() for piece in lines)
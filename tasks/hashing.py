@@ -0,0 +1,148 @@
+"""
+A bounded pool that runs password hashing (PBKDF2 by default) off the request
+worker. Once WORKERS + MAX_QUEUE hashes are in flight new ones are rejected
+with PoolSaturated, which the views turn into a 429, so a burst of logins
+cannot tie up every worker that cheap todo requests need.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .stats import percentile
+
+
+class PoolSaturated(Exception):
+    """The hashing pool has no free slot, or the hash did not finish in time."""
+
+
+class HashingPool:
+    def __init__(self, kind='thread', workers=4, max_queue=16, timeout=10):
+        executor_class = ProcessPoolExecutor if kind == 'process' else ThreadPoolExecutor
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = executor_class(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._latencies = deque(maxlen=1000)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturated('Password hashing pool is full.')
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+
+        def done(future):
+            self._slots.release()
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._latencies.append(time.perf_counter() - start)
+
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(done)
+        return future
+
+    def run(self, fn, *args):
+        try:
+            return self.submit(fn, *args).result(self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise PoolSaturated('Password hashing timed out.')
+
+    async def arun(self, fn, *args):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self.submit(fn, *args)), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise PoolSaturated('Password hashing timed out.')
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'kind': self.kind,
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'queue_depth': max(0, self._in_flight - self.workers),
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            options = settings.TODO_HASHING_POOL
+            _pool = HashingPool(
+                kind=options.get('KIND', 'thread'),
+                workers=options.get('WORKERS', 4),
+                max_queue=options.get('MAX_QUEUE', 16),
+                timeout=options.get('TIMEOUT', 10),
+            )
+        return _pool
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    global _pool
+    if setting == 'TODO_HASHING_POOL':
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = None
+
+
+def make_password(password):
+    return get_pool().run(hashers.make_password, password)
+
+
+def check_password(password, encoded):
+    return get_pool().run(hashers.check_password, password, encoded)
+
+
+async def amake_password(password):
+    return await get_pool().arun(hashers.make_password, password)
+
+
+async def acheck_password(password, encoded):
+    return await get_pool().arun(hashers.check_password, password, encoded)
+
+
+def must_update(encoded):
+    """Whether a stored hash should be upgraded to the preferred hasher settings."""
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
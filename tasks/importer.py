@@ -0,0 +1,148 @@
+"""
+Bulk import of todos from CSV or NDJSON, the formats written by
+tasks.export. The file is parsed row by row and handled in batches: each
+batch is validated through TodoSerializer and inserted with bulk INSERTs in
+its own transaction. Invalid rows are reported and skipped; they never
+abort the rest of the file.
+"""
+import csv
+import gzip
+import io
+import itertools
+import json
+import time
+
+from django.db import transaction
+
+from .changes import reset_changes
+from .db.sharding import shard_for
+from .models import Todo
+from .search import index_new_todos
+from .serializers import TodoSerializer, list_errors
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_FIELDS = ('title', 'description', 'completed')
+IMPORT_BATCH_SIZE = 500
+# Only the first errors are kept in the result; the rest are only counted.
+MAX_REPORTED_ERRORS = 100
+
+
+def guess_format(filename):
+    """The import format for `filename` (optionally ending in .gz), or None."""
+    name = filename.lower().removesuffix('.gz')
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+
+def open_upload(fileobj, filename):
+    """A text stream over a binary upload, transparently gunzipping .gz files."""
+    if filename.lower().endswith('.gz'):
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def parse_rows(stream, import_format):
+    """
+    Yield one dict of the importable fields per record of `stream`, or a
+    ValueError for a record that cannot be parsed. Other columns, such as the
+    id written by the export, are ignored.
+    """
+    if import_format == 'csv':
+        for record in csv.DictReader(stream):
+            # An empty cell is a missing value, like a null in NDJSON.
+            yield {field: record[field] for field in IMPORT_FIELDS if record.get(field) not in (None, '')}
+        return
+
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield ValueError('Invalid JSON.')
+            continue
+        if not isinstance(record, dict):
+            yield ValueError('Expected a JSON object.')
+            continue
+        yield {field: record[field] for field in IMPORT_FIELDS if record.get(field) is not None}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.aborted = None
+        self.elapsed = 0.0
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'aborted': self.aborted,
+            'elapsed_sec': round(self.elapsed, 3),
+            'rows_per_sec': round((self.created + self.failed) / self.elapsed, 1) if self.elapsed else 0.0,
+        }
+
+
+def _import_batch(user, batch, result, batch_size):
+    rows = [(number, row) for number, row in batch if not isinstance(row, ValueError)]
+    for number, row in batch:
+        if isinstance(row, ValueError):
+            result.add_error(number, {'non_field_errors': [str(row)]})
+
+    serializer = TodoSerializer(data=[row for _, row in rows], many=True)
+    if not serializer.is_valid():
+        valid = []
+        for (number, row), errors in zip(rows, list_errors(serializer)):
+            if errors:
+                result.add_error(number, errors)
+            else:
+                valid.append(row)
+        # A ListSerializer drops all validated data once any item fails, so
+        # validate the remaining rows again.
+        serializer = TodoSerializer(data=valid, many=True)
+        serializer.is_valid(raise_exception=True)
+
+    if serializer.validated_data:
+        with transaction.atomic(using=shard_for(user.id)):
+            todos = Todo.objects.create_many(user, serializer.validated_data, batch_size=batch_size)
+            index_new_todos(todos)
+            # Sync clients reload the whole list rather than walk one log
+            # entry per imported row.
+            reset_changes(user.id)
+        result.created += len(serializer.validated_data)
+
+
+def import_todos(user, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create todos for `user` from the dicts yielded by `rows` (see parse_rows).
+    Rows are numbered from 1 in the result's errors. The caller must bump the
+    user's list version afterwards.
+    """
+    result = ImportResult()
+    start = time.perf_counter()
+    numbered = enumerate(rows, start=1)
+    while True:
+        batch = []
+        try:
+            batch.extend(itertools.islice(numbered, batch_size))
+        except (csv.Error, ValueError, OSError, EOFError) as e:
+            # An unreadable file (bad encoding, broken gzip, malformed CSV):
+            # keep the rows read so far and stop.
+            result.aborted = f'Could not read the file after row {result.created + result.failed + len(batch)}: {e}'
+        if batch:
+            _import_batch(user, batch, result, batch_size)
+        if result.aborted or len(batch) < batch_size:
+            break
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tasks.archive import archive_batch
+from tasks.db.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Move todos completed more than --days days ago into the archive table, in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Archive todos completed at least this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        completed_before = timezone.now() - timedelta(days=options['days'])
+        archived, batches = 0, 0
+        for alias in shard_aliases():
+            while options['max_batches'] is None or batches < options['max_batches']:
+                moved = archive_batch(completed_before, options['batch_size'], using=alias)
+                if not moved:
+                    break
+                archived += moved
+                batches += 1
+                if options['pause']:
+                    time.sleep(options['pause'])
+        self.stdout.write(f'Archived {archived} todos in {batches} batches.')
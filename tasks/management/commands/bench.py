@@ -0,0 +1,115 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from tasks import bench
+
+
+class Command(BaseCommand):
+    help = 'Run in-process benchmarks against the tasks views and print the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Also write the JSON results to this file.')
+        scenarios = parser.add_subparsers(dest='scenario', required=True)
+
+        asgi = scenarios.add_parser('asgi', help='Sync views under WSGI versus async views under ASGI.')
+        asgi.add_argument('--todos', type=int, default=1000, help='Todos seeded for the bench user.')
+        asgi.add_argument('--requests', type=int, default=500)
+        asgi.add_argument('--concurrency', type=int, default=8)
+        asgi.add_argument('--write-ratio', type=float, default=0.1, help='Share of requests that toggle a todo.')
+
+        signup = scenarios.add_parser('signup', help='Latency and query count of the signup view.')
+        signup.add_argument('--signups', type=int, default=50)
+
+        session = scenarios.add_parser('session', help='Queries per todo_page view with and without session/user caching.')
+        session.add_argument('--todos', type=int, default=100)
+        session.add_argument('--requests', type=int, default=200)
+
+        load = scenarios.add_parser('load', help='A mix of the todo views from concurrent clients, broken down per view.')
+        load.add_argument('--users', type=int, default=10, help='Bench users to seed.')
+        load.add_argument('--todos', type=int, default=200, help='Todos seeded per user.')
+        load.add_argument('--requests', type=int, default=1000)
+        load.add_argument('--concurrency', type=int, default=8)
+        load.add_argument('--mix', default=bench.DEFAULT_LOAD_MIX, help=f'Weights per view, e.g. "{bench.DEFAULT_LOAD_MIX}".')
+        load.add_argument('--seed', type=int, default=0, help='Seed for drawing the request mix.')
+        load.add_argument('--trace-memory', action='store_true', help='Also report the tracemalloc peak (slows every request down).')
+
+        connections = scenarios.add_parser('connections', help='Connection setup time with and without the pool.')
+        connections.add_argument('--connections', type=int, default=100)
+        connections.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                results = getattr(self, f"bench_{options['scenario'].replace('-', '_')}")(options)
+        finally:
+            bench.cleanup()
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        self.stdout.write(output)
+
+    def bench_asgi(self, options):
+        [user] = bench.seed_users(1, options['todos'])
+        workload = bench.todo_workload(user, options['requests'], options['write_ratio'])
+        with override_settings(ROOT_URLCONF=bench.bench_urlconf(use_async_views=False)):
+            wsgi = bench.run_wsgi(user, workload, options['concurrency'])
+        with override_settings(ROOT_URLCONF=bench.bench_urlconf(use_async_views=True)):
+            asgi = bench.run_asgi(user, workload, options['concurrency'])
+        return {
+            'scenario': 'asgi',
+            'todos': options['todos'],
+            'concurrency': options['concurrency'],
+            'write_ratio': options['write_ratio'],
+            'wsgi_sync_views': wsgi,
+            'asgi_async_views': asgi,
+        }
+
+    def bench_signup(self, options):
+        return {
+            'scenario': 'signup',
+            **bench.run_signups(options['signups']),
+        }
+
+    def bench_session(self, options):
+        [user] = bench.seed_users(1, options['todos'])
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db', TODO_USER_CACHE=None):
+            uncached = bench.run_page_views(user, options['requests'])
+        cached = bench.run_page_views(user, options['requests'])
+        return {
+            'scenario': 'session',
+            'session_engine': settings.SESSION_ENGINE,
+            'db_session_uncached_user': uncached,
+            'configured': cached,
+            'queries_saved_per_request': round(uncached['queries_per_request'] - cached['queries_per_request'], 2),
+        }
+
+    def bench_load(self, options):
+        try:
+            mix = bench.parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(e)
+        if options['users'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--users and --concurrency must be at least 1.')
+        users = bench.seed_users(options['users'], options['todos'])
+        workload = bench.load_workload(mix, options['requests'], options['seed'])
+        return {
+            'scenario': 'load',
+            'users': options['users'],
+            'todos_per_user': options['todos'],
+            'concurrency': options['concurrency'],
+            'mix': mix,
+            'seed': options['seed'],
+            **bench.run_load(users, workload, options['concurrency'], options['trace_memory']),
+        }
+
+    def bench_connections(self, options):
+        return {
+            'scenario': 'connections',
+            'database': options['database'],
+            **bench.run_connection_setup(options['connections'], options['database']),
+        }
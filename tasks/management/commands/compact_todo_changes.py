@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tasks.changes import compact_batch
+from tasks.db.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        'Drop change log entries older than --days days, in small batches. Sync clients '
+        'that last synced before them download their whole list again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Drop entries at least this many days old.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        dropped, batches = 0, 0
+        for alias in shard_aliases():
+            while True:
+                count = compact_batch(before, options['batch_size'], using=alias)
+                if not count:
+                    break
+                dropped += count
+                batches += 1
+                if options['pause']:
+                    time.sleep(options['pause'])
+        self.stdout.write(f'Dropped {dropped} change log entries in {batches} batches.')
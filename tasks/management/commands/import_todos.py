@@ -0,0 +1,41 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.cache import bump_list_version
+from tasks.importer import IMPORT_BATCH_SIZE, IMPORT_FORMATS, guess_format, import_todos, open_upload, parse_rows
+
+
+class Command(BaseCommand):
+    help = "Import todos for a user from a CSV or NDJSON file (optionally .gz), e.g. one written by the export."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+        import_format = options['format'] or guess_format(options['path'])
+        if import_format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+
+        with open(options['path'], 'rb') as fh:
+            result = import_todos(user, parse_rows(open_upload(fh, options['path']), import_format), options['batch_size'])
+        if result.created:
+            bump_list_version(user.id)
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        if result.aborted:
+            self.stderr.write(result.aborted)
+        summary = result.as_dict()
+        self.stdout.write(
+            f"Imported {summary['created']} todos, {summary['failed']} rows failed "
+            f"({summary['rows_per_sec']} rows/s)."
+        )
@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.db.sharding import shard_for
+from tasks.rebalance import move_user
+
+
+class Command(BaseCommand):
+    help = "Move a user's todos to another shard (an alias in TODO_SHARDS['ALIASES']), in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('shard')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+        source = shard_for(user.id)
+        try:
+            todos, archived = move_user(user, options['shard'], options['batch_size'], options['pause'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if source == options['shard']:
+            self.stdout.write(f"{user.username} is already on {source}.")
+        else:
+            self.stdout.write(f"Moved {todos} todos and {archived} archived todos of {user.username} from {source} to {options['shard']}.")
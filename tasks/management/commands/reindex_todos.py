@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tasks.db.sharding import shard_aliases
+from tasks.models import Todo, TodoTerm
+from tasks.search import index_new_todos
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the todo search index from scratch, e.g. after the TodoTerm table was added.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        indexed = 0
+        for alias in shard_aliases():
+            # One transaction per batch of todo ids, which swaps the batch's
+            # terms for rebuilt ones, so search keeps working meanwhile and no
+            # lock is held for long. Terms of deleted todos go with the range.
+            last_id = 0
+            while True:
+                with transaction.atomic(using=alias):
+                    batch = list(
+                        Todo.objects.using(alias).filter(id__gt=last_id).order_by('id')
+                        .select_for_update().only('id', 'user_id', 'title', 'description')[:batch_size]
+                    )
+                    terms = TodoTerm.objects.using(alias).filter(todo_id__gt=last_id)
+                    if batch:
+                        terms = terms.filter(todo_id__lte=batch[-1].id)
+                    terms.delete()
+                    index_new_todos(batch, batch_size=batch_size, using=alias)
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                indexed += len(batch)
+        self.stdout.write(f'Indexed {indexed} todos.')
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from tasks.counters import repair_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user todo counters from the todo table, in batches of users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        last_id, checked, repaired = 0, 0, 0
+        while True:
+            user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not user_ids:
+                break
+            repaired += len(repair_counts(user_ids))
+            checked += len(user_ids)
+            last_id = user_ids[-1]
+        self.stdout.write(f'Checked {checked} users, repaired {repaired}.')
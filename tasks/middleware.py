@@ -0,0 +1,94 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware as DjangoGZipMiddleware
+
+from . import timing
+from .db.routers import replica_options, replica_reads
+
+# Bodies that are already compressed, where gzipping again only costs CPU,
+# and event streams, whose events must reach the client as they are sent.
+UNCOMPRESSED_CONTENT_TYPES = {'application/gzip', 'application/zip', 'image/png', 'image/jpeg', 'image/webp', 'text/event-stream'}
+
+# Set on responses to requests that wrote, pinning the client's reads to the
+# primary until replicas have caught up with its writes.
+PIN_COOKIE = 'todo_read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+SERVER_TIMING_DEFAULTS = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'REPEATED_QUERY_THRESHOLD': 5,
+    'KEEP_SLOWEST': 20,
+    'KEEP_REPEATED': 100,
+}
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing header with the request's SQL, template and
+    middleware time, logs slow requests and repeated identical queries, and
+    keeps the slowest requests for auth/metrics/. Enabled with
+    TODO_SERVER_TIMING['ENABLED']; list it first in MIDDLEWARE so the total
+    covers every other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.options = {**SERVER_TIMING_DEFAULTS, **getattr(settings, 'TODO_SERVER_TIMING', {})}
+        if not self.options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings, token = timing.start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.record_query))
+                response = self.get_response(request)
+        finally:
+            timing.end_request(token)
+        total = time.perf_counter() - timings.start
+        response['Server-Timing'] = timings.header(total)
+        timing.record_request(request, response, timings, total, self.options)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = timing.current_timings()
+        if timings is not None:
+            timings.view_start = time.perf_counter()
+
+
+class GZipMiddleware(DjangoGZipMiddleware):
+    """Django's GZipMiddleware, skipping compressed bodies and event streams."""
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').split(';')[0].strip() in UNCOMPRESSED_CONTENT_TYPES:
+            return response
+        return super().process_response(request, response)
+
+
+class ReplicaReadMiddleware:
+    """
+    Lets read-only requests read from the replicas in TODO_REPLICAS['ALIASES']
+    (see tasks.db.routers). Any other request runs against the primary and
+    pins the client to it for PIN_SECONDS with a cookie, so the page it is
+    redirected to shows its own change. Unused when no replicas are set.
+    """
+
+    def __init__(self, get_response):
+        self.options = replica_options()
+        if not self.options['ALIASES']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        with replica_reads(safe and PIN_COOKIE not in request.COOKIES):
+            response = self.get_response(request)
+        if not safe:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.options['PIN_SECONDS'], httponly=True, samesite='Lax')
+        return response
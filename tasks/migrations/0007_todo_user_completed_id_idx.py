@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_remove_todo_assigned_to'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'completed', 'id'], name='todo_user_completed_id_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models.functions import Lower, NullIf
+
+
+# auth.User belongs to django.contrib.auth, so the constraint is created through
+# the schema editor rather than declared on the model. Blank emails are mapped
+# to NULL so accounts created without an email (e.g. createsuperuser) don't clash,
+# and emails are compared lowercased, like signup does.
+def email_unique_constraint():
+    return models.UniqueConstraint(Lower(NullIf('email', models.Value(''))), name='auth_user_email_uniq')
+
+
+def duplicate_emails(users, limit=10):
+    """Up to `limit` lowercased emails shared by more than one of `users`."""
+    return list(
+        users.exclude(email='').annotate(email_lower=Lower('email'))
+        .values('email_lower').annotate(count=models.Count('id')).filter(count__gt=1)
+        .order_by('email_lower').values_list('email_lower', flat=True)[:limit]
+    )
+
+
+def add_email_unique_constraint(apps, schema_editor):
+    # Signup relies on this constraint instead of locking, so a database that
+    # cannot index an expression (MySQL before 8.0.13) is refused instead of
+    # being left without it.
+    if not schema_editor.connection.features.supports_expression_indexes:
+        raise CommandError(
+            'This database cannot enforce unique emails, which needs an index on an '
+            'expression (MySQL 8.0.13 or later).'
+        )
+    User = apps.get_model('auth', 'User')
+    duplicates = duplicate_emails(User.objects.using(schema_editor.connection.alias))
+    if duplicates:
+        raise CommandError(
+            'Cannot make emails unique, these are shared by more than one user (ignoring case): '
+            + ', '.join(duplicates) + '. Change them and migrate again.'
+        )
+    schema_editor.add_constraint(User, email_unique_constraint())
+
+
+def remove_email_unique_constraint(apps, schema_editor):
+    schema_editor.remove_constraint(apps.get_model('auth', 'User'), email_unique_constraint())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_todoterm'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_email_unique_constraint, remove_email_unique_constraint),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def backfill_completed_at(apps, schema_editor):
+    # When existing todos were completed is unknown; count from the upgrade.
+    Todo = apps.get_model('tasks', 'Todo')
+    Todo.objects.using(schema_editor.connection.alias).filter(completed=True).update(completed_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0009_auth_user_email_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTodo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('todo_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['completed_at', 'id'], name='todo_completed_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedtodo',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_todos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtodo',
+            index=models.Index(fields=['user', 'id'], name='archivedtodo_user_id_idx'),
+        ),
+    ]
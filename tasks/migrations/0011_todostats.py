@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_todo_stats(apps, schema_editor):
+    # Users without todos get their row on first use.
+    Todo = apps.get_model('tasks', 'Todo')
+    TodoStats = apps.get_model('tasks', 'TodoStats')
+    db_alias = schema_editor.connection.alias
+    counts = Todo.objects.using(db_alias).values('user_id').annotate(
+        total=Count('id'), completed=Count('id', filter=Q(completed=True)),
+    ).order_by()
+    TodoStats.objects.using(db_alias).bulk_create((
+        TodoStats(user_id=row['user_id'], total=row['total'], completed=row['completed'])
+        for row in counts.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tasks', '0010_todo_completed_at_archivedtodo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='todo_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_todo_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:20
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_timestamps(apps, schema_editor):
+    # When existing todos were created or last edited is unknown; completed
+    # ones were at least touched when they were completed.
+    Todo = apps.get_model('tasks', 'Todo')
+    when = Coalesce('completed_at', Now())
+    Todo.objects.using(schema_editor.connection.alias).update(created_at=when, updated_at=when)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0012_todo_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='updated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_timestamps, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='todo',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='todo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'updated_at'], name='todo_user_updated_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='todostats',
+            name='changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
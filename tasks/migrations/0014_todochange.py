@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0013_todo_timestamps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todostats',
+            name='change_seq',
+            field=models.BigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='todostats',
+            name='trimmed_seq',
+            field=models.BigIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='TodoChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('todo_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='todochange_created_at_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'seq'), name='todochange_user_seq_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+from tasks.ordering import keys_after
+
+
+def backfill_positions(apps, schema_editor):
+    # Keep the order todos were created in, each user's list on its own.
+    Todo = apps.get_model('tasks', 'Todo')
+    todos = Todo.objects.using(schema_editor.connection.alias)
+    for user_id in todos.values_list('user_id', flat=True).distinct().order_by():
+        ids = list(todos.filter(user_id=user_id).order_by('id').values_list('id', flat=True))
+        todos.bulk_update(
+            [Todo(id=todo_id, position=position) for todo_id, position in zip(ids, keys_after(None, len(ids)))],
+            ['position'], batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0014_todochange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='position',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'completed', 'position', 'id'], name='todo_user_position_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='todo',
+            name='todo_user_completed_id_idx',
+        ),
+    ]
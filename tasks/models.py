@@ -1,15 +1,357 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Case, Count, F, Max, Q, Value, When
+from django.db.models.functions import Coalesce, Now
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .db.sharding import ShardedQuerySet
+from .ordering import REBALANCE_LENGTH, REBALANCE_WINDOW, key_between, keys_after, keys_between
+
+# Filter modes accepted by the todo list, mapped to the `completed` values they include.
+FILTER_MODES = {
+    'all': (False, True),
+    'open': (False,),
+    'done': (True,),
+}
+
+# The columns the todo list renders. Descriptions are loaded one at a time,
+# when the user opens them.
+LIST_FIELDS = ('id', 'title', 'completed', 'position')
+
+
+def _lock_appends(using, user_id):
+    """
+    Lock the user's TodoStats row until the transaction ends, so concurrent
+    appends to their list read the last position one after the other instead
+    of both picking the key after the same todo. A missing row is inserted
+    first, counting the user's todos, since there would be nothing to lock.
+    """
+    stats = TodoStats.objects.using(using).select_for_update().filter(user_id=user_id)
+    if list(stats.values_list('pk', flat=True)):
+        return
+    counts = Todo.objects.using(using).filter(user_id=user_id).aggregate(
+        total=Count('id'), completed=Count('id', filter=Q(completed=True)),
+    )
+    # A concurrent first append inserts the same row; the loser of the race
+    # waits for it on the unique key and then keeps the winner's.
+    TodoStats.objects.using(using).bulk_create([TodoStats(user_id=user_id, changed_at=timezone.now(), **counts)], ignore_conflicts=True)
+    list(stats.values_list('pk', flat=True))
+
+
+def _count_created(using, user_id, todos):
+    """
+    Add freshly inserted todos to the user's counters, whose row
+    _lock_appends() made sure of. Every insert counts itself this way, so a
+    todo created outside the views (admin, shell) leaves no drift behind.
+    """
+    TodoStats.objects.using(using).filter(user_id=user_id).update(
+        total=F('total') + len(todos), completed=F('completed') + sum(todo.completed for todo in todos), changed_at=Now(),
+    )
+
+
+class TodoQuerySet(ShardedQuerySet):
+    def owned_by(self, user):
+        return self.for_shard_of(user.pk).filter(user=user)
+
+    def toggle_completed(self):
+        """
+        Flip `completed` on every matched row in a single UPDATE, so concurrent
+        toggles cannot overwrite each other. Returns the number of rows changed.
+        """
+        return self.update(**self._toggled())
+
+    def create_many(self, user, rows, batch_size=None):
+        """
+        Insert one todo per dict in `rows` for `user` with bulk INSERTs and return
+        them with primary keys set. Backends that cannot return ids from a bulk
+        insert (MySQL) get them by reading back the user's newest rows, so call
+        this inside a transaction. Rows without a position are appended to the
+        user's list. The user's counters take in the new todos.
+        """
+        qs = self.for_shard_of(user.pk)
+        todos = [Todo(user=user, **row) for row in rows]
+        if not todos:
+            return todos
+        unplaced = [todo for todo in todos if not todo.position]
+        with transaction.atomic(using=qs.db, savepoint=False):
+            _lock_appends(qs.db, user.pk)
+            for todo, position in zip(unplaced, keys_after(qs.filter(user=user).last_position(), len(unplaced))):
+                todo.position = position
+            for todo in todos:
+                todo.sync_completed_at()
+            todos = qs.bulk_create(todos, batch_size=batch_size)
+            if todos and todos[-1].pk is None:
+                ids = sorted(qs.filter(user=user).order_by('-id').values_list('id', flat=True)[:len(todos)])
+                for todo, pk in zip(todos, ids):
+                    todo.pk = pk
+            _count_created(qs.db, user.pk, todos)
+        return todos
+
+    def update_todo(self, **fields):
+        """
+        update() for todo fields that keeps `completed_at` in step with
+        `completed` (set when a todo is first completed, cleared when reopened)
+        and moves `updated_at`.
+        """
+        if 'completed' in fields:
+            fields['completed_at'] = Coalesce(F('completed_at'), Now()) if fields['completed'] else None
+        return self.update(**fields, updated_at=Now())
+
+    @staticmethod
+    def _toggled():
+        # completed_at comes first: MySQL evaluates SET assignments left to
+        # right, so it must read `completed` before it is flipped.
+        return {
+            'completed_at': Case(When(completed=True, then=Value(None)), default=Now()),
+            'completed': Case(When(completed=True, then=Value(False)), default=Value(True)),
+            'updated_at': Now(),
+        }
+
+    def last_position(self):
+        """
+        The highest position among the todos, or None. Filter by user first:
+        one MAX per `completed` value, each read off the end of its range of
+        the (user, completed, position, id) index. Rows without a position
+        yet (inserted around the model, e.g. by a raw bulk_create) are skipped.
+        """
+        lasts = self.order_by().exclude(position='').values('completed').annotate(last=Max('position')).values_list('last', flat=True)
+        return max(lasts, default=None)
+
+    def place_after(self, todo_id, after_id=None):
+        """
+        Move one todo to right after the todo `after_id` (first when None) by
+        giving it a position between that todo and the next one of the same
+        completed state; no other row is written. Locks the rows it reads, so
+        call inside a transaction. Returns the new position; raises
+        DoesNotExist when either todo is not among the queryset's.
+        """
+        todo = self.select_for_update().only('id', 'completed', 'position').get(id=todo_id)
+        after = None
+        if after_id is not None:
+            after = self.select_for_update().values_list('position', flat=True).get(id=after_id)
+        following = self.filter(completed=todo.completed).exclude(id=todo_id)
+        if after is not None:
+            following = following.filter(position__gt=after)
+        following = following.select_for_update().order_by('position', 'id').values_list('position', flat=True).first()
+        position = key_between(after, following)
+        self.filter(id=todo_id).update(position=position, updated_at=Now())
+        return position
+
+    def rebalance_around(self, todo_id, window=REBALANCE_WINDOW):
+        """
+        Rewrite the positions of the todo `todo_id` and of up to `window`
+        todos of the same completed state on either side of it with short
+        keys spread between the todos just outside them, in their current
+        order. The window doubles until the keys come out no longer than half
+        of REBALANCE_LENGTH or it covers the whole list. Locks the rows, so
+        call inside a transaction. Returns the ids of the todos rewritten.
+        """
+        todo = self.only('completed', 'position').get(id=todo_id)
+        same = self.filter(completed=todo.completed).exclude(id=todo_id).select_for_update()
+        before = same.filter(Q(position__lt=todo.position) | Q(position=todo.position, id__lt=todo_id)).order_by('-position', '-id')
+        after = same.filter(Q(position__gt=todo.position) | Q(position=todo.position, id__gt=todo_id)).order_by('position', 'id')
+        while True:
+            lower = list(before.values_list('id', 'position')[:window + 1])
+            upper = list(after.values_list('id', 'position')[:window + 1])
+            lower_key = lower.pop()[1] if len(lower) > window else None
+            upper_key = upper.pop()[1] if len(upper) > window else None
+            ids = [row[0] for row in reversed(lower)] + [todo_id] + [row[0] for row in upper]
+            keys = keys_between(lower_key, upper_key, len(ids))
+            if max(map(len, keys)) <= REBALANCE_LENGTH // 2 or (lower_key is None and upper_key is None):
+                break
+            window *= 2
+        self.bulk_update([Todo(id=pk, position=key) for pk, key in zip(ids, keys)], ['position'])
+        return ids
+
+    def keyset_page(self, mode='all', after=None, limit=50):
+        """
+        Return up to `limit` todos ordered by (completed, position, id),
+        starting after the `(completed, position, id)` cursor. Open todos come
+        before done ones in 'all' mode. Walks the (user, completed, position,
+        id) index, so the cost does not grow with the number of todos the
+        user has.
+        """
+        qs = self.filter(completed__in=FILTER_MODES[mode]).order_by('completed', 'position', 'id')
+        if after is not None:
+            completed, position, last_id = after
+            qs = qs.filter(
+                Q(completed=completed, position=position, id__gt=last_id)
+                | Q(completed=completed, position__gt=position)
+                | Q(completed__gt=completed)
+            )
+        return qs[:limit]
+
+    def values_in_chunks(self, *fields, chunk_size=2000):
+        """
+        Yield lists of `values_list('id', *fields)` rows in id order, one query
+        of at most `chunk_size` rows per list, resuming after the last id seen.
+        Unlike .iterator(), memory stays bounded on MySQL too, where the driver
+        buffers a query's whole result set on the client.
+        """
+        qs = self.order_by('id').values_list('id', *fields)
+        last_id = None
+        while True:
+            chunk = list((qs if last_id is None else qs.filter(id__gt=last_id))[:chunk_size])
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_id = chunk[-1][0]
+
+
+# The per-user tables below may live on another database than their users
+# (see tasks.db.sharding), so their user foreign keys have no database constraint.
 
 class Todo(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='todos')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False, related_name='todos')
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     completed = models.BooleanField(default=False)
+    # When the todo was completed; null while it is open. Drives archival.
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Moved by every write, including the update() paths of TodoQuerySet,
+    # which auto_now alone would miss. The todo page's validators read its MAX.
+    updated_at = models.DateTimeField(auto_now=True)
+    # The todo's place in the user's manual order; see tasks.ordering. New
+    # todos are placed last.
+    position = models.CharField(max_length=64, default='', editable=False)
+
+    objects = TodoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'completed', 'position', 'id'], name='todo_user_position_idx'),
+            models.Index(fields=['completed_at', 'id'], name='todo_completed_at_idx'),
+            models.Index(fields=['user', 'updated_at'], name='todo_user_updated_at_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def sync_completed_at(self):
+        if not self.completed:
+            self.completed_at = None
+        elif self.completed_at is None:
+            self.completed_at = timezone.now()
+
+    def save(self, *args, **kwargs):
+        self.sync_completed_at()
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(Todo, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            _lock_appends(using, self.user_id)
+            if not self.position:
+                self.position = key_between(Todo.objects.using(using).filter(user_id=self.user_id).last_position(), None)
+            super().save(*args, **kwargs)
+            _count_created(using, self.user_id, [self])
+
+
+class TodoTerm(models.Model):
+    """
+    One row per distinct search term of a todo, maintained by tasks.search.
+    Rows are removed explicitly before their todo, so the todo FK has no
+    database constraint and deleting a todo stays a single statement.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    todo = models.ForeignKey(Todo, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'term'], name='todoterm_user_term_idx'),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class TodoStats(models.Model):
+    """
+    Per-user counts of the todos in the todo table, adjusted with F()
+    expressions by every write through tasks.counters so the todo page never
+    has to count rows. `manage.py repair_todo_stats` recomputes them.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, db_constraint=False, related_name='todo_stats')
+    total = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    # When the counts last moved. Deletes leave no row behind to carry an
+    # updated_at, so this is what tells the todo page's validators about them.
+    changed_at = models.DateTimeField(null=True, blank=True)
+    # The user's change log (TodoChange): the last sequence number handed
+    # out, and the one up to which entries may have been dropped. Both start
+    # at 1, so a client syncing from 0 (it has nothing yet) is always sent
+    # to download the whole list first.
+    change_seq = models.BigIntegerField(default=1)
+    trimmed_seq = models.BigIntegerField(default=1)
+
+    objects = ShardedQuerySet.as_manager()
+
+    @property
+    def open(self):
+        return self.total - self.completed
+
+    def __str__(self):
+        return f'{self.open} open / {self.completed} done'
+
+
+class ArchivedTodo(models.Model):
+    """
+    A completed todo moved out of the todo table by the archive_todos
+    command. `todo_id` is the id it had as a Todo.
+    """
+    todo_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False, related_name='archived_todos')
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    completed_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='archivedtodo_user_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
-    
+class TodoChange(models.Model):
+    """
+    An entry of a user's change log, read by the sync API: the todo
+    `todo_id` was created or edited, or deleted when `deleted` is set.
+    `seq` numbers a user's entries in commit order; see tasks.changes.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    seq = models.BigIntegerField()
+    todo_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'seq'], name='todochange_user_seq_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='todochange_created_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.seq}: {"deleted" if self.deleted else "changed"} {self.todo_id}'
+
+
+class UserShard(models.Model):
+    """Which shard alias holds a user's todos. Kept on `default`; see tasks.db.sharding."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    alias = models.CharField(max_length=64)
+
+    def __str__(self):
+        return self.alias
@@ -0,0 +1,146 @@
+"""
+Fractional position keys for the manual order of a user's todos. A key is
+a string that sorts between its neighbours, so moving a todo only rewrites
+its own key: key_between(a, b) returns a key after `a` and before `b`
+(None for either end of the list).
+
+Keys are an integer part, whose first character gives its length, followed
+by a fraction. Appending to either end increments or decrements the integer,
+so keys for todos added in order grow only logarithmically; repeated moves
+into the same gap lengthen the fraction by a character every few moves,
+until the todos around the long key are rewritten with short keys
+(TodoQuerySet.rebalance_around).
+
+The digits are 0-9 and A-Z only, which sort the same under a binary and a
+case-insensitive collation.
+"""
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+BASE = len(DIGITS)
+
+# Heads DIGITS[HALF:] start non-negative integers of 1, 2, ... digits and
+# DIGITS[HALF - 1::-1] negative ones, so longer integers sort further out.
+HALF = BASE // 2
+SMALLEST_INTEGER = DIGITS[0] * (HALF + 1)
+
+# Rewrite the keys around a key once it grows longer than this, starting
+# with REBALANCE_WINDOW todos on either side of it.
+REBALANCE_LENGTH = 32
+REBALANCE_WINDOW = 16
+
+
+def _integer_length(head):
+    index = DIGITS.index(head)
+    return index - HALF + 2 if index >= HALF else HALF - index + 1
+
+
+def _split(key):
+    if not key or key[0] not in DIGITS:
+        raise ValueError(f'Invalid position key {key!r}.')
+    length = _integer_length(key[0])
+    if len(key) < length:
+        raise ValueError(f'Invalid position key {key!r}.')
+    return key[:length], key[length:]
+
+
+def _midpoint(a, b):
+    """A fraction between fractions `a` and `b` (None: 1), neither ending in 0."""
+    if b is not None:
+        common = 0
+        while common < len(b) and (a[common] if common < len(a) else DIGITS[0]) == b[common]:
+            common += 1
+        if common:
+            return b[:common] + _midpoint(a[common:], b[common:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def _increment(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        if digits[i] != DIGITS[-1]:
+            digits[i] = DIGITS[DIGITS.index(digits[i]) + 1]
+            return head + ''.join(digits)
+        digits[i] = DIGITS[0]
+    head_index = DIGITS.index(head)
+    if head_index == HALF - 1:
+        return DIGITS[HALF] + DIGITS[0]
+    if head_index == BASE - 1:
+        return None
+    if head_index + 1 > HALF:
+        digits.append(DIGITS[0])
+    else:
+        digits.pop()
+    return DIGITS[head_index + 1] + ''.join(digits)
+
+
+def _decrement(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        if digits[i] != DIGITS[0]:
+            digits[i] = DIGITS[DIGITS.index(digits[i]) - 1]
+            return head + ''.join(digits)
+        digits[i] = DIGITS[-1]
+    head_index = DIGITS.index(head)
+    if head_index == HALF:
+        return DIGITS[HALF - 1] + DIGITS[-1]
+    if head_index == 0:
+        return None
+    if head_index - 1 < HALF - 1:
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return DIGITS[head_index - 1] + ''.join(digits)
+
+
+def key_between(a, b):
+    """
+    A key that sorts after `a` and before `b`; None stands for the start
+    and end of the list. Raises ValueError unless a < b.
+    """
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f'{a!r} does not sort before {b!r}.')
+    if a is None and b is None:
+        return DIGITS[HALF] + DIGITS[0]
+    if a is None:
+        integer, fraction = _split(b)
+        if integer == SMALLEST_INTEGER:
+            return integer + _midpoint('', fraction)
+        if fraction:
+            return integer
+        return _decrement(integer)
+    integer, fraction = _split(a)
+    if b is None:
+        return _increment(integer) or integer + _midpoint(fraction, None)
+    integer_b, fraction_b = _split(b)
+    if integer == integer_b:
+        return integer + _midpoint(fraction, fraction_b)
+    following = _increment(integer)
+    if following is not None and following < b:
+        return following
+    return integer + _midpoint(fraction, None)
+
+
+def keys_after(a, count):
+    """`count` increasing keys after `a` (None: from the start of an empty list)."""
+    keys = []
+    for _ in range(count):
+        a = key_between(a, None)
+        keys.append(a)
+    return keys
+
+
+def keys_between(a, b, count):
+    """
+    `count` increasing keys after `a` and before `b` (None for either end),
+    picked by halving the gap so they stay short.
+    """
+    if not count:
+        return []
+    middle = key_between(a, b)
+    half = count // 2
+    return keys_between(a, middle, half) + [middle] + keys_between(middle, b, count - half - 1)
@@ -0,0 +1,96 @@
+"""
+Moves one user's todo rows from their shard to another, in batches, for
+`manage.py move_user_shard`. The rows are copied to the target shard, the
+user is switched over, and only then are the old rows deleted, so an
+interrupted move leaves the user on their old shard with their data intact
+(running it again first clears the partial copy).
+
+Todos get new ids and timestamps on the target shard, and
+ArchivedTodo.archived_at becomes the time of the move; the change log starts
+over, so sync clients reload. Writes the user makes while their rows are
+copied are not carried over, so move users while they are idle.
+"""
+import time
+
+from django.db import transaction
+
+from .cache import bump_list_version
+from .counters import recount
+from .db.sharding import set_shard, shard_aliases, shard_for
+from .events import publish_event
+from .models import ArchivedTodo, Todo, TodoChange, TodoStats, TodoTerm
+from .search import index_new_todos
+
+
+def _copied_fields(model):
+    return [field.attname for field in model._meta.concrete_fields if not field.primary_key and field.name != 'user']
+
+
+def _chunks(queryset, fields, batch_size):
+    """Yield lists of `values_list('id', *fields)` rows in id order, `batch_size` at a time."""
+    qs = queryset.order_by('id').values_list('id', *fields)
+    last_id = 0
+    while True:
+        chunk = list(qs.filter(id__gt=last_id)[:batch_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < batch_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def _delete_rows(alias, user_id, batch_size):
+    for model in (TodoTerm, Todo, ArchivedTodo, TodoChange):
+        qs = model.objects.using(alias).filter(user_id=user_id)
+        while True:
+            ids = list(qs.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            model.objects.using(alias).filter(id__in=ids).delete()
+    TodoStats.objects.using(alias).filter(user_id=user_id).delete()
+
+
+def move_user(user, target, batch_size=500, pause=0.0):
+    """
+    Move `user`'s todos, search terms, counters and archive to the `target`
+    shard. Returns `(todos, archived)`, the number of rows moved.
+    """
+    if target not in shard_aliases():
+        raise ValueError(f'{target!r} is not one of the aliases in TODO_SHARDS.')
+    source = shard_for(user.id)
+    if source == target:
+        return 0, 0
+
+    _delete_rows(target, user.id, batch_size)
+    todo_fields = _copied_fields(Todo)
+    moved = 0
+    for chunk in _chunks(Todo.objects.using(source).filter(user=user), todo_fields, batch_size):
+        with transaction.atomic(using=target):
+            todos = Todo.objects.using(target).create_many(user, [dict(zip(todo_fields, row[1:])) for row in chunk])
+            index_new_todos(todos, using=target)
+        moved += len(todos)
+        if pause:
+            time.sleep(pause)
+
+    archive_fields = _copied_fields(ArchivedTodo)
+    archived = 0
+    for chunk in _chunks(ArchivedTodo.objects.using(source).filter(user=user), archive_fields, batch_size):
+        ArchivedTodo.objects.using(target).bulk_create([
+            ArchivedTodo(user=user, **dict(zip(archive_fields, row[1:]))) for row in chunk
+        ])
+        archived += len(chunk)
+        if pause:
+            time.sleep(pause)
+
+    recount([user.id], using=target)
+    # The change log is not copied: it names the old ids. Continuing its
+    # sequence with nothing logged sends every sync client to reload.
+    last_seq = TodoStats.objects.using(source).filter(user=user).values_list('change_seq', flat=True).first() or 0
+    TodoStats.objects.using(target).filter(user=user).update(change_seq=last_seq + 1, trimmed_seq=last_seq + 1)
+    set_shard(user.id, target)
+    _delete_rows(source, user.id, batch_size)
+
+    bump_list_version(user.id)
+    # Todo ids changed; open pages have to reload.
+    publish_event(user.id, 'reset')
+    return moved, archived
@@ -0,0 +1,106 @@
+import re
+from collections import Counter
+
+from django.db.models import Case, Max, Q, Sum, Value, When
+
+from .models import LIST_FIELDS, Todo, TodoTerm
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = TodoTerm._meta.get_field('term').max_length
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if len(token) <= MAX_TERM_LENGTH]
+
+
+def term_weights(title, description):
+    """Map each term of a todo to its weight; title hits count more than description hits."""
+    weights = Counter()
+    for term in tokenize(title):
+        weights[term] += TITLE_WEIGHT
+    for term in tokenize(description):
+        weights[term] += DESCRIPTION_WEIGHT
+    return weights
+
+
+def index_todo(user_id, todo_id, title, description):
+    """
+    Bring the indexed terms of one todo in line with its current title and
+    description, touching only the terms that were added, removed or reweighted.
+    """
+    weights = term_weights(title, description)
+    terms = TodoTerm.objects.for_shard_of(user_id)
+    existing = {term.term: term for term in terms.filter(todo_id=todo_id)}
+
+    stale = [term.id for name, term in existing.items() if name not in weights]
+    if stale:
+        terms.filter(id__in=stale).delete()
+
+    changed = []
+    for name, weight in weights.items():
+        if name in existing and existing[name].weight != weight:
+            existing[name].weight = weight
+            changed.append(existing[name])
+    if changed:
+        terms.bulk_update(changed, ['weight'])
+
+    terms.bulk_create([
+        TodoTerm(user_id=user_id, todo_id=todo_id, term=name, weight=weight)
+        for name, weight in weights.items()
+        if name not in existing
+    ])
+
+
+def index_new_todos(todos, batch_size=1000, using=None):
+    """
+    Index freshly created todos, which have no terms yet, with bulk inserts.
+    The todos must belong to users on one shard, or pass the shard as `using`.
+    """
+    TodoTerm.objects.using(using).bulk_create((
+        TodoTerm(user_id=todo.user_id, todo_id=todo.id, term=name, weight=weight)
+        for todo in todos
+        for name, weight in term_weights(todo.title, todo.description).items()
+    ), batch_size=batch_size)
+
+
+def unindex_todos(user, todo_ids):
+    """Drop the terms of the given todos. Must run before the todos are deleted."""
+    TodoTerm.objects.for_shard_of(getattr(user, 'pk', user)).filter(user=user, todo_id__in=todo_ids).delete()
+
+
+def _prefix_range(prefix):
+    # term >= prefix AND term < prefix-with-last-char-incremented: an index range
+    # scan on (user, term) on every backend, unlike LIKE.
+    return Q(term__gte=prefix, term__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def search(user, query, limit=20):
+    """
+    Return the user's todos matching every term of `query`, best match first.
+    The last term also matches as a prefix. Only the (user, term) index is
+    scanned; the matching todos are then loaded by primary key.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+
+    conditions = [Q(term=token) for token in tokens[:-1]] + [_prefix_range(tokens[-1])]
+    matches = Q()
+    for condition in conditions:
+        matches |= condition
+    # One flag per query term: whether the todo has at least one term matching it.
+    flags = {f'm{i}': Max(Case(When(condition, then=Value(1)), default=Value(0))) for i, condition in enumerate(conditions)}
+
+    ranked = (
+        TodoTerm.objects.for_shard_of(user.pk).filter(matches, user=user)
+        .values('todo_id')
+        .annotate(score=Sum('weight'), **flags)
+        .filter(**{name: 1 for name in flags})
+        .order_by('-score', '-todo_id')
+        .values_list('todo_id', 'score')[:limit]
+    )
+    scores = dict(ranked)
+    todos = Todo.objects.owned_by(user).only(*LIST_FIELDS).in_bulk(list(scores))
+    return [todos[todo_id] for todo_id in scores if todo_id in todos]
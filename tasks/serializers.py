@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from .models import Todo
+from . import hashing
 
 class SignupSerializer(serializers.ModelSerializer):
     password1 = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
@@ -10,18 +14,25 @@ class SignupSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'email', 'password1', 'password2']
+        # Uniqueness is checked for both fields at once in validate(), and
+        # enforced by the database's unique indexes in create().
+        extra_kwargs = {'username': {'validators': [UnicodeUsernameValidator()]}}
 
-    def validate_username(self, value):
-        if User.objects.filter(username=value).exists():
-            raise serializers.ValidationError("A user with that username already exists")
-        return value
-
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("A user with this email already exists")
-        return value
+    def uniqueness_errors(self, username, email):
+        """Look up clashes on username and email with a single query."""
+        errors = {}
+        taken = User.objects.filter(Q(username=username) | Q(email__iexact=email)).values_list('username', 'email')
+        for taken_username, taken_email in taken:
+            if taken_username == username:
+                errors['username'] = ["A user with that username already exists."]
+            if taken_email.lower() == email.lower():
+                errors['email'] = ["A user with this email already exists"]
+        return errors
 
     def validate(self, data):
+        errors = self.uniqueness_errors(data['username'], data['email'])
+        if errors:
+            raise serializers.ValidationError(errors)
         password1 = data.get('password1')
         password2 = data.get('password2')
         if password1 != password2:
@@ -32,11 +43,20 @@ class SignupSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop('password2') 
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password1']
+        user = User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data['email']),
         )
+        user.password = hashing.make_password(validated_data['password1'])
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # Lost a race with a concurrent signup; report it like validate() would.
+            raise serializers.ValidationError(
+                self.uniqueness_errors(user.username, user.email)
+                or {'username': ["A user with that username already exists."]}
+            )
         return user
     
 class LoginSerializer(serializers.Serializer):
@@ -53,10 +73,34 @@ class LoginSerializer(serializers.Serializer):
     def validate(self, data):
         return data
 
-class TodoSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Drop every field not listed in the `fields` keyword argument, when given."""
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class TodoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Todo
-        fields = ['id', 'user', 'title', 'description', 'completed']
+        fields = ['id', 'user', 'title', 'description', 'completed', 'position']
+        read_only_fields = ['user', 'position']
+
+def list_errors(serializer):
+    """
+    The errors of an invalid many=True serializer as one dict per item, empty
+    for valid items. Newer DRF releases report them as {index: errors}, older
+    ones as a list.
+    """
+    errors = serializer.errors
+    if isinstance(errors, dict):
+        return [errors.get(i, {}) for i in range(len(serializer.initial_data))]
+    return list(errors)
+
+class TaskIdsSerializer(serializers.Serializer):
+    task_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
 
     
 
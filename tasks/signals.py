@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .backends import invalidate_cached_user
+from .db.sharding import recorded_shard
+
+UserModel = get_user_model()
+
+
+@receiver(post_save, sender=UserModel)
+@receiver(post_delete, sender=UserModel)
+def drop_cached_user(sender, instance, **kwargs):
+    # Covers password changes and every other save through the model.
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def drop_cached_user_on_logout(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_cached_user(user.pk)
+
+
+@receiver(pre_delete, sender=UserModel)
+def delete_sharded_rows(sender, instance, using, **kwargs):
+    # Deleting a user cascades on the database the user is deleted from
+    # only; their rows on another shard are deleted here.
+    from .models import ArchivedTodo, Todo, TodoChange, TodoStats, TodoTerm
+
+    alias = recorded_shard(instance.pk)
+    if alias is None or alias == using:
+        return
+    with transaction.atomic(using=alias):
+        for model in (TodoTerm, Todo, TodoStats, ArchivedTodo, TodoChange):
+            model.objects.using(alias).filter(user_id=instance.pk).delete()
@@ -0,0 +1,24 @@
+// Load a todo's notes into the list the first time they are opened, so the
+// list page itself only carries titles.
+document.addEventListener("toggle", function (event) {
+    const details = event.target;
+    if (!details.matches(".todo-details[data-description-url]") || !details.open || details.dataset.loaded) {
+        return;
+    }
+    details.dataset.loaded = "true";
+    const target = details.querySelector(".todo-description");
+    fetch(details.dataset.descriptionUrl, {credentials: "same-origin"})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.text();
+        })
+        .then(html => {
+            target.innerHTML = html;
+        })
+        .catch(() => {
+            delete details.dataset.loaded;
+            target.textContent = "Could not load the notes.";
+        });
+}, true);  // toggle does not bubble
@@ -0,0 +1,7 @@
+// Hide error messages 3 seconds after the page has loaded.
+document.addEventListener("DOMContentLoaded", function () {
+    const errorMessages = document.querySelectorAll(".error");
+    setTimeout(() => {
+        errorMessages.forEach(error => error.classList.add("hidden"));
+    }, 3000);
+});
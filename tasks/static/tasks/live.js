@@ -0,0 +1,103 @@
+// Apply todo changes pushed over the server's event stream (auth/events/)
+// to the list on this page, so other tabs' changes show up without a reload.
+document.addEventListener("DOMContentLoaded", function () {
+    const list = document.querySelector(".todo-list[data-events-url]");
+    const template = document.getElementById("todo-item-template");
+    if (!list || !template || !window.EventSource) {
+        return;
+    }
+    const filter = list.dataset.filter;
+    const laterPage = Boolean(document.querySelector(".pagination .first-page"));
+
+    function findItem(id) {
+        return list.querySelector(`li[data-todo-id="${id}"]`);
+    }
+
+    function matchesFilter(completed) {
+        return filter === "all" || (filter === "done") === completed;
+    }
+
+    function setCompleted(item, completed) {
+        const status = item.querySelector(".todo-status");
+        item.dataset.completed = String(completed);
+        status.textContent = completed ? "Completed" : "Pending";
+        status.style.color = completed ? "green" : "red";
+        if (!matchesFilter(completed)) {
+            item.remove();
+        }
+    }
+
+    function addItem(todo) {
+        // New todos sort last, so they only belong on the last page.
+        if (findItem(todo.id) || document.querySelector(".pagination .next-page") || !matchesFilter(todo.completed)) {
+            return;
+        }
+        const item = template.content.firstElementChild.cloneNode(true);
+        item.dataset.todoId = todo.id;
+        item.querySelector("input[name=task_ids]").value = todo.id;
+        // The template was rendered for todo id 0.
+        const withId = url => url.replace("/0/", `/${todo.id}/`).replace(/edit_task_id=0$/, `edit_task_id=${todo.id}`);
+        item.querySelectorAll("form").forEach(form => {
+            form.action = withId(form.getAttribute("action"));
+        });
+        item.querySelectorAll("a[href]").forEach(link => {
+            link.href = withId(link.getAttribute("href"));
+        });
+        item.querySelectorAll("[data-description-url]").forEach(details => {
+            details.dataset.descriptionUrl = withId(details.dataset.descriptionUrl);
+        });
+        item.dataset.moveUrl = withId(item.dataset.moveUrl);
+        item.querySelector(".todo-title").textContent = todo.title;
+        list.appendChild(item);
+        setCompleted(item, todo.completed);
+    }
+
+    const source = new EventSource(list.dataset.eventsUrl);
+    source.addEventListener("todo", function (message) {
+        const event = JSON.parse(message.data);
+        if (event.type === "created") {
+            event.todos.forEach(addItem);
+        } else if (event.type === "edited") {
+            event.todos.forEach(todo => {
+                const item = findItem(todo.id);
+                if (item) {
+                    item.querySelector(".todo-title").textContent = todo.title;
+                    // The notes may have changed too; fetch them again when next opened.
+                    const details = item.querySelector(".todo-details");
+                    delete details.dataset.loaded;
+                    details.open = false;
+                    setCompleted(item, todo.completed);
+                }
+            });
+        } else if (event.type === "toggled") {
+            event.ids.forEach(id => {
+                const item = findItem(id);
+                if (item) {
+                    setCompleted(item, item.dataset.completed !== "true");
+                }
+            });
+        } else if (event.type === "deleted") {
+            event.ids.forEach(id => {
+                const item = findItem(id);
+                if (item) {
+                    item.remove();
+                }
+            });
+        } else if (event.type === "moved") {
+            event.ids.forEach(id => {
+                const item = findItem(id);
+                const after = event.after === null ? null : findItem(event.after);
+                if (item && after) {
+                    after.after(item);
+                } else if (item && event.after === null && !laterPage) {
+                    list.prepend(item);
+                } else if (item || after) {
+                    // It moved from or to a place on another page.
+                    window.location.reload();
+                }
+            });
+        } else if (event.type === "reset") {
+            window.location.reload();
+        }
+    });
+});
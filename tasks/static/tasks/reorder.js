@@ -0,0 +1,63 @@
+// Drag and drop ordering of the todo list. A dropped todo is sent to its
+// move URL with the id of the todo now above it, or none when it is first.
+document.addEventListener("DOMContentLoaded", function () {
+    const list = document.querySelector(".todo-list");
+    if (!list) {
+        return;
+    }
+    // A todo dropped at the top of a later page belongs after a todo on the
+    // previous page, which this page does not know.
+    const laterPage = Boolean(document.querySelector(".pagination .first-page"));
+    let dragged = null;
+
+    list.addEventListener("dragstart", function (event) {
+        dragged = event.target.closest("li[data-move-url]");
+        if (dragged) {
+            dragged.classList.add("dragging");
+            event.dataTransfer.effectAllowed = "move";
+        }
+    });
+
+    list.addEventListener("dragend", function () {
+        if (dragged) {
+            dragged.classList.remove("dragging");
+            dragged = null;
+        }
+    });
+
+    list.addEventListener("dragover", function (event) {
+        const target = event.target.closest("li[data-move-url]");
+        if (!dragged || !target || target === dragged) {
+            return;
+        }
+        event.preventDefault();
+        const box = target.getBoundingClientRect();
+        if (event.clientY < box.top + box.height / 2) {
+            target.before(dragged);
+        } else {
+            target.after(dragged);
+        }
+    });
+
+    list.addEventListener("drop", function (event) {
+        if (!dragged) {
+            return;
+        }
+        event.preventDefault();
+        const previous = dragged.previousElementSibling;
+        if (!previous && laterPage) {
+            window.location.reload();
+            return;
+        }
+        const body = new FormData();
+        body.append("after", previous ? previous.dataset.todoId : "");
+        body.append("csrfmiddlewaretoken", document.querySelector("input[name=csrfmiddlewaretoken]").value);
+        fetch(dragged.dataset.moveUrl, {method: "POST", body: body, credentials: "same-origin", redirect: "manual"})
+            .then(response => {
+                if (response.type !== "opaqueredirect" && !response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+            })
+            .catch(() => window.location.reload());
+    });
+});
@@ -0,0 +1,9 @@
+import math
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of `samples`; 0.0 when there are none."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
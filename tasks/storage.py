@@ -0,0 +1,92 @@
+"""
+Static files storage that, on top of Django's hashed manifest storage, writes
+gzip (and, when the brotli package is installed, brotli) copies of every
+compressible file at collectstatic time, and the view that serves them.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.json', '.map', '.html', '.xml')
+# Precompressed variants, best first: (Accept-Encoding token, file suffix).
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] if brotli else [('gzip', '.gz')]
+FAR_FUTURE = 365 * 24 * 60 * 60
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in self.hashed_files.values():
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self._write_compressed(hashed_name)
+
+    def _write_compressed(self, name):
+        with self.open(name) as fh:
+            content = fh.read()
+        variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli:
+            variants['.br'] = brotli.compress(content)
+        for suffix, compressed in variants.items():
+            path = self.path(name + suffix)
+            # A compressed copy that is not smaller is not worth sending.
+            if len(compressed) < len(content):
+                with open(path, 'wb') as out:
+                    out.write(compressed)
+            elif os.path.exists(path):
+                os.remove(path)
+
+
+def _is_hashed(name):
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    return bool(hashed_files) and name in hashed_files.values()
+
+
+@require_safe
+def serve_static(request, path):
+    """
+    Serve a collected static file from STATIC_ROOT, preferring a precompressed
+    copy the client accepts. Hashed names never change content, so they are
+    cached for a year.
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404('Static file not found.')
+    if not os.path.isfile(fullpath):
+        raise Http404('Static file not found.')
+
+    accepted = {token.split(';')[0].strip() for token in request.headers.get('Accept-Encoding', '').split(',')}
+    content_type, _ = mimetypes.guess_type(fullpath)
+    encoding = None
+    for token, suffix in ENCODINGS:
+        if token in accepted and os.path.isfile(fullpath + suffix):
+            fullpath, encoding = fullpath + suffix, token
+            break
+
+    response = FileResponse(open(fullpath, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if name.endswith(COMPRESSIBLE_EXTENSIONS):
+        patch_vary_headers(response, ['Accept-Encoding'])
+    if _is_hashed(name):
+        patch_cache_control(response, public=True, max_age=FAR_FUTURE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=60)
+    return response
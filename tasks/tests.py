@@ -1,9 +1,62 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from .serializers import SignupSerializer
 from django.contrib.auth.models import User
-from tasks.models import Todo
-from django.test import Client
+from tasks.models import ArchivedTodo, Todo, TodoChange, TodoStats, TodoTerm
+from tasks.archive import archive_batch
+from django.utils import timezone
+from datetime import timedelta
+from tasks.search import index_new_todos, search
+from django.core.management import call_command
+from io import BytesIO, StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from tasks.importer import import_todos, open_upload, parse_rows
+from tasks.hashing import HashingPool, PoolSaturated, get_pool
+import threading
+import os
+import sqlite3
+import tempfile
+from tasks.db.pool import ConnectionPool, PoolTimeout
+from tasks.db.backends.sqlite3.base import DatabaseWrapper as PooledSqliteWrapper
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from django.test import Client, RequestFactory
+from django.core.cache import caches
+from tasks.cache import CSRF_PLACEHOLDER, cached_todo_list, fragment_cache_stats, list_version
+from django.utils.http import http_date
+from tasks.urls import get_urlpatterns
+from tasks.views import _page_context
+from tasks.middleware import SERVER_TIMING_DEFAULTS
+from tasks.timing import RequestTimings, record_request, reset_timing_stats, timing_stats
+from django.http import HttpResponse
+from tasks import bench
+from tasks.bench import load_workload, parse_mix, summarize
+from django.urls import include, path, re_path
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from tasks.storage import serve_static
+import gzip
+import csv
+import json
+import asyncio
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from tasks.events import InProcessBroker, publish_event
+from unittest import skipUnless
+from tasks.db.routers import ReplicaRouter, replica_reads
+from tasks.middleware import PIN_COOKIE
+from tasks.db.sharding import hashed_shard, set_shard, shard_for
+from tasks.models import UserShard
+from tasks.counters import list_state, recount
+from tasks.changes import changes_since
+from tasks.ordering import key_between, keys_after, keys_between
+from django.core.management.base import CommandError
+from django.core.checks import run_checks
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
+import sys
 
 class SignupPageTests(TestCase):
     def test_signup_page_renders_correctly(self):
@@ -220,6 +273,7 @@ class LoginTests(TestCase):
 
 class TodoAppTests(TestCase):
     def setUp(self):
+        caches['todo_fragments'].clear()
         # Create a test user
         self.user = User.objects.create_user(username="testuser", password="password123")
         self.other_user = User.objects.create_user(username="otheruser", password="password123")
@@ -315,3 +369,1796 @@ class TodoAppTests(TestCase):
         response = self.client.get(reverse('todo'))
         response = self.client.post(reverse('logout'))
         self.assertRedirects(response, reverse('login'))   
+
+@override_settings(TODO_PAGE_SIZE=2)
+class TodoPaginationTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.client.login(username="testuser", password="password123")
+        self.open_tasks = [Todo.objects.create(title=f"Open {i}", user=self.user) for i in range(3)]
+        self.done_tasks = [Todo.objects.create(title=f"Done {i}", user=self.user, completed=True) for i in range(2)]
+
+    def cursor(self, todo):
+        return f'{int(todo.completed)}-{todo.position}-{todo.id}'
+
+    def test_first_page_is_limited(self):
+        """Only one page of todos is rendered, with a cursor to the next page"""
+        response = self.client.get(reverse('todo'))
+        self.assertEqual(response.context['todos'], self.open_tasks[:2])
+        self.assertEqual(response.context['next_cursor'], self.cursor(self.open_tasks[1]))
+        self.assertContains(response, 'Next page')
+
+    def test_cursor_walks_open_then_done(self):
+        """Following the cursor continues from open todos into done todos"""
+        response = self.client.get(reverse('todo'), {'after': self.cursor(self.open_tasks[1])})
+        self.assertEqual(response.context['todos'], [self.open_tasks[2], self.done_tasks[0]])
+        response = self.client.get(reverse('todo'), {'after': response.context['next_cursor']})
+        self.assertEqual(response.context['todos'], [self.done_tasks[1]])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_filter_modes(self):
+        """The open and done filters only list matching todos"""
+        response = self.client.get(reverse('todo'), {'filter': 'done'})
+        self.assertEqual(response.context['todos'], self.done_tasks)
+        response = self.client.get(reverse('todo'), {'filter': 'open', 'after': self.cursor(self.open_tasks[0])})
+        self.assertEqual(response.context['todos'], self.open_tasks[1:])
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        response = self.client.get(reverse('todo'), {'after': 'garbage', 'filter': 'bogus'})
+        self.assertEqual(response.context['filter'], 'all')
+        self.assertEqual(response.context['todos'], self.open_tasks[:2])
+
+class TodoFragmentCacheTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.client.login(username="testuser", password="password123")
+        self.task = Todo.objects.create(title="Cached Task", user=self.user)
+
+    def test_second_view_is_served_from_cache(self):
+        """A repeated view renders the list without querying the todos"""
+        before = fragment_cache_stats()
+        self.client.get(reverse('todo'))
+        response = self.client.get(reverse('todo'))
+        after = fragment_cache_stats()
+        self.assertNotIn('todos', response.context)
+        self.assertContains(response, 'Cached Task')
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_cached_fragment_uses_request_csrf_token(self):
+        """The cached list carries each session's own CSRF token, never the placeholder"""
+        self.client.get(reverse('todo'))
+        other = Client(enforce_csrf_checks=True)
+        other.login(username="testuser", password="password123")
+        response = other.get(reverse('todo'))
+        self.assertNotContains(response, CSRF_PLACEHOLDER)
+        token = response.context['csrf_token']
+        response = other.post(reverse('toggle_task', args=[self.task.id]), {'csrfmiddlewaretoken': str(token)})
+        self.assertEqual(response.status_code, 302)
+
+    def test_writes_invalidate_cached_list(self):
+        """Adding, toggling and deleting todos bump the list version"""
+        self.client.get(reverse('todo'))
+        self.client.post(reverse('add_task'), {'title': 'Fresh Task'})
+        self.assertContains(self.client.get(reverse('todo')), 'Fresh Task')
+        self.client.post(reverse('toggle_task', args=[self.task.id]))
+        self.assertContains(self.client.get(reverse('todo')), 'Completed')
+        self.client.post(reverse('delete_task', args=[self.task.id]))
+        self.assertNotContains(self.client.get(reverse('todo')), 'Cached Task')
+
+    def test_write_during_load_is_not_cached_as_current(self):
+        """A list loaded before a concurrent write is stored under the version that write replaced"""
+        request = RequestFactory().get(reverse('todo'))
+        request.user = self.user
+
+        def load():
+            return _page_context(list(Todo.objects.filter(user=self.user)), 'all', None, 50)
+
+        def load_then_write():
+            context = load()
+            self.client.post(reverse('add_task'), {'title': 'Racing Task'})
+            return context
+
+        html, _ = cached_todo_list(request, ('race',), load_then_write)
+        self.assertNotIn('Racing Task', html)
+        html, _ = cached_todo_list(request, ('race',), load)
+        self.assertIn('Racing Task', html)
+
+class BulkTaskTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other_user = User.objects.create_user(username="otheruser", password="password123")
+        self.client.login(username="testuser", password="password123")
+        self.tasks = [Todo.objects.create(title=f"Task {i}", user=self.user) for i in range(3)]
+        self.other_task = Todo.objects.create(title="Other Task", user=self.other_user)
+
+    def test_bulk_add_creates_one_task_per_line(self):
+        """Every non-blank line becomes a task owned by the current user"""
+        response = self.client.post(reverse('bulk_add_tasks'), {'titles': 'First\n\nSecond\n'})
+        self.assertRedirects(response, reverse('todo'))
+        self.assertEqual(
+            list(Todo.objects.filter(user=self.user, title__in=['First', 'Second']).values_list('title', flat=True)),
+            ['First', 'Second'],
+        )
+
+    def test_bulk_add_rejects_invalid_rows(self):
+        """Invalid titles are reported per line and nothing is created"""
+        response = self.client.post(reverse('bulk_add_tasks'), {'titles': 'Fine\n' + 'x' * 300})
+        self.assertContains(response, 'Task 2: Ensure this field has no more than 255 characters.')
+        self.assertFalse(Todo.objects.filter(title='Fine').exists())
+
+    def test_bulk_toggle_uses_one_update(self):
+        """Each selected task is flipped and other users' tasks are untouched"""
+        self.tasks[0].completed = True
+        self.tasks[0].save()
+        ids = [self.tasks[0].id, self.tasks[1].id, self.other_task.id]
+        response = self.client.post(reverse('bulk_toggle_tasks'), {'task_ids': ids})
+        self.assertRedirects(response, reverse('todo'))
+        self.tasks[0].refresh_from_db()
+        self.tasks[1].refresh_from_db()
+        self.other_task.refresh_from_db()
+        self.assertFalse(self.tasks[0].completed)
+        self.assertTrue(self.tasks[1].completed)
+        self.assertFalse(self.other_task.completed)
+
+    def test_bulk_delete_only_deletes_own_tasks(self):
+        ids = [task.id for task in self.tasks[:2]] + [self.other_task.id]
+        response = self.client.post(reverse('bulk_delete_tasks'), {'task_ids': ids})
+        self.assertRedirects(response, reverse('todo'))
+        self.assertEqual(list(Todo.objects.filter(user=self.user)), [self.tasks[2]])
+        self.assertTrue(Todo.objects.filter(id=self.other_task.id).exists())
+
+    def test_bulk_actions_without_selection_do_nothing(self):
+        response = self.client.post(reverse('bulk_delete_tasks'))
+        self.assertRedirects(response, reverse('todo'))
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 3)
+
+class TodoMutationTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other_user = User.objects.create_user(username="otheruser", password="password123")
+        self.client.login(username="testuser", password="password123")
+        self.task = Todo.objects.create(title="Task", user=self.user)
+        self.other_task = Todo.objects.create(title="Other Task", user=self.other_user)
+
+    def test_toggle_is_a_single_update(self):
+        """Toggling flips the stored value in one statement rather than read-then-write"""
+        with self.assertNumQueries(1):
+            changed = Todo.objects.owned_by(self.user).filter(id=self.task.id).toggle_completed()
+        self.assertEqual(changed, 1)
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.completed)
+        Todo.objects.owned_by(self.user).filter(id=self.task.id).toggle_completed()
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.completed)
+
+    def test_toggle_and_delete_other_users_task_is_404(self):
+        """A zero rowcount on another user's task maps to a 404 and leaves it untouched"""
+        response = self.client.post(reverse('toggle_task', args=[self.other_task.id]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(reverse('delete_task', args=[self.other_task.id]))
+        self.assertEqual(response.status_code, 404)
+        self.other_task.refresh_from_db()
+        self.assertFalse(self.other_task.completed)
+
+    def test_edit_other_users_task_is_404(self):
+        response = self.client.post(reverse('add_task'), {'task_id': self.other_task.id, 'title': 'Stolen'})
+        self.assertEqual(response.status_code, 404)
+        self.other_task.refresh_from_db()
+        self.assertEqual(self.other_task.title, 'Other Task')
+
+class TodoApiTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other_user = User.objects.create_user(username="otheruser", password="password123")
+        self.client.login(username="testuser", password="password123")
+        self.task = Todo.objects.create(title="Task 1", description="Description 1", user=self.user)
+        self.other_task = Todo.objects.create(title="Other Task", user=self.other_user)
+        self.list_url = reverse('todo-api-list')
+
+    def test_list_is_scoped_to_user(self):
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.task.id])
+
+    def test_sparse_fieldsets(self):
+        """Only the requested fields are returned"""
+        response = self.client.get(self.list_url, {'fields': 'id,title'})
+        self.assertEqual(response.json()['results'], [{'id': self.task.id, 'title': 'Task 1'}])
+        response = self.client.get(reverse('todo-api-detail', args=[self.task.id]), {'fields': 'completed'})
+        self.assertEqual(response.json(), {'completed': False})
+
+    def test_sparse_fieldsets_reject_unknown_fields(self):
+        """Unknown names are a 400 naming them rather than a list of empty objects"""
+        response = self.client.get(self.list_url, {'fields': 'id,bogus,owner'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown fields: bogus, owner.']})
+
+    def test_sparse_fieldsets_do_not_apply_to_writes(self):
+        """An update loads the whole todo once instead of each deferred field on its own"""
+        url = reverse('todo-api-detail', args=[self.task.id])
+        with CaptureQueriesContext(connection) as plain:
+            self.client.patch(url, {'title': 'Plain'}, content_type='application/json')
+        with CaptureQueriesContext(connection) as sparse:
+            response = self.client.patch(f'{url}?fields=title', {'title': 'Sparse'}, content_type='application/json')
+        self.assertEqual(len(sparse), len(plain))
+        self.assertEqual(response.json()['completed'], False)
+
+    def test_unchanged_list_returns_304(self):
+        """A matching If-None-Match skips the list entirely until the user writes"""
+        response = self.client.get(self.list_url)
+        etag = response['ETag']
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.client.post(self.list_url, {'title': 'New Task'})
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_create_partial_update_and_destroy(self):
+        response = self.client.post(self.list_url, {'title': 'Created'})
+        self.assertEqual(response.status_code, 201)
+        created = Todo.objects.get(id=response.json()['id'])
+        self.assertEqual(created.user, self.user)
+
+        detail_url = reverse('todo-api-detail', args=[created.id])
+        response = self.client.patch(detail_url, {'completed': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        created.refresh_from_db()
+        self.assertTrue(created.completed)
+
+        self.assertEqual(self.client.put(detail_url, {'title': 'x'}, content_type='application/json').status_code, 405)
+        self.assertEqual(self.client.delete(detail_url).status_code, 204)
+        self.assertFalse(Todo.objects.filter(id=created.id).exists())
+
+    def test_other_users_task_is_not_found(self):
+        response = self.client.get(reverse('todo-api-detail', args=[self.other_task.id]))
+        self.assertEqual(response.status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.list_url).status_code, 403)
+
+
+class AsyncUrlconf:
+    urlpatterns = [path('auth/', include(get_urlpatterns(use_async_views=True)))]
+
+@override_settings(ROOT_URLCONF=AsyncUrlconf)
+class AsyncTodoViewTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other_user = User.objects.create_user(username="otheruser", password="password123")
+        self.task = Todo.objects.create(title="Task 1", description="Description 1", user=self.user)
+        self.other_task = Todo.objects.create(title="Other Task", user=self.other_user)
+
+    async def test_todo_page_requires_login(self):
+        response = await self.async_client.get(reverse('todo'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('next=/auth/todo/', response.url)
+
+    async def test_todo_page_lists_own_tasks(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo'), {'edit_task_id': self.task.id})
+        self.assertContains(response, "Logged in as: <strong>testuser</strong>", html=True)
+        self.assertContains(response, 'Edit Task')
+        self.assertContains(response, 'Task 1')
+        self.assertNotContains(response, 'Other Task')
+
+    async def test_add_toggle_and_delete(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('add_task'), {'title': 'Async Task'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await Todo.objects.filter(user=self.user, title='Async Task').aexists())
+
+        response = await self.async_client.post(reverse('toggle_task', args=[self.task.id]))
+        self.assertEqual(response.status_code, 302)
+        await self.task.arefresh_from_db()
+        self.assertTrue(self.task.completed)
+
+        response = await self.async_client.post(reverse('delete_task', args=[self.task.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await Todo.objects.filter(id=self.task.id).aexists())
+
+    async def test_fragment_cache_is_not_used_on_the_event_loop(self):
+        """The async views reach the fragment cache through its async API only"""
+        cache = caches['todo_fragments']
+        loop_calls = []
+
+        def off_loop(method):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    loop_calls.append(method.__name__)
+                except RuntimeError:
+                    pass
+                return method(*args, **kwargs)
+            return wrapper
+
+        for name in ('get', 'set', 'get_or_set', 'incr'):
+            setattr(cache, name, off_loop(getattr(cache, name)))
+        try:
+            await self.async_client.aforce_login(self.user)
+            await self.async_client.get(reverse('todo'))
+            await self.async_client.post(reverse('add_task'), {'title': 'Async Task'})
+            response = await self.async_client.get(reverse('todo'))
+        finally:
+            for name in ('get', 'set', 'get_or_set', 'incr'):
+                delattr(cache, name)
+        self.assertContains(response, 'Async Task')
+        self.assertEqual(loop_calls, [])
+
+    async def test_other_users_task_is_404(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('toggle_task', args=[self.other_task.id]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('todo'), {'edit_task_id': self.other_task.id})
+        self.assertEqual(response.status_code, 404)
+
+class BenchHelperTests(TestCase):
+    def test_percentiles(self):
+        samples = [i / 1000 for i in range(1, 101)]
+        summary = summarize(samples, elapsed=2)
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['requests_per_sec'], 50)
+        self.assertEqual(summary['p50_ms'], 50)
+        self.assertEqual(summary['p99_ms'], 99)
+        self.assertEqual(summarize([], elapsed=0)['p99_ms'], 0)
+
+    def test_load_mix(self):
+        """
+        The load mix is parsed from view=weight pairs and drives the request draw.
+        """
+        mix = parse_mix('todo_page=3, add_task=1, delete_task=0')
+        self.assertEqual(mix, {'todo_page': 3, 'add_task': 1, 'delete_task': 0})
+        workload = load_workload(mix, 200)
+        self.assertEqual(set(workload), {'todo_page', 'add_task'})
+        self.assertGreater(workload.count('todo_page'), workload.count('add_task'))
+        self.assertEqual(workload, load_workload(mix, 200))
+        for spec in ('search=1', 'todo_page=x', 'todo_page=-1', 'todo_page=0'):
+            with self.assertRaises(ValueError):
+                parse_mix(spec)
+
+    @skipUnless(bench.resource, 'needs the resource module')
+    def test_max_rss_units(self):
+        """ru_maxrss is read as bytes on macOS and as kilobytes elsewhere, whatever its size"""
+        usage = SimpleNamespace(ru_maxrss=50 * 1024 * 1024)
+        with mock.patch.object(bench.resource, 'getrusage', return_value=usage):
+            with mock.patch.object(sys, 'platform', 'darwin'):
+                self.assertEqual(bench._max_rss_kb(), 50 * 1024)
+            with mock.patch.object(sys, 'platform', 'linux'):
+                self.assertEqual(bench._max_rss_kb(), 50 * 1024 * 1024)
+
+class BenchLoadTests(TransactionTestCase):
+    def test_load_adds_after_seeded_todos(self):
+        """A small `bench load` run succeeds, appending after the seeded todos"""
+        out = StringIO()
+        call_command(
+            'bench', 'load', '--users', '1', '--todos', '3', '--requests', '12', '--concurrency', '1',
+            '--mix', 'todo_page=1,add_task=1,toggle_task=1', stdout=out,
+        )
+        views = json.loads(out.getvalue())['views']
+        self.assertEqual(views['add_task']['status_codes'], {'302': views['add_task']['requests']})
+        self.assertEqual(set(views['todo_page']['status_codes']), {'200'})
+        self.assertFalse(User.objects.filter(username__startswith='bench-user-').exists())
+
+    def test_bench_deletes_only_its_own_users(self):
+        """Accounts that merely look like bench users are left alone"""
+        user = User.objects.create_user(username=f'{bench.BENCH_USER_PREFIX}0', password="password123")
+        lookalike = User.objects.create_user(username='bench-user-1', password="password123")
+        Todo.objects.create(title='Keep me', user=user)
+        call_command('bench', 'signup', '--signups', '1', stdout=StringIO())
+        self.assertEqual(set(User.objects.values_list('id', flat=True)), {user.id, lookalike.id})
+        self.assertTrue(Todo.objects.filter(user=user).exists())
+
+class TodoSearchTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other_user = User.objects.create_user(username="otheruser", password="password123")
+        self.client.login(username="testuser", password="password123")
+        self.client.post(reverse('add_task'), {'title': 'Buy milk', 'description': 'Whole milk from the market'})
+        self.client.post(reverse('add_task'), {'title': 'Market research', 'description': 'Compare milk prices'})
+        self.milk = Todo.objects.get(title='Buy milk')
+        self.research = Todo.objects.get(title='Market research')
+        index_new_todos([Todo.objects.create(title='Buy milk', user=self.other_user)])
+
+    def test_ranks_title_matches_first(self):
+        """Title hits outweigh description hits and other users' todos never match"""
+        self.assertEqual(search(self.user, 'milk'), [self.milk, self.research])
+        self.assertEqual(search(self.user, 'market'), [self.research, self.milk])
+
+    def test_all_terms_must_match_and_last_is_prefix(self):
+        self.assertEqual(search(self.user, 'compare mil'), [self.research])
+        self.assertEqual(search(self.user, 'mar'), [self.research, self.milk])
+        self.assertEqual(search(self.user, 'milk nothing'), [])
+        self.assertEqual(search(self.user, '  '), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.client.post(reverse('add_task'), {'task_id': self.milk.id, 'title': 'Buy bread'})
+        self.assertEqual(search(self.user, 'bread'), [self.milk])
+        self.assertEqual(search(self.user, 'whole'), [])
+        self.assertEqual(TodoTerm.objects.filter(todo_id=self.milk.id).count(), 2)
+
+        self.client.post(reverse('delete_task', args=[self.milk.id]))
+        self.assertEqual(search(self.user, 'bread'), [])
+        self.assertFalse(TodoTerm.objects.filter(todo_id=self.milk.id).exists())
+
+    def test_bulk_paths_keep_index(self):
+        self.client.post(reverse('bulk_add_tasks'), {'titles': 'Walk dog\nFeed dog'})
+        self.assertEqual(len(search(self.user, 'dog')), 2)
+        ids = [todo.id for todo in search(self.user, 'dog')]
+        self.client.post(reverse('bulk_delete_tasks'), {'task_ids': ids})
+        self.assertEqual(search(self.user, 'dog'), [])
+
+    def test_search_page(self):
+        response = self.client.get(reverse('search_tasks'), {'q': 'milk'})
+        self.assertContains(response, 'Results for "milk"')
+        self.assertContains(response, f'?edit_task_id={self.milk.id}')
+
+    def test_reindex_command(self):
+        TodoTerm.objects.all().delete()
+        call_command('reindex_todos', stdout=StringIO())
+        self.assertEqual(search(self.user, 'milk'), [self.milk, self.research])
+
+    def test_reindex_replaces_terms_batch_by_batch(self):
+        """Stale and orphaned terms are replaced one batch of todo ids at a time"""
+        TodoTerm.objects.filter(todo=self.milk).update(term='stale')
+        TodoTerm.objects.create(user=self.user, todo_id=10 ** 6, term='milk')
+        with CaptureQueriesContext(connection) as queries:
+            call_command('reindex_todos', batch_size=1, stdout=StringIO())
+        self.assertFalse(TodoTerm.objects.filter(term='stale').exists())
+        self.assertFalse(TodoTerm.objects.filter(todo_id=10 ** 6).exists())
+        self.assertEqual(search(self.user, 'milk'), [self.milk, self.research])
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), Todo.objects.count() + 1)
+
+class HashingPoolTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+
+    def test_pool_rejects_when_full(self):
+        """Submissions beyond workers + queue are rejected instead of queueing without bound"""
+        pool = HashingPool(workers=1, max_queue=1)
+        release = threading.Event()
+        try:
+            pool.submit(release.wait)
+            pool.submit(release.wait)
+            self.assertEqual(pool.stats()['queue_depth'], 1)
+            with self.assertRaises(PoolSaturated):
+                pool.submit(release.wait)
+            self.assertEqual(pool.stats()['rejected'], 1)
+        finally:
+            release.set()
+            pool.shutdown()
+
+    def test_login_hashes_on_pool(self):
+        completed = get_pool().stats()['completed']
+        response = self.client.post(reverse('login'), {'username': 'testuser', 'password': 'password123'})
+        self.assertRedirects(response, reverse('todo'), fetch_redirect_response=False)
+        self.assertGreater(get_pool().stats()['completed'], completed)
+
+    @override_settings(TODO_HASHING_POOL={'WORKERS': 1, 'MAX_QUEUE': 0})
+    def test_login_and_signup_get_429_when_pool_is_full(self):
+        release = threading.Event()
+        get_pool().submit(release.wait)
+        try:
+            response = self.client.post(reverse('login'), {'username': 'testuser', 'password': 'password123'})
+            self.assertContains(response, 'Too many sign-ins right now', status_code=429)
+            response = self.client.post(reverse('signup'), {
+                'username': 'newuser',
+                'email': 'newuser@example.com',
+                'password1': 'password123',
+                'password2': 'password123',
+            })
+            self.assertContains(response, 'Too many sign-ins right now', status_code=429)
+            self.assertFalse(User.objects.filter(username='newuser').exists())
+        finally:
+            release.set()
+
+    def test_metrics_are_staff_only(self):
+        self.client.login(username="testuser", password="password123")
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username="testuser", password="password123")
+        response = self.client.get(reverse('metrics'))
+        self.assertIn('queue_depth', response.json()['hashing_pool'])
+        self.assertIn('hits', response.json()['fragment_cache'])
+
+@override_settings(ROOT_URLCONF=AsyncUrlconf)
+class AsyncLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+
+    async def test_async_login(self):
+        response = await self.async_client.post(reverse('login'), {'username': 'testuser', 'password': 'password123'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse('todo'))
+        response = await self.async_client.post(reverse('login'), {'username': 'testuser', 'password': 'wrong'})
+        self.assertContains(response, "Invalid username or password.")
+
+class SignupQueryTests(TestCase):
+    data = {
+        'username': 'newuser',
+        'email': 'newuser@example.com',
+        'password1': 'password123',
+        'password2': 'password123',
+    }
+
+    def test_signup_is_one_lookup_and_one_insert(self):
+        """Username and email uniqueness share one query, followed by the insert"""
+        serializer = SignupSerializer(data=self.data)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            user = serializer.save()
+        statements = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[0].startswith('SELECT'))
+        self.assertTrue(statements[1].startswith('INSERT'))
+        self.assertTrue(user.check_password('password123'))
+
+    def test_duplicate_username_and_email_reported_together(self):
+        User.objects.create_user(username='newuser', email='newuser@example.com', password='password123')
+        serializer = SignupSerializer(data=self.data)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['username'][0], "A user with that username already exists.")
+        self.assertEqual(serializer.errors['email'][0], "A user with this email already exists")
+
+    def test_race_on_email_maps_integrity_error(self):
+        """A clash that slips past validation is caught by the unique index and reported on the field"""
+        serializer = SignupSerializer(data=self.data)
+        self.assertTrue(serializer.is_valid())
+        User.objects.create_user(username='racer', email='newuser@example.com', password='password123')
+        with self.assertRaises(ValidationError) as ctx:
+            serializer.save()
+        self.assertEqual(ctx.exception.detail['email'][0], "A user with this email already exists")
+
+    def test_username_clash_is_case_sensitive(self):
+        """A case variant of a taken username is free, whatever the email"""
+        User.objects.create_user(username='NewUser', email='first@example.com', password='password123')
+        self.assertTrue(SignupSerializer(data=self.data).is_valid())
+        serializer = SignupSerializer(data={**self.data, 'email': 'FIRST@example.com'})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(set(serializer.errors), {'email'})
+
+    def test_email_clash_ignores_case(self):
+        User.objects.create_user(username='first', email='NewUser@Example.com', password='password123')
+        with CaptureQueriesContext(connection) as queries:
+            serializer = SignupSerializer(data=self.data)
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(serializer.errors['email'][0], "A user with this email already exists")
+
+    def test_email_constraint_needs_expression_indexes(self):
+        """The migration refuses a database that would silently skip the constraint"""
+        migration = import_module('tasks.migrations.0009_auth_user_email_unique')
+        features = SimpleNamespace(supports_expression_indexes=False)
+        schema_editor = SimpleNamespace(connection=SimpleNamespace(features=features, alias='default'))
+        with self.assertRaisesMessage(CommandError, 'cannot enforce unique emails'):
+            migration.add_email_unique_constraint(None, schema_editor)
+
+    def test_blank_emails_do_not_clash(self):
+        User.objects.create_user(username='first')
+        User.objects.create_user(username='second')
+        self.assertEqual(User.objects.filter(email='').count(), 2)
+
+    def test_signup_view_logs_in_created_user(self):
+        response = self.client.post(reverse('signup'), self.data)
+        self.assertRedirects(response, reverse('login'))
+        self.assertEqual(int(self.client.session['_auth_user_id']), User.objects.get(username='newuser').id)
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        Todo.objects.create(title="Task 1", user=self.user)
+        self.client.login(username="testuser", password="password123")
+
+    def test_warm_todo_page_needs_no_queries(self):
+        """Session, user and rendered list all come from the cache once warm"""
+        self.client.get(reverse('todo'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('todo'))
+        self.assertContains(response, "Logged in as: <strong>testuser</strong>", html=True)
+
+    @override_settings(TODO_USER_CACHE=None)
+    def test_user_cache_can_be_disabled(self):
+        self.client.get(reverse('todo'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('todo'))
+
+    def test_user_save_invalidates_record(self):
+        self.client.get(reverse('todo'))
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertContains(self.client.get(reverse('todo')), "Logged in as: <strong>renamed</strong>", html=True)
+
+    def test_password_change_ends_cached_sessions(self):
+        self.client.get(reverse('todo'))
+        self.user.set_password("newpassword123")
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('todo')).status_code, 302)
+
+    def test_record_has_no_password_hash(self):
+        """Only the session auth hash derived from the password is cached"""
+        self.client.get(reverse('todo'))
+        values, session_auth_hash = caches['default'].get(f'todo-user:{self.user.id}')
+        self.assertNotIn(self.user.password, values)
+        self.assertEqual(session_auth_hash, self.user.get_session_auth_hash())
+
+    def test_logout_drops_record(self):
+        self.client.get(reverse('todo'))
+        self.assertIsNotNone(caches['default'].get(f'todo-user:{self.user.id}'))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(caches['default'].get(f'todo-user:{self.user.id}'))
+
+class CacheCheckTests(SimpleTestCase):
+    def errors(self):
+        return [error.id for error in run_checks(tags=['caches'], include_deployment_checks=True) if error.id.startswith('tasks.')]
+
+    def test_user_cache_must_be_shared_outside_debug(self):
+        """A per-process user cache is rejected by the deploy checks unless DEBUG is on"""
+        with override_settings(DEBUG=False):
+            self.assertIn('tasks.E001', self.errors())
+            with override_settings(TODO_USER_CACHE=None):
+                self.assertNotIn('tasks.E001', self.errors())
+        with override_settings(DEBUG=True):
+            self.assertNotIn('tasks.E001', self.errors())
+        self.assertNotIn('tasks.E001', [error.id for error in run_checks()])
+
+    def test_fragment_cache_must_be_shared_outside_debug(self):
+        """A per-process fragment cache is rejected by the deploy checks unless DEBUG is on"""
+        shared = {**settings.CACHES, 'todo_fragments': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'todo_fragments'}}
+        with override_settings(DEBUG=False):
+            self.assertIn('tasks.E002', self.errors())
+            with override_settings(CACHES=shared):
+                self.assertNotIn('tasks.E002', self.errors())
+        with override_settings(DEBUG=True):
+            self.assertNotIn('tasks.E002', self.errors())
+
+    def test_shard_cache_must_be_shared_when_sharded(self):
+        """With more than one shard, a per-process shard cache is rejected by the deploy checks unless DEBUG is on"""
+        sharded = {'ALIASES': ['default', 'shard1'], 'CACHE': 'default'}
+        with override_settings(DEBUG=False):
+            self.assertNotIn('tasks.E003', self.errors())
+            with override_settings(TODO_SHARDS=sharded):
+                self.assertIn('tasks.E003', self.errors())
+        with override_settings(DEBUG=True, TODO_SHARDS=sharded):
+            self.assertNotIn('tasks.E003', self.errors())
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        pool = ConnectionPool(lambda: sqlite3.connect(':memory:', check_same_thread=False), **kwargs)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_connections_are_reused(self):
+        """
+        A returned connection is handed out again instead of opening a new one.
+        """
+        pool = self.make_pool(max_size=2)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertIs(pool.checkout(), conn)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['checkouts'], stats['in_use']), (1, 2, 1))
+
+    def test_checkout_times_out_when_exhausted(self):
+        """
+        Checking out from a full pool raises PoolTimeout after TIMEOUT seconds.
+        """
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiter_gets_returned_connection(self):
+        """
+        A blocked checkout picks up the connection another thread returns.
+        """
+        pool = self.make_pool(max_size=1, timeout=5)
+        conn = pool.checkout()
+        threading.Timer(0.05, pool.checkin, args=[conn]).start()
+        self.assertIs(pool.checkout(), conn)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_dead_connection_is_replaced_after_failed_ping(self):
+        """
+        An idle connection that fails the pre-ping is discarded and replaced.
+        """
+        pool = self.make_pool(max_size=1)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        conn.close()
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(pool.stats()['failed_pings'], 1)
+
+    def test_idle_connections_are_evicted_down_to_min_size(self):
+        """
+        Connections idle for longer than MAX_IDLE are closed, keeping MIN_SIZE.
+        """
+        pool = self.make_pool(max_size=3, min_size=1, max_idle=0)
+        conns = [pool.checkout() for _ in range(3)]
+        for conn in conns:
+            pool.checkin(conn)
+        pool.checkin(pool.checkout())
+        stats = pool.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['evicted'], 2)
+
+    def test_pooled_sqlite_backend_returns_connection_on_close(self):
+        """
+        The pooled backend returns its connection on close and reuses it next time.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings_dict = {
+                **connection.settings_dict,
+                'ENGINE': 'tasks.db.backends.sqlite3',
+                'NAME': os.path.join(tmpdir, 'pooled.sqlite3'),
+                'POOL': {'MAX_SIZE': 2},
+            }
+            wrapper = PooledSqliteWrapper(settings_dict, alias='pooled-test')
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            raw = wrapper.connection
+            wrapper.close()
+            self.assertEqual(wrapper.pool.stats()['idle'], 1)
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            self.assertIs(wrapper.connection, raw)
+            wrapper.close()
+            wrapper.pool.close_all()
+
+
+def n_plus_one_view(request):
+    titles = [Todo.objects.get(id=todo_id).title for todo_id in Todo.objects.values_list('id', flat=True)]
+    return HttpResponse(', '.join(titles))
+
+class NPlusOneUrlconf:
+    urlpatterns = [
+        path('auth/', include(get_urlpatterns())),
+        path('n-plus-one/', n_plus_one_view, name='n_plus_one'),
+    ]
+
+@override_settings(TODO_SERVER_TIMING={'ENABLED': True, 'SLOW_REQUEST_MS': 10_000, 'REPEATED_QUERY_THRESHOLD': 3})
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        reset_timing_stats()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.client.force_login(self.user)
+
+    def test_server_timing_header(self):
+        """
+        The todo page reports its SQL, template, middleware and total time.
+        """
+        response = self.client.get(reverse('todo'))
+        header = response['Server-Timing']
+        for metric in ('db;dur=', 'queries"', 'tpl;dur=', 'mw;dur=', 'total;dur='):
+            self.assertIn(metric, header)
+        tpl = float(header.split('tpl;dur=')[1].split(',')[0])
+        self.assertGreater(tpl, 0)
+
+    @override_settings(TODO_SERVER_TIMING={'ENABLED': False})
+    def test_disabled_by_setting(self):
+        """
+        Without TODO_SERVER_TIMING['ENABLED'] the middleware is left out entirely.
+        """
+        self.assertNotIn('Server-Timing', self.client.get(reverse('todo')))
+
+    @override_settings(ROOT_URLCONF=NPlusOneUrlconf)
+    def test_repeated_queries_are_flagged_by_url_name(self):
+        """
+        A query repeated REPEATED_QUERY_THRESHOLD times in one request is logged and counted per URL name.
+        """
+        for n in range(3):
+            Todo.objects.create(title=f"Task {n}", user=self.user)
+        with self.assertLogs('tasks.timing', 'WARNING') as logs:
+            self.client.get('/n-plus-one/')
+        self.assertIn('Possible N+1 in n_plus_one', logs.output[0])
+        [repeated] = timing_stats()['repeated_queries']
+        self.assertEqual((repeated['url_name'], repeated['requests'], repeated['max_repeats']), ('n_plus_one', 1, 3))
+
+    def test_repeated_queries_kept_are_capped(self):
+        """Only KEEP_REPEATED repeated queries are kept, dropping those seen in the fewest requests"""
+        options = {**SERVER_TIMING_DEFAULTS, 'KEEP_REPEATED': 2}
+        request = SimpleNamespace(method='GET', path='/n-plus-one/', resolver_match=None)
+        response = HttpResponse()
+        with self.assertLogs('tasks.timing', 'WARNING'):
+            for sql in ('SELECT 1', 'SELECT 1', 'SELECT 2', 'SELECT 3', 'SELECT 4'):
+                timings = RequestTimings()
+                timings.queries[sql] = 5
+                record_request(request, response, timings, 0, options)
+        kept = [(repeated['sql'], repeated['requests']) for repeated in timing_stats()['repeated_queries']]
+        self.assertEqual(kept, [('SELECT 1', 2), ('SELECT 4', 1)])
+
+    @override_settings(TODO_SERVER_TIMING={'ENABLED': True, 'SLOW_REQUEST_MS': 0, 'KEEP_SLOWEST': 2})
+    def test_slow_requests_are_logged_and_kept(self):
+        """
+        Requests over SLOW_REQUEST_MS are logged and the slowest ones are kept for the metrics view.
+        """
+        with self.assertLogs('tasks.timing', 'WARNING') as logs:
+            for _ in range(3):
+                self.client.get(reverse('todo'))
+        self.assertEqual(len(logs.output), 3)
+        self.assertIn('Slow request GET /auth/todo/ (todo)', logs.output[0])
+        slowest = timing_stats()['slowest']
+        self.assertEqual(len(slowest), 2)
+        self.assertGreaterEqual(slowest[0]['total_ms'], slowest[1]['total_ms'])
+
+
+class StaticUrlconf:
+    urlpatterns = [
+        path('auth/', include(get_urlpatterns())),
+        re_path(r'^static/(?P<path>.*)$', serve_static),
+    ]
+
+class StaticAssetTests(TestCase):
+    def test_pages_link_shared_assets(self):
+        """
+        Styles and scripts are linked from tasks/static instead of inlined in every page.
+        """
+        response = self.client.get(reverse('login'))
+        self.assertContains(response, '/static/tasks/login.css')
+        self.assertContains(response, '/static/tasks/errors.js')
+        self.assertNotContains(response, '<style>')
+
+    def test_html_is_compressed(self):
+        """
+        HTML responses are gzipped for clients that accept it.
+        """
+        response = self.client.get(reverse('signup'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'tasks/signup.css', gzip.decompress(response.content))
+
+    @override_settings(ROOT_URLCONF=StaticUrlconf)
+    def test_collectstatic_hashes_and_precompresses(self):
+        """
+        collectstatic writes hashed, precompressed files that are served with far-future cache headers.
+        """
+        with tempfile.TemporaryDirectory() as static_root, override_settings(
+            STATIC_ROOT=static_root,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'tasks.storage.CompressedManifestStaticFilesStorage'}},
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            hashed = staticfiles_storage.stored_name('tasks/todo.css')
+            self.assertRegex(hashed, r'^tasks/todo\.[0-9a-f]{12}\.css$')
+            with open(os.path.join(static_root, hashed), 'rb') as plain, gzip.open(os.path.join(static_root, hashed + '.gz')) as compressed:
+                self.assertEqual(compressed.read(), plain.read())
+
+            response = self.client.get(f'/static/{hashed}', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('max-age=31536000', response['Cache-Control'])
+            self.assertIn('Accept-Encoding', response['Vary'])
+            response.close()
+
+            response = self.client.get('/static/tasks/todo.css')
+            self.assertNotIn('Content-Encoding', response)
+            self.assertIn('max-age=60', response['Cache-Control'])
+            response.close()
+
+            self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+
+class TodoExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        other_user = User.objects.create_user(username="otheruser", password="password123")
+        self.todos = [
+            Todo.objects.create(title='Buy milk', description='Whole, "fresh"\nmilk', user=self.user),
+            Todo.objects.create(title='Call mum', completed=True, user=self.user),
+            Todo.objects.create(title='Write report', description='', user=self.user),
+        ]
+        Todo.objects.create(title='Not mine', user=other_user)
+        self.client.login(username="testuser", password="password123")
+
+    def test_export_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('export_tasks')).status_code, 302)
+
+    def test_csv_export(self):
+        """
+        The CSV export streams only the user's todos, with a header row.
+        """
+        response = self.client.get(reverse('export_tasks'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="todos.csv"')
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'title', 'description', 'completed'])
+        self.assertEqual(rows[1], [str(self.todos[0].id), 'Buy milk', 'Whole, "fresh"\nmilk', 'False'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Buy milk', 'Call mum', 'Write report'])
+
+    def test_ndjson_gzip_export(self):
+        """
+        The gzip mode compresses the NDJSON export on the fly into a .gz download.
+        """
+        response = self.client.get(reverse('export_tasks'), {'format': 'ndjson', 'gzip': '1'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="todos.ndjson.gz"')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines][1], {
+            'id': self.todos[1].id, 'title': 'Call mum', 'description': None, 'completed': True,
+        })
+        self.assertEqual(len(lines), 3)
+
+    def test_rows_are_read_in_bounded_chunks(self):
+        """
+        Rows are fetched in fixed-size keyset chunks rather than in one query.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(Todo.objects.owned_by(self.user).values_in_chunks('title', chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(chunks[1], [(self.todos[2].id, 'Write report')])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(reverse('export_tasks'), {'format': 'xml'}).status_code, 400)
+
+
+class TodoImportTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.client.login(username="testuser", password="password123")
+
+    def upload(self, name, content, **data):
+        return self.client.post(reverse('import_tasks'), {'file': SimpleUploadedFile(name, content), **data})
+
+    def test_csv_import_reports_row_errors_without_aborting(self):
+        """
+        Valid rows are created and indexed; invalid rows are reported by row number.
+        """
+        content = b'id,title,description,completed\n1,Buy milk,Whole milk,False\n2,,No title,False\n3,Call mum,,True\n'
+        response = self.upload('todos.csv', content)
+        result = response.json()
+        self.assertEqual((result['created'], result['failed']), (2, 1))
+        self.assertEqual(result['errors'][0]['row'], 2)
+        self.assertIn('title', result['errors'][0]['errors'])
+        self.assertIsNone(result['aborted'])
+        self.assertIn('rows_per_sec', result)
+        self.assertEqual(
+            list(Todo.objects.filter(user=self.user).order_by('id').values_list('title', 'completed')),
+            [('Buy milk', False), ('Call mum', True)],
+        )
+        self.assertEqual(search(self.user, 'milk'), [Todo.objects.get(title='Buy milk')])
+
+    def test_csv_blank_optional_cells_are_missing(self):
+        """Blank description and completed cells take the defaults instead of failing the row"""
+        result = self.upload('todos.csv', b'title,description,completed\nBuy milk,,\n').json()
+        self.assertEqual((result['created'], result['failed']), (1, 0))
+        self.assertEqual(
+            list(Todo.objects.filter(user=self.user).values_list('title', 'completed')),
+            [('Buy milk', False)],
+        )
+
+    def test_ndjson_gzip_import_in_batches(self):
+        """
+        NDJSON uploads, gzipped or not, are validated and inserted batch by batch.
+        """
+        lines = [json.dumps({'title': f'Task {n}'}) for n in range(5)] + ['not json', '[1, 2]']
+        content = gzip.compress('\n'.join(lines).encode())
+        self.client.get(reverse('todo'))
+        result = import_todos(self.user, parse_rows(open_upload(BytesIO(content), 'todos.ndjson.gz'), 'ndjson'), batch_size=2)
+        self.assertEqual((result.created, result.failed), (5, 2))
+        self.assertEqual([error['row'] for error in result.errors], [6, 7])
+
+        response = self.upload('todos.ndjson.gz', content)
+        self.assertEqual(response.json()['created'], 5)
+        self.assertContains(self.client.get(reverse('todo')), 'Task 4')
+
+    def test_unreadable_file_keeps_rows_read_so_far(self):
+        """
+        A file that stops decoding part-way keeps the rows before the bad bytes.
+        """
+        content = b'title\n' + b''.join(f'Task {n}\n'.encode() for n in range(3000)) + b'\xff\xfe broken\n'
+        result = import_todos(self.user, parse_rows(open_upload(BytesIO(content), 'todos.csv'), 'csv'), batch_size=500)
+        self.assertGreater(result.created, 0)
+        self.assertLess(result.created, 3000)
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), result.created)
+        self.assertIn('Could not read the file', result.aborted)
+
+    def test_import_requires_a_known_format(self):
+        self.assertEqual(self.upload('todos.txt', b'title\nTask\n').status_code, 400)
+        self.assertEqual(self.upload('todos.txt', b'title\nTask\n', format='csv').json()['created'], 1)
+        self.assertEqual(self.client.post(reverse('import_tasks')).status_code, 400)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as fh:
+            fh.write(b'title,completed\nFrom file,true\n,false\n')
+            fh.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_todos', 'testuser', fh.name, stdout=out, stderr=err)
+        self.assertIn('Imported 1 todos, 1 rows failed', out.getvalue())
+        self.assertIn('Row 2:', err.getvalue())
+        self.assertTrue(Todo.objects.get(title='From file').completed)
+
+
+class TodoArchiveTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.client.login(username="testuser", password="password123")
+        long_ago = timezone.now() - timedelta(days=60)
+        self.old = [Todo.objects.create(title=f'Old chore {n}', completed=True, user=self.user) for n in range(3)]
+        Todo.objects.filter(id__in=[todo.id for todo in self.old]).update(completed_at=long_ago)
+        self.recent = Todo.objects.create(title='Recent chore', completed=True, user=self.user)
+        self.open = Todo.objects.create(title='Open chore', user=self.user)
+        index_new_todos([*self.old, self.recent, self.open])
+
+    def test_completed_at_follows_completed(self):
+        """
+        completed_at is set when a todo is completed and cleared when it is reopened.
+        """
+        self.assertIsNone(self.open.completed_at)
+        self.assertIsNotNone(self.recent.completed_at)
+        self.client.post(reverse('toggle_task', args=[self.open.id]))
+        self.client.post(reverse('toggle_task', args=[self.recent.id]))
+        self.open.refresh_from_db()
+        self.recent.refresh_from_db()
+        self.assertIsNotNone(self.open.completed_at)
+        self.assertIsNone(self.recent.completed_at)
+
+        self.old[0].refresh_from_db()
+        completed_at = self.old[0].completed_at
+        Todo.objects.filter(id=self.old[0].id).update_todo(title='Still done', completed=True)
+        self.old[0].refresh_from_db()
+        self.assertEqual(self.old[0].completed_at, completed_at)
+
+    def test_archive_moves_old_completed_todos_in_batches(self):
+        """
+        Only todos completed before the cutoff move, batch by batch, and leave the search index.
+        """
+        self.client.get(reverse('todo'))
+        out = StringIO()
+        call_command('archive_todos', days=30, batch_size=2, stdout=out)
+        self.assertIn('Archived 3 todos in 2 batches.', out.getvalue())
+        self.assertEqual(set(Todo.objects.values_list('title', flat=True)), {'Recent chore', 'Open chore'})
+        self.assertEqual(
+            sorted(ArchivedTodo.objects.values_list('todo_id', flat=True)),
+            [todo.id for todo in self.old],
+        )
+        self.assertEqual(search(self.user, 'old'), [])
+        self.assertNotContains(self.client.get(reverse('todo')), 'Old chore')
+
+    def test_archived_view_pages_over_archive(self):
+        archive_batch(timezone.now() - timedelta(days=30))
+        with self.settings(TODO_PAGE_SIZE=2):
+            response = self.client.get(reverse('archived_tasks'))
+            self.assertContains(response, 'Old chore 2')
+            self.assertContains(response, 'Old chore 1')
+            self.assertNotContains(response, 'Old chore 0')
+            next_page = response.context['archived_next']
+            response = self.client.get(reverse('archived_tasks'), {'after': next_page})
+        self.assertContains(response, 'Old chore 0')
+        self.assertIsNone(response.context['archived_next'])
+
+
+class TodoCounterTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.client.login(username="testuser", password="password123")
+
+    def assertCountsMatchTable(self):
+        stats = TodoStats.objects.get(user=self.user)
+        todos = Todo.objects.filter(user=self.user)
+        self.assertEqual((stats.total, stats.completed), (todos.count(), todos.filter(completed=True).count()))
+        return stats
+
+    def test_counters_follow_every_write(self):
+        """
+        Adding, editing, toggling, bulk actions, the API and deleting all keep the counters exact.
+        """
+        self.assertContains(self.client.get(reverse('todo')), '0 open / 0 done')
+        self.client.post(reverse('add_task'), {'title': 'One'})
+        self.client.post(reverse('bulk_add_tasks'), {'titles': 'Two\nThree\nFour'})
+        one, two, three, four = Todo.objects.filter(user=self.user).order_by('id')
+        self.assertCountsMatchTable()
+
+        self.client.post(reverse('toggle_task', args=[one.id]))
+        self.client.post(reverse('bulk_toggle_tasks'), {'task_ids': [one.id, two.id, three.id]})
+        self.assertEqual(self.assertCountsMatchTable().completed, 2)
+
+        self.client.post(reverse('add_task'), {'task_id': two.id, 'title': 'Two again'})
+        self.client.patch(reverse('todo-api-detail', args=[four.id]), {'completed': True}, content_type='application/json')
+        self.client.post(reverse('todo-api-list'), {'title': 'Five', 'completed': True})
+        self.assertEqual(self.assertCountsMatchTable().completed, 3)
+
+        self.client.post(reverse('delete_task', args=[three.id]))
+        self.client.post(reverse('bulk_delete_tasks'), {'task_ids': [one.id, four.id]})
+        self.client.delete(reverse('todo-api-detail', args=[two.id]))
+        stats = self.assertCountsMatchTable()
+        self.assertEqual((stats.open, stats.completed), (0, 1))
+        self.assertContains(self.client.get(reverse('todo')), '0 open / 1 done')
+
+    def test_todos_created_directly_are_counted(self):
+        """Creates outside the views (admin, shell) keep the counters right"""
+        todo = Todo.objects.create(title='Done', completed=True, user=self.user)
+        Todo.objects.create_many(self.user, [{'title': 'Open'}, {'title': 'Done too', 'completed': True}])
+        self.assertEqual(self.assertCountsMatchTable().completed, 2)
+        self.client.post(reverse('add_task'), {'task_id': todo.id, 'title': 'Reopened'})
+        stats = self.assertCountsMatchTable()
+        self.assertEqual((stats.open, stats.completed), (2, 1))
+
+    def test_missing_row_is_computed_on_first_read(self):
+        Todo.objects.bulk_create([Todo(title=f'Task {n}', completed=n == 0, user=self.user) for n in range(3)])
+        self.assertFalse(TodoStats.objects.filter(user=self.user).exists())
+        self.assertContains(self.client.get(reverse('todo')), '2 open / 1 done')
+
+    def test_repair_command(self):
+        """
+        The repair command recomputes drifted counters and drops the stale cached list.
+        """
+        Todo.objects.create(title='Task', user=self.user)
+        TodoStats.objects.filter(user=self.user).update(total=7, completed=3)
+        self.assertContains(self.client.get(reverse('todo')), '4 open / 3 done')
+        out = StringIO()
+        call_command('repair_todo_stats', batch_size=1, stdout=out)
+        self.assertIn('Checked 1 users, repaired 1.', out.getvalue())
+        self.assertCountsMatchTable()
+        self.assertContains(self.client.get(reverse('todo')), '1 open / 0 done')
+
+class TodoEventTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.task = Todo.objects.create(title="Task 1", user=self.user)
+
+    def toggle(self, task_id):
+        client = Client()
+        client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse('toggle_task', args=[task_id]))
+
+    async def test_stream_delivers_committed_changes(self):
+        """
+        An open stream receives the user's changes once they commit, as SSE frames.
+        """
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        frames = aiter(response.streaming_content)
+        self.assertIn(b': connected', await anext(frames))
+
+        await sync_to_async(self.toggle)(self.task.id)
+        frame = (await asyncio.wait_for(anext(frames), 5)).decode()
+        self.assertIn('event: todo\n', frame)
+        data = json.loads(frame.split('data: ', 1)[1])
+        self.assertEqual((data['type'], data['ids']), ('toggled', [self.task.id]))
+        await frames.aclose()
+
+    @override_settings(TODO_EVENTS={'HEARTBEAT': 0.01})
+    async def test_idle_stream_sends_keepalives(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo_events'))
+        frames = aiter(response.streaming_content)
+        await anext(frames)
+        self.assertEqual(await asyncio.wait_for(anext(frames), 5), b': keepalive\n\n')
+        await frames.aclose()
+
+    def test_events_need_asgi_and_login(self):
+        self.assertEqual(self.client.get(reverse('todo_events')).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('todo_events')).status_code, 501)
+
+    def test_rolled_back_changes_are_not_published(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            publish_event(self.user.id, 'deleted', ids=[self.task.id])
+        self.assertEqual(len(callbacks), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    publish_event(self.user.id, 'deleted', ids=[self.task.id])
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    async def test_slow_subscriber_is_told_to_reload(self):
+        broker = InProcessBroker(max_queue=2)
+        subscription = broker.subscribe(self.user.id)
+        for task_id in range(3):
+            broker.publish(self.user.id, {'type': 'deleted', 'ids': [task_id]})
+        broker.publish(self.user.id + 1, {'type': 'deleted', 'ids': [0]})
+        await asyncio.sleep(0)
+        self.assertEqual((await subscription.get(1))['type'], 'reset')
+        self.assertIsNone(await subscription.get(0.01))
+        subscription.close()
+        self.assertEqual(broker.stats(), {'users': 0, 'subscriptions': 0, 'published': 4})
+
+
+def read_route_view(request):
+    return HttpResponse(str(ReplicaRouter().db_for_read(Todo)))
+
+class ReadRouteUrlconf:
+    urlpatterns = [path('read-route/', read_route_view, name='read_route')]
+
+@override_settings(TODO_REPLICAS={'ALIASES': ['replica'], 'PIN_SECONDS': 7})
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_router_only_uses_replicas_when_allowed(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Todo))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Todo), 'replica')
+            self.assertEqual(router.db_for_read(User), 'replica')
+            self.assertIsNone(router.db_for_read(TodoStats))
+            with replica_reads(False):
+                self.assertIsNone(router.db_for_read(Todo))
+            self.assertEqual(router.db_for_write(Todo, instance=Todo()), 'default')
+
+    @override_settings(ROOT_URLCONF=ReadRouteUrlconf)
+    def test_writes_pin_the_client_to_the_primary(self):
+        """
+        Read-only requests may use a replica; a write request does not and sets a pin cookie
+        that keeps the client's next reads on the primary.
+        """
+        self.assertEqual(self.client.get(reverse('read_route')).content, b'replica')
+        response = self.client.post(reverse('read_route'))
+        self.assertEqual(response.content, b'None')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 7)
+        self.assertEqual(self.client.get(reverse('read_route')).content, b'None')
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertEqual(self.client.get(reverse('read_route')).content, b'replica')
+
+
+@skipUnless('replica' in settings.DATABASES, "needs a 'replica' database alias")
+@override_settings(TODO_REPLICAS={'ALIASES': ['replica']})
+class ReplicaReadTests(TestCase):
+    """Runs with a second database standing in for a replica that has not caught up."""
+    # Intersected so the runner does not try to set up a missing alias when the class is skipped.
+    databases = {'default', 'replica'} & settings.DATABASES.keys()
+
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        User.objects.using('replica').create(id=self.user.id, username=self.user.username, password=self.user.password)
+        Todo.objects.using('replica').create(title='Replicated', user_id=self.user.id)
+        self.client.force_login(self.user)
+
+    def test_reads_follow_the_pin(self):
+        self.assertContains(self.client.get(reverse('todo')), 'Replicated')
+
+        self.client.post(reverse('add_task'), {'title': 'Just written'})
+        response = self.client.get(reverse('todo'))
+        self.assertContains(response, 'Just written')
+        self.assertNotContains(response, 'Replicated')
+
+        caches['todo_fragments'].clear()
+        self.client.cookies.pop(PIN_COOKIE)
+        response = self.client.get(reverse('todo'))
+        self.assertContains(response, 'Replicated')
+        self.assertNotContains(response, 'Just written')
+
+    def test_lists_read_from_a_replica_are_not_cached(self):
+        """A pinned writer never gets a list another client rendered from the lagging replica"""
+        reader = Client()
+        reader.force_login(self.user)
+        self.client.post(reverse('add_task'), {'title': 'Just written'})
+        self.assertNotContains(reader.get(reverse('todo')), 'Just written')
+        self.assertContains(self.client.get(reverse('todo')), 'Just written')
+
+
+class ShardHelperTests(SimpleTestCase):
+    def test_hashed_shard_is_stable_and_spread(self):
+        aliases = ['default', 'shard1', 'shard2']
+        picks = [hashed_shard(user_id, aliases) for user_id in range(300)]
+        self.assertEqual(picks, [hashed_shard(user_id, aliases) for user_id in range(300)])
+        self.assertEqual(set(picks), set(aliases))
+
+    def test_single_shard_changes_no_query(self):
+        user = User(id=1)
+        self.assertIsNone(Todo.objects.owned_by(user)._db)
+        self.assertEqual(shard_for(1), 'default')
+
+
+@skipUnless({'shard1', 'shard2'} <= settings.DATABASES.keys(), "needs 'shard1' and 'shard2' database aliases")
+@override_settings(TODO_SHARDS={'ALIASES': ['default', 'shard1', 'shard2']})
+class ShardingTests(TestCase):
+    """Runs with two extra databases standing in for shards."""
+    databases = {'default', 'shard1', 'shard2'} & settings.DATABASES.keys()
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other_user = User.objects.create_user(username="otheruser", password="password123")
+        set_shard(self.user.id, 'shard1')
+        set_shard(self.other_user.id, 'shard2')
+        self.client.force_login(self.user)
+
+    def rows(self, model, alias):
+        return model.objects.using(alias).filter(user=self.user)
+
+    def test_users_rows_live_on_their_shard(self):
+        """
+        Every write path puts the user's todos, terms, counters and archive on their shard only.
+        """
+        self.assertContains(self.client.get(reverse('todo')), '0 open / 0 done')
+        self.client.post(reverse('add_task'), {'title': 'Buy milk'})
+        self.client.post(reverse('bulk_add_tasks'), {'titles': 'Walk dog\nCall mum'})
+        self.client.post(reverse('todo-api-list'), {'title': 'Water plants'})
+        milk, dog, mum, plants = self.rows(Todo, 'shard1').order_by('id')
+        self.client.post(reverse('toggle_task', args=[milk.id]))
+        self.client.post(reverse('add_task'), {'task_id': dog.id, 'title': 'Walk the dog'})
+        self.client.patch(reverse('todo-api-detail', args=[plants.id]), {'completed': True}, content_type='application/json')
+        self.client.post(reverse('delete_task', args=[mum.id]))
+        Todo.objects.using('shard1').filter(id=milk.id).update(completed_at=timezone.now() - timedelta(days=60))
+        call_command('archive_todos', days=30, stdout=StringIO())
+
+        self.assertEqual([todo.title for todo in self.rows(Todo, 'shard1').order_by('id')], ['Walk the dog', 'Water plants'])
+        self.assertEqual([todo.title for todo in self.rows(ArchivedTodo, 'shard1')], ['Buy milk'])
+        stats = self.rows(TodoStats, 'shard1').get()
+        self.assertEqual((stats.total, stats.completed), (2, 1))
+        self.assertTrue(self.rows(TodoTerm, 'shard1').filter(term='dog').exists())
+        for alias in ('default', 'shard2'):
+            for model in (Todo, TodoTerm, TodoStats, ArchivedTodo):
+                self.assertFalse(self.rows(model, alias).exists(), f'{model.__name__} rows on {alias}')
+
+        response = self.client.get(reverse('todo'))
+        self.assertContains(response, 'Walk the dog')
+        self.assertContains(response, '1 open / 1 done')
+        self.assertContains(self.client.get(reverse('search_tasks'), {'q': 'dog'}), 'Walk the dog')
+        self.assertContains(self.client.get(reverse('archived_tasks')), 'Buy milk')
+        self.client.force_login(self.other_user)
+        self.assertNotContains(self.client.get(reverse('todo')), 'Walk the dog')
+
+    def test_deleting_a_user_deletes_their_rows_on_their_shard(self):
+        self.client.post(reverse('add_task'), {'title': 'Buy milk'})
+        todo = self.rows(Todo, 'shard1').get()
+        self.client.post(reverse('toggle_task', args=[todo.id]))
+        Todo.objects.using('shard1').filter(id=todo.id).update(completed_at=timezone.now() - timedelta(days=60))
+        call_command('archive_todos', days=30, stdout=StringIO())
+        self.client.post(reverse('add_task'), {'title': 'Walk dog'})
+        Todo.objects.create(title='Not mine', user=self.other_user)
+
+        user_id = self.user.id
+        self.user.delete()
+        for model in (Todo, TodoTerm, TodoStats, ArchivedTodo, TodoChange):
+            self.assertFalse(model.objects.using('shard1').filter(user_id=user_id).exists(), f'{model.__name__} rows left on shard1')
+        self.assertTrue(Todo.objects.using('shard2').filter(user=self.other_user).exists())
+
+    def test_new_users_get_a_recorded_hashed_shard(self):
+        user = User.objects.create_user(username="newuser", password="password123")
+        alias = hashed_shard(user.id, ['default', 'shard1', 'shard2'])
+        self.assertEqual(shard_for(user.id), alias)
+        self.assertEqual(UserShard.objects.get(user=user).alias, alias)
+
+    def test_bulk_create_cannot_span_shards(self):
+        with self.assertRaises(ValueError):
+            Todo.objects.bulk_create([Todo(user=self.user, title='One'), Todo(user=self.other_user, title='Two')])
+
+    def test_move_user_shard_command(self):
+        """
+        Moving a user copies their rows to the new shard in batches, switches them over and clears the old shard.
+        """
+        self.client.post(reverse('bulk_add_tasks'), {'titles': 'Buy milk\nWalk dog\nCall mum'})
+        milk = self.rows(Todo, 'shard1').get(title='Buy milk')
+        self.client.post(reverse('toggle_task', args=[milk.id]))
+        ArchivedTodo.objects.create(todo_id=1, user=self.user, title='Old chore')
+        self.client.get(reverse('todo'))
+        seq = self.client.get(reverse('todo-api-sync'), {'since': 1}).json()['seq']
+
+        out = StringIO()
+        call_command('move_user_shard', 'testuser', 'shard2', batch_size=2, stdout=out)
+        self.assertIn('Moved 3 todos and 1 archived todos of testuser from shard1 to shard2.', out.getvalue())
+
+        self.assertEqual(shard_for(self.user.id), 'shard2')
+        self.assertEqual(UserShard.objects.get(user=self.user).alias, 'shard2')
+        self.assertEqual(
+            sorted(self.rows(Todo, 'shard2').values_list('title', 'completed')),
+            [('Buy milk', True), ('Call mum', False), ('Walk dog', False)],
+        )
+        stats = self.rows(TodoStats, 'shard2').get()
+        self.assertEqual((stats.total, stats.completed), (3, 1))
+        for model in (Todo, TodoTerm, TodoStats, ArchivedTodo, TodoChange):
+            self.assertFalse(self.rows(model, 'shard1').exists(), f'{model.__name__} rows left on shard1')
+        # The log named the old ids.
+        self.assertTrue(self.client.get(reverse('todo-api-sync'), {'since': seq}).json()['reset'])
+
+        response = self.client.get(reverse('todo'))
+        self.assertContains(response, 'Walk dog')
+        self.assertContains(response, '2 open / 1 done')
+        self.assertContains(self.client.get(reverse('search_tasks'), {'q': 'milk'}), 'Buy milk')
+        self.assertContains(self.client.get(reverse('archived_tasks')), 'Old chore')
+
+        with self.assertRaises(CommandError):
+            call_command('move_user_shard', 'testuser', 'nowhere', stdout=StringIO())
+
+
+class TodoDescriptionTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.notes = 'Semi-skimmed\nTwo bottles'
+        self.task = Todo.objects.create(title='Buy milk', description=self.notes, user=self.user)
+        recount([self.user.id])
+        self.client.force_login(self.user)
+
+    def todo_queries(self, queries):
+        # Leaves out the page's list_state() probe, which reads the counters.
+        return [query['sql'] for query in queries if 'FROM "tasks_todo"' in query['sql'] and 'tasks_todostats' not in query['sql']]
+
+    def test_list_loads_titles_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('todo'))
+        self.assertContains(response, 'Buy milk')
+        self.assertContains(response, reverse('task_description', args=[self.task.id]))
+        self.assertNotContains(response, 'Semi-skimmed')
+        [sql] = self.todo_queries(queries)
+        self.assertNotIn('"description"', sql)
+
+    def test_description_fragment(self):
+        response = self.client.get(reverse('task_description', args=[self.task.id]))
+        self.assertContains(response, 'Semi-skimmed<br>Two bottles')
+        self.assertNotContains(response, '<html')
+        self.task.description = ''
+        self.task.save()
+        self.assertContains(self.client.get(reverse('task_description', args=[self.task.id])), 'No notes.')
+
+        other = User.objects.create_user(username="otheruser", password="password123")
+        other_task = Todo.objects.create(title='Secret', description='Hidden', user=other)
+        self.assertEqual(self.client.get(reverse('task_description', args=[other_task.id])).status_code, 404)
+
+    def test_edit_task_comes_from_the_loaded_page(self):
+        """
+        Editing a todo on a freshly loaded page takes it, description included, from the list query;
+        with the list cached it is looked up on its own.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('todo'), {'edit_task_id': self.task.id})
+        self.assertContains(response, 'Edit Task')
+        self.assertContains(response, self.notes)
+        self.assertEqual(len(self.todo_queries(queries)), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('todo'), {'edit_task_id': self.task.id})
+        self.assertContains(response, self.notes)
+        [sql] = self.todo_queries(queries)
+        self.assertIn(f'"tasks_todo"."id" = {self.task.id}', sql)
+
+        self.assertEqual(self.client.get(reverse('todo'), {'edit_task_id': 'abc'}).status_code, 404)
+
+class TodoConditionalPageTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.task = Todo.objects.create(title="Task 1", user=self.user)
+        self.other = Todo.objects.create(title="Task 2", user=self.user)
+        recount([self.user.id])
+        # Whole-second Last-Modified values cannot tell apart writes made
+        # within the same second, so the existing rows are made older.
+        self.earlier = timezone.now() - timedelta(hours=1)
+        Todo.objects.filter(user=self.user).update(created_at=self.earlier, updated_at=self.earlier)
+        TodoStats.objects.filter(user=self.user).update(changed_at=self.earlier)
+        self.client.force_login(self.user)
+
+    def test_timestamps_are_set_and_moved_by_writes(self):
+        task = Todo.objects.create(title="New", user=self.user)
+        self.assertIsNotNone(task.created_at)
+        self.assertIsNotNone(task.updated_at)
+
+        self.client.post(reverse('toggle_task', args=[self.task.id]))
+        self.task.refresh_from_db()
+        self.assertGreater(self.task.updated_at, self.earlier)
+        self.assertEqual(self.task.created_at, self.earlier)
+
+        self.client.post(reverse('add_task'), {'task_id': self.other.id, 'title': 'Renamed'})
+        self.other.refresh_from_db()
+        self.assertGreater(self.other.updated_at, self.earlier)
+
+    def test_list_state(self):
+        self.assertEqual(list_state(self.user.id), (2, 0, self.earlier))
+        self.client.post(reverse('delete_task', args=[self.task.id]))
+        total, completed, last_modified = list_state(self.user.id)
+        self.assertEqual((total, completed), (1, 0))
+        self.assertGreater(last_modified, self.earlier)
+
+    def test_page_carries_validators(self):
+        response = self.client.get(reverse('todo'))
+        self.assertTrue(response['ETag'])
+        self.assertEqual(response['Last-Modified'], http_date(self.earlier.timestamp()))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_unchanged_page_is_304_before_rows_are_loaded(self):
+        """Only the list_state() probe runs, and once it is cached not even that"""
+        etag = self.client.get(reverse('todo'))['ETag']
+        key = 'todo-list-state:{}:{}'.format(self.user.id, list_version(self.user.id))
+        caches['todo_fragments'].delete(key)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('todo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        [sql] = [query['sql'] for query in queries if 'tasks_todo' in query['sql']]
+        self.assertIn('tasks_todostats', sql)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('todo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(reverse('todo'))['Last-Modified']
+        response = self.client.get(reverse('todo'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_change_the_validators(self):
+        """Deletes leave no updated_at behind but still move Last-Modified"""
+        first = self.client.get(reverse('todo'))
+        self.client.post(reverse('delete_task', args=[self.task.id]))
+        response = self.client.get(reverse('todo'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Task 1')
+        response = self.client.get(reverse('todo'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+
+        second = self.client.get(reverse('todo'))
+        self.client.post(reverse('toggle_task', args=[self.other.id]))
+        response = self.client.get(reverse('todo'), HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_the_url(self):
+        etag = self.client.get(reverse('todo'))['ETag']
+        response = self.client.get(reverse('todo'), {'filter': 'done'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ROOT_URLCONF=AsyncUrlconf)
+    async def test_async_todo_page(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo'))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('todo'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+class TodoSyncTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other_user = User.objects.create_user(username="otheruser", password="password123")
+        recount([self.user.id, self.other_user.id])
+        self.client.force_login(self.user)
+        self.sync_url = reverse('todo-api-sync')
+
+    def sync(self, since):
+        response = self.client.get(self.sync_url, {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_is_a_reset(self):
+        """A client without a seq downloads the list, then syncs from the seq it was given"""
+        first = self.sync(0)
+        self.assertTrue(first['reset'])
+        self.assertEqual(self.sync(first['seq']), {'seq': first['seq'], 'reset': False, 'more': False, 'changed': [], 'deleted': []})
+
+    def test_writes_are_logged(self):
+        seq = self.sync(0)['seq']
+        self.client.post(reverse('add_task'), {'title': 'Kept'})
+        self.client.post(reverse('add_task'), {'title': 'Gone'})
+        kept = Todo.objects.get(title='Kept')
+        gone = Todo.objects.get(title='Gone')
+        self.client.post(reverse('toggle_task', args=[kept.id]))
+        self.client.post(reverse('delete_task', args=[gone.id]))
+        Todo.objects.create(title='Not mine', user=self.other_user)
+
+        changes = self.sync(seq)
+        self.assertFalse(changes['reset'])
+        self.assertEqual(changes['seq'], seq + 4)
+        self.assertEqual(changes['changed'], [
+            {'id': kept.id, 'user': self.user.id, 'title': 'Kept', 'description': '', 'completed': True, 'position': kept.position},
+        ])
+        self.assertEqual(changes['deleted'], [gone.id])
+        self.assertEqual(self.sync(changes['seq'])['changed'], [])
+
+    def test_api_and_bulk_writes_are_logged(self):
+        seq = self.sync(0)['seq']
+        self.client.post(reverse('bulk_add_tasks'), {'titles': 'One\nTwo'})
+        one, two = Todo.objects.order_by('id')
+        self.client.patch(reverse('todo-api-detail', args=[one.id]), {'title': 'Uno'}, content_type='application/json')
+        self.client.post(reverse('bulk_delete_tasks'), {'task_ids': [two.id]})
+
+        changes = self.sync(seq)
+        self.assertEqual([todo['title'] for todo in changes['changed']], ['Uno'])
+        self.assertEqual(changes['deleted'], [two.id])
+
+    def test_bulk_writes_log_only_own_todos(self):
+        """Ids of other users' or missing todos are not logged"""
+        mine = Todo.objects.create(title='Mine', user=self.user)
+        other = Todo.objects.create(title='Not mine', user=self.other_user)
+        seq = self.sync(0)['seq']
+        self.client.post(reverse('bulk_toggle_tasks'), {'task_ids': [mine.id, other.id, 10 ** 6]})
+        self.client.post(reverse('bulk_delete_tasks'), {'task_ids': [other.id, 10 ** 6]})
+
+        changes = self.sync(seq)
+        self.assertEqual(changes['seq'], seq + 1)
+        self.assertEqual([todo['id'] for todo in changes['changed']], [mine.id])
+        self.assertEqual(changes['deleted'], [])
+        self.assertFalse(TodoChange.objects.filter(todo_id__in=[other.id, 10 ** 6]).exists())
+
+    def test_changes_come_in_pages(self):
+        seq = self.sync(0)['seq']
+        self.client.post(reverse('bulk_add_tasks'), {'titles': 'One\nTwo\nThree'})
+        page = changes_since(self.user.id, seq, limit=2)
+        self.assertTrue(page['more'])
+        self.assertEqual(len(page['changed']), 2)
+        page = changes_since(self.user.id, page['seq'], limit=2)
+        self.assertFalse(page['more'])
+        self.assertEqual(len(page['changed']), 1)
+
+    def test_archived_todos_are_deleted(self):
+        seq = self.sync(0)['seq']
+        todo = Todo.objects.create(title='Old', completed=True, user=self.user)
+        archive_batch(timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.sync(seq)['deleted'], [todo.id])
+
+    def test_import_resets(self):
+        seq = self.sync(0)['seq']
+        self.client.post(reverse('import_tasks'), {'file': SimpleUploadedFile('todos.csv', b'title\nImported\n')})
+        self.assertTrue(self.sync(seq)['reset'])
+
+    def test_compaction(self):
+        seq = self.sync(0)['seq']
+        self.client.post(reverse('add_task'), {'title': 'Old'})
+        latest = self.sync(seq)['seq']
+        TodoChange.objects.update(created_at=timezone.now() - timedelta(days=31))
+        out = StringIO()
+        call_command('compact_todo_changes', '--days', '30', stdout=out)
+        self.assertIn('Dropped 1 change log entries', out.getvalue())
+        self.assertFalse(TodoChange.objects.exists())
+        self.assertTrue(self.sync(seq)['reset'])
+        self.assertFalse(self.sync(latest)['reset'])
+
+    def test_since_is_required(self):
+        self.assertEqual(self.client.get(self.sync_url).status_code, 400)
+        self.assertEqual(self.client.get(self.sync_url, {'since': 'x'}).status_code, 400)
+        self.assertTrue(self.sync(10 ** 6)['reset'])
+
+class PositionKeyTests(SimpleTestCase):
+    def test_keys_sort_between_their_neighbours(self):
+        keys = keys_after(None, 2000)
+        self.assertEqual(keys, sorted(set(keys)))
+        self.assertLessEqual(max(map(len, keys)), 4)
+        first = key_between(None, keys[0])
+        self.assertLess(first, keys[0])
+        for a, b in zip(keys, keys[1:]):
+            self.assertTrue(a < key_between(a, b) < b)
+
+    def test_repeated_moves_into_one_gap(self):
+        a, b = keys_after(None, 2)
+        for _ in range(50):
+            a = key_between(a, b)
+            self.assertLess(a, b)
+        self.assertLess(len(a), 20)
+
+    def test_keys_between_stay_short(self):
+        keys = keys_between('I0', 'I1', 100)
+        self.assertEqual(keys, sorted(set(keys)))
+        self.assertTrue('I0' < keys[0] and keys[-1] < 'I1')
+        self.assertLessEqual(max(map(len, keys)), 5)
+        self.assertEqual(keys_between(None, None, 0), [])
+
+    def test_keys_use_case_insensitive_safe_digits(self):
+        self.assertRegex(key_between('I0', 'I0001'), r'^[0-9A-Z]+$')
+        with self.assertRaises(ValueError):
+            key_between('I1', 'I0')
+
+
+class TodoOrderingTests(TestCase):
+    def setUp(self):
+        caches['todo_fragments'].clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.first, self.second, self.third = [Todo.objects.create(title=title, user=self.user) for title in ('First', 'Second', 'Third')]
+        recount([self.user.id])
+        self.client.force_login(self.user)
+
+    def listed(self):
+        return [todo.title for todo in self.client.get(reverse('todo')).context['todos']]
+
+    def move(self, todo, after):
+        return self.client.post(reverse('move_task', args=[todo.id]), {'after': after.id if after else ''})
+
+    def test_new_todos_go_last(self):
+        self.assertLess(self.first.position, self.second.position)
+        todos = Todo.objects.create_many(self.user, [{'title': 'Fourth'}, {'title': 'Fifth'}])
+        self.assertLess(self.third.position, todos[0].position)
+        self.assertLess(todos[0].position, todos[1].position)
+        self.assertEqual(self.listed(), ['First', 'Second', 'Third', 'Fourth', 'Fifth'])
+
+    def test_appends_lock_the_users_counters_first(self):
+        """Appending takes the user's TodoStats row lock before reading the last position"""
+        for append in (
+            lambda: Todo.objects.create(title='Fourth', user=self.user),
+            lambda: Todo.objects.create_many(self.user, [{'title': 'Fifth'}]),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                append()
+            tables = [query['sql'].split(' FROM ')[1].split()[0] for query in queries if query['sql'].startswith('SELECT')]
+            self.assertEqual(tables[:2], ['"tasks_todostats"', '"tasks_todo"'])
+        self.assertEqual(self.listed(), ['First', 'Second', 'Third', 'Fourth', 'Fifth'])
+
+    def test_appends_without_counters_row_create_and_lock_it(self):
+        """A user without a TodoStats row gets one, with their todos counted, before the append is locked"""
+        TodoStats.objects.filter(user=self.user).delete()
+        with CaptureQueriesContext(connection) as queries:
+            fourth = Todo.objects.create(title='Fourth', user=self.user)
+        self.assertLess(self.third.position, fourth.position)
+        statements = [query['sql'] for query in queries if 'tasks_todostats' in query['sql']]
+        self.assertEqual([sql.split()[0] for sql in statements], ['SELECT', 'INSERT', 'SELECT', 'UPDATE'])
+        stats = TodoStats.objects.get(user=self.user)
+        self.assertEqual((stats.total, stats.completed), (4, 0))
+
+    def test_unplaced_rows_are_ignored_when_appending(self):
+        """Rows bulk inserted without a position do not break adding todos"""
+        Todo.objects.bulk_create([Todo(title='Unplaced', user=self.user)])
+        fourth = Todo.objects.create(title='Fourth', user=self.user)
+        self.assertLess(self.third.position, fourth.position)
+
+    def test_move_writes_only_the_moved_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.move(self.third, self.first)
+        self.assertRedirects(response, reverse('todo'), fetch_redirect_response=False)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "tasks_todo"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.listed(), ['First', 'Third', 'Second'])
+
+        self.move(self.second, None)
+        self.assertEqual(self.listed(), ['Second', 'First', 'Third'])
+
+    def test_done_todos_keep_their_order_after_open_ones(self):
+        self.move(self.first, self.third)
+        self.client.post(reverse('toggle_task', args=[self.second.id]))
+        self.assertEqual(self.listed(), ['Third', 'First', 'Second'])
+
+    def test_move_errors(self):
+        other = User.objects.create_user(username="otheruser", password="password123")
+        other_task = Todo.objects.create(title='Other', user=other)
+        self.assertEqual(self.move(other_task, None).status_code, 404)
+        self.assertEqual(self.move(self.first, other_task).status_code, 404)
+        response = self.client.post(reverse('move_task', args=[self.first.id]), {'after': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_api_move(self):
+        url = reverse('todo-api-move', args=[self.first.id])
+        response = self.client.post(url, {'after': self.third.id}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()['position'], Todo.objects.get(id=self.third.id).position)
+        response = self.client.post(url, {'after': 'x'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_long_positions_are_rebalanced(self):
+        """A move that makes a key too long rewrites the keys around it, short and in the same order"""
+        Todo.objects.filter(id=self.first.id).update(position='I0' + '1' * 31)
+        Todo.objects.filter(id=self.second.id).update(position='I0' + '1' * 31 + '2')
+        seq = self.client.get(reverse('todo-api-sync'), {'since': 0}).json()['seq']
+        self.move(self.third, self.first)
+        positions = list(Todo.objects.order_by('position').values_list('title', 'position'))
+        self.assertEqual([title for title, _ in positions], ['First', 'Third', 'Second'])
+        self.assertLessEqual(max(len(position) for _, position in positions), 2)
+        self.assertEqual(self.listed(), ['First', 'Third', 'Second'])
+        changes = self.client.get(reverse('todo-api-sync'), {'since': seq}).json()
+        self.assertFalse(changes['reset'])
+        self.assertEqual(sorted(todo['id'] for todo in changes['changed']), sorted([self.first.id, self.second.id, self.third.id]))
+
+    def test_rebalance_rewrites_only_the_window(self):
+        """Only the todos next to the long key are rewritten, between the untouched ones around them"""
+        todos = Todo.objects.create_many(self.user, [{'title': f'Task {n}'} for n in range(20)])
+        Todo.objects.filter(id=todos[10].id).update(position=todos[9].position + '1' * 31)
+        before = dict(Todo.objects.values_list('id', 'position'))
+        with transaction.atomic():
+            rewritten = Todo.objects.owned_by(self.user).rebalance_around(todos[10].id, window=2)
+        self.assertEqual(rewritten, [todo.id for todo in todos[8:13]])
+        after = dict(Todo.objects.values_list('id', 'position'))
+        self.assertEqual({pk for pk in after if after[pk] != before[pk]} - set(rewritten), set())
+        self.assertLessEqual(max(len(after[pk]) for pk in rewritten), 16)
+        ordered = [todo.id for todo in Todo.objects.owned_by(self.user).order_by('position', 'id')]
+        self.assertEqual(ordered, [self.first.id, self.second.id, self.third.id] + [todo.id for todo in todos])
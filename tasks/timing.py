@@ -0,0 +1,159 @@
+"""
+Per-request timings for ServerTimingMiddleware: SQL time and count (through
+connection.execute_wrapper), template render time (through the
+TimedDjangoTemplates backend) and the slowest requests and repeated queries
+seen by this process.
+"""
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template import TemplateDoesNotExist
+
+logger = logging.getLogger('tasks.timing')
+
+_current = contextvars.ContextVar('todo_request_timings', default=None)
+
+_stats_lock = threading.Lock()
+_slowest = []  # min-heap of (total_ms, seq, entry)
+_repeated = {}  # (url_name, sql) -> {'requests': n, 'max_repeats': n}, at most KEEP_REPEATED
+_seq = 0
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.db = 0.0
+        self.queries = Counter()
+        self.template = 0.0
+        self._render_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries[sql] += 1
+
+    def header(self, total):
+        """The Server-Timing header value, durations in milliseconds."""
+        metrics = [
+            f'db;dur={self.db * 1000:.2f};desc="{sum(self.queries.values())} queries"',
+            f'tpl;dur={self.template * 1000:.2f}',
+        ]
+        if self.view_start is not None:
+            # Request-phase middleware: everything before the view is called.
+            metrics.append(f'mw;dur={(self.view_start - self.start) * 1000:.2f}')
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_timings():
+    return _current.get()
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        # Only the outermost render counts, so nested renders are not added twice.
+        timings._render_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings._render_depth -= 1
+            if not timings._render_depth:
+                timings.template += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render for the current request."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def record_request(request, response, timings, total, options):
+    """Log slow requests and repeated queries, and keep the slowest requests."""
+    global _seq
+    match = getattr(request, 'resolver_match', None)
+    url_name = (match.view_name if match else None) or request.path
+    total_ms = total * 1000
+    query_count = sum(timings.queries.values())
+    entry = {
+        'method': request.method,
+        'path': request.path,
+        'url_name': url_name,
+        'status': response.status_code,
+        'total_ms': round(total_ms, 2),
+        'db_ms': round(timings.db * 1000, 2),
+        'template_ms': round(timings.template * 1000, 2),
+        'queries': query_count,
+    }
+
+    if total_ms >= options['SLOW_REQUEST_MS']:
+        logger.warning(
+            'Slow request %s %s (%s): %.1f ms total, %.1f ms in %d queries, %.1f ms rendering',
+            request.method, request.path, url_name, total_ms, timings.db * 1000, query_count, timings.template * 1000,
+        )
+
+    repeated = [(sql, count) for sql, count in timings.queries.items() if count >= options['REPEATED_QUERY_THRESHOLD']]
+    for sql, count in repeated:
+        logger.warning('Possible N+1 in %s: the same query ran %d times: %s', url_name, count, sql[:200])
+
+    with _stats_lock:
+        _seq += 1
+        item = (total_ms, _seq, entry)
+        if len(_slowest) < options['KEEP_SLOWEST']:
+            heapq.heappush(_slowest, item)
+        elif _slowest and total_ms > _slowest[0][0]:
+            heapq.heapreplace(_slowest, item)
+        for sql, count in repeated:
+            key = (url_name, sql)
+            if key not in _repeated and len(_repeated) >= options['KEEP_REPEATED']:
+                # Queries with inlined values can be distinct every time, so
+                # make room by forgetting the one seen in the fewest requests.
+                del _repeated[min(_repeated, key=lambda seen_key: _repeated[seen_key]['requests'])]
+            seen = _repeated.setdefault(key, {'requests': 0, 'max_repeats': 0})
+            seen['requests'] += 1
+            seen['max_repeats'] = max(seen['max_repeats'], count)
+
+
+def timing_stats():
+    with _stats_lock:
+        return {
+            'slowest': [entry for _, _, entry in sorted(_slowest, reverse=True)],
+            'repeated_queries': [
+                {'url_name': url_name, 'sql': sql[:200], **seen}
+                for (url_name, sql), seen in sorted(_repeated.items(), key=lambda item: -item[1]['requests'])
+            ],
+        }
+
+
+def reset_timing_stats():
+    with _stats_lock:
+        _slowest.clear()
+        _repeated.clear()
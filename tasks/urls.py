@@ -1,15 +1,34 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from rest_framework.routers import SimpleRouter
+from . import views, async_views
 # from .views import TodoListView, TodoDetailView
 
-urlpatterns = [
-    path('signup/', views.signup, name='signup'),
-    path('login/', views.login_view, name='login'),
-    path('todo/', views.todo_page, name='todo'),
-    path('add-task/', views.add_task, name='add_task'),
-    path('toggle-task/<int:task_id>/', views.toggle_task, name='toggle_task'),
-    path('delete-task/<int:task_id>/', views.delete_task, name='delete_task'),
-    path('logout/', views.logout_view, name='logout'),
+router = SimpleRouter()
+router.register('api/todos', views.TodoViewSet, basename='todo-api')
 
-]
 
+def get_urlpatterns(use_async_views=False):
+    todo_views = async_views if use_async_views else views
+    return [
+        path('signup/', views.signup, name='signup'),
+        path('login/', todo_views.login_view, name='login'),
+        path('todo/', todo_views.todo_page, name='todo'),
+        path('todo/<int:task_id>/description/', views.task_description, name='task_description'),
+        path('add-task/', todo_views.add_task, name='add_task'),
+        path('toggle-task/<int:task_id>/', todo_views.toggle_task, name='toggle_task'),
+        path('delete-task/<int:task_id>/', todo_views.delete_task, name='delete_task'),
+        path('move-task/<int:task_id>/', views.move_task, name='move_task'),
+        path('bulk/add-tasks/', views.bulk_add_tasks, name='bulk_add_tasks'),
+        path('bulk/toggle-tasks/', views.bulk_toggle_tasks, name='bulk_toggle_tasks'),
+        path('bulk/delete-tasks/', views.bulk_delete_tasks, name='bulk_delete_tasks'),
+        path('search/', views.search_tasks, name='search_tasks'),
+        path('events/', async_views.todo_events, name='todo_events'),
+        path('archived/', views.archived_tasks, name='archived_tasks'),
+        path('export/', views.export_tasks, name='export_tasks'),
+        path('import/', views.import_tasks, name='import_tasks'),
+        path('metrics/', views.metrics, name='metrics'),
+        path('logout/', views.logout_view, name='logout'),
+    ] + router.urls
+
+urlpatterns = get_urlpatterns(settings.TODO_ASYNC_VIEWS)
@@ -1,9 +1,182 @@
+import hashlib
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.models import User
-from .serializers import SignupSerializer, LoginSerializer, TodoSerializer
+from .serializers import SignupSerializer, LoginSerializer, TodoSerializer, TaskIdsSerializer, list_errors
 from django.contrib.auth.decorators import login_required
-from .models import Todo
+from django.views.decorators.http import require_POST, require_safe
+from django.db.models import Case, F, When
+from django.db import transaction
+from django.conf import settings
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .models import ArchivedTodo, Todo, FILTER_MODES, LIST_FIELDS
+from .events import get_broker, publish_event, todo_payload
+from .changes import changes_since, record_changes
+from .counters import adjust_counts, counted_delete, counted_toggle, counted_update, get_counts, list_state
+from .cache import cached_todo_list, bump_list_version, get_list_state, list_version, store_list_state
+from .search import index_new_todos, index_todo, search, unindex_todos
+from .cache import fragment_cache_stats
+from .hashing import PoolSaturated, get_pool
+from .db.pool import pool_stats
+from .db.routers import replica_reads
+from .db.sharding import shard_for
+from .ordering import DIGITS, REBALANCE_LENGTH
+from .timing import timing_stats
+from .export import EXPORT_FORMATS, export_stream
+from .importer import IMPORT_FORMATS, guess_format, import_todos, open_upload, parse_rows
+
+# Shown with a 429 when the password hashing pool is full.
+BUSY_ERRORS = {'non_field_errors': ["Too many sign-ins right now. Please try again in a moment."]}
+
+
+def _parse_cursor(value):
+    """Parse an `after` cursor of the form '<completed>-<position>-<id>', e.g. '0-I5-42'."""
+    try:
+        completed, position, last_id = value.split('-')
+        if len(position) > Todo._meta.get_field('position').max_length or position.strip(DIGITS):
+            return None
+        return completed == '1', position, int(last_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _list_params(request):
+    """Return `(mode, after, page_size, variant)` for the list page requested."""
+    mode = request.GET.get('filter', 'all')
+    if mode not in FILTER_MODES:
+        mode = 'all'
+    page_size = settings.TODO_PAGE_SIZE
+    after = _parse_cursor(request.GET.get('after'))
+    cursor = '{}-{}-{}'.format(int(after[0]), *after[1:]) if after else ''
+    return mode, after, page_size, (mode, cursor, page_size)
+
+
+def _page_context(todos, mode, after, page_size):
+    """Build the `todo_list.html` context from up to `page_size + 1` loaded rows."""
+    next_cursor = None
+    if len(todos) > page_size:
+        todos = todos[:page_size]
+        last = todos[-1]
+        next_cursor = f'{int(last.completed)}-{last.position}-{last.id}'
+    return {
+        'todos': todos,
+        'filter': mode,
+        'filter_modes': list(FILTER_MODES),
+        'after': after,
+        'next_cursor': next_cursor,
+        # Rendered into a <template> for todos added by live updates.
+        'item_template': {'id': 0, 'title': '', 'completed': False},
+    }
+
+
+def _edit_task_id(request):
+    """The `edit_task_id` query parameter as an int, or None. Garbage is a 404."""
+    value = request.GET.get('edit_task_id')
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise Http404('No Todo matches the given query.')
+
+
+def _list_rows(queryset, edit_task_id=None):
+    """
+    Project `queryset` to the list columns. The todo being edited, if it is
+    among the rows, also carries its description, in `edit_description`.
+    """
+    queryset = queryset.only(*LIST_FIELDS)
+    if edit_task_id is not None:
+        queryset = queryset.annotate(edit_description=Case(When(id=edit_task_id, then=F('description'))))
+    return queryset
+
+
+def _find_edit_task(todos, edit_task_id):
+    """The todo being edited from rows loaded by _list_rows(), or None if it is not among them."""
+    for todo in todos:
+        if todo.id == edit_task_id:
+            todo.description = todo.edit_description
+            return todo
+    return None
+
+
+def _load_edit_task(queryset, edit_task_id):
+    return get_object_or_404(queryset.only(*LIST_FIELDS, 'description'), id=edit_task_id)
+
+
+def _cached_list_state(user_id):
+    """
+    `(version, list_state())` of the user's list. The state is probed once per
+    list version and then served from the fragment cache.
+    """
+    version = list_version(user_id)
+    state = get_list_state(user_id, version)
+    if state is None:
+        state = list_state(user_id)
+        store_list_state(user_id, version, state)
+    return version, state
+
+
+def _page_validators(request, version, state):
+    """
+    ETag and Last-Modified (whole seconds, or None) of the todo page. The ETag
+    also covers the URL and the CSRF secret, which the page embeds a token of.
+    """
+    total, completed, last_modified = state
+    # Makes sure the request has a secret before the page would create one.
+    get_token(request)
+    key = '{}:{}:{}:{}:{}:{}:{}'.format(
+        request.user.id, version, total, completed, last_modified,
+        request.get_full_path(), request.META.get('CSRF_COOKIE', ''),
+    )
+    etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Revalidate every time instead of reusing the page for a heuristic
+    # lifetime derived from Last-Modified.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _todo_list_context(request, edit_task_id=None):
+    """
+    Render one keyset page of the user's todos, from the fragment cache when
+    possible. When the page is loaded from the database and holds the todo
+    being edited, that todo is returned as `edit_task`.
+    """
+    mode, after, page_size, variant = _list_params(request)
+
+    def build_context():
+        todos = list(_list_rows(Todo.objects.owned_by(request.user), edit_task_id).keyset_page(mode, after, page_size + 1))
+        return {
+            **_page_context(todos, mode, after, page_size),
+            'counts': get_counts(request.user.id),
+            'edit_task': _find_edit_task(todos, edit_task_id),
+        }
+
+    todo_list, context = cached_todo_list(request, variant, build_context)
+    return {**context, 'todo_list': todo_list, 'filter': mode}
+
+
+def _require_rows(rowcount):
+    """Map a zero rowcount from a single-statement write on the user's todos to a 404."""
+    if not rowcount:
+        raise Http404('No Todo matches the given query.')
+
 
 def signup(request):
     if request.method == 'POST':
@@ -16,8 +189,18 @@ def signup(request):
 
         serializer = SignupSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
-            user = User.objects.get(username=data['username'])
+            try:
+                user = serializer.save()
+            except PoolSaturated:
+                return render(request, 'signup.html', {
+                    'errors': BUSY_ERRORS,
+                    'form_data': data,
+                }, status=429)
+            except ValidationError as exc:
+                return render(request, 'signup.html', {
+                    'errors': exc.detail,
+                    'form_data': data,
+                })
             login(request, user)
             return redirect('login')  
         else:
@@ -35,7 +218,13 @@ def login_view(request):
         if serializer.is_valid():
             username = serializer.validated_data['username']
             password = serializer.validated_data['password']
-            user = authenticate(request, username=username, password=password)
+            try:
+                user = authenticate(request, username=username, password=password)
+            except PoolSaturated:
+                return render(request, 'login.html', {
+                    'form_data': request.POST,
+                    'errors': BUSY_ERRORS,
+                }, status=429)
 
             if user is not None:
                 login(request, user)
@@ -58,16 +247,29 @@ def login_view(request):
 
 @login_required
 def todo_page(request):
-    edit_task_id = request.GET.get('edit_task_id')
-    edit_task = None
-    if edit_task_id:
-        edit_task = get_object_or_404(Todo, id=edit_task_id, user=request.user)
+    """
+    The todo page. A client holding the current page (If-None-Match or
+    If-Modified-Since) gets a 304 before any row is loaded.
+    """
+    edit_task_id = _edit_task_id(request)
+    etag, last_modified = _page_validators(request, *_cached_list_state(request.user.id))
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, last_modified)
+    context = _todo_list_context(request, edit_task_id)
+    if edit_task_id is not None and context.get('edit_task') is None:
+        context['edit_task'] = _load_edit_task(Todo.objects.owned_by(request.user), edit_task_id)
+    return _with_validators(render(request, 'todo.html', context), etag, last_modified)
 
-    todos = Todo.objects.filter(user=request.user)
-    return render(request, 'todo.html', {
-        'todos': todos,
-        'edit_task': edit_task,
-    })
+@login_required
+@require_safe
+def task_description(request, task_id):
+    """The description of one todo, as an HTML fragment for the list."""
+    try:
+        description = Todo.objects.owned_by(request.user).values_list('description', flat=True).get(id=task_id)
+    except Todo.DoesNotExist:
+        raise Http404('No Todo matches the given query.')
+    return render(request, 'todo_description.html', {'description': description})
 
 @login_required
 def add_task(request):
@@ -78,48 +280,366 @@ def add_task(request):
             'title': request.POST.get('title'),
             'description': request.POST.get('description', ''),
             'completed': request.POST.get('completed', 'false') == 'true',  # Handle completion as a boolean
-            'user': request.user.id,
         }
 
-        if task_id:
-            task = get_object_or_404(Todo, id=task_id, user=request.user)
-            data['user'] = task.user.id
-            serializer = TodoSerializer(task, data=data)
-        else:
-            serializer = TodoSerializer(data=data)
-
+        serializer = TodoSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            fields = serializer.validated_data
+            with transaction.atomic(using=shard_for(request.user.id)):
+                if task_id:
+                    _require_rows(counted_update(Todo.objects.owned_by(request.user).filter(id=task_id), request.user.id, **fields))
+                    index_todo(request.user.id, task_id, fields['title'], fields.get('description'))
+                    record_changes(request.user.id, changed=[task_id])
+                    publish_event(request.user.id, 'edited', todos=[{'id': int(task_id), **fields}])
+                else:
+                    todo = serializer.save(user=request.user)
+                    index_new_todos([todo])
+                    record_changes(request.user.id, changed=[todo.id])
+                    publish_event(request.user.id, 'created', todos=[todo_payload(todo)])
+            bump_list_version(request.user.id)
             return redirect('todo')
         else:
-            todos = Todo.objects.filter(user=request.user)
             return render(request, 'todo.html', {
-                'todos': todos,  
+                **_todo_list_context(request),
                 'form_data': data,
                 'errors': serializer.errors,
             })
 
-    todos = Todo.objects.filter(user=request.user)
-    return render(request, 'todo.html', {
-        'todos': todos,
-    })
+    return render(request, 'todo.html', _todo_list_context(request))
 
 @login_required
 def toggle_task(request, task_id):
-    task = get_object_or_404(Todo, id=task_id, user=request.user)
     if request.method == 'POST':
-        task.completed = not task.completed
-        task.save()
+        with transaction.atomic(using=shard_for(request.user.id)):
+            _require_rows(counted_toggle(Todo.objects.owned_by(request.user).filter(id=task_id), request.user.id))
+            record_changes(request.user.id, changed=[task_id])
+            publish_event(request.user.id, 'toggled', ids=[task_id])
+        bump_list_version(request.user.id)
     return redirect('todo')
 
 @login_required
 def delete_task(request, task_id):
-    task = get_object_or_404(Todo, id=task_id, user=request.user)
     if request.method == 'POST':
-        task.delete()
+        with transaction.atomic(using=shard_for(request.user.id)):
+            unindex_todos(request.user, [task_id])
+            _require_rows(counted_delete(Todo.objects.owned_by(request.user).filter(id=task_id), request.user.id))
+            record_changes(request.user.id, deleted=[task_id])
+            publish_event(request.user.id, 'deleted', ids=[task_id])
+        bump_list_version(request.user.id)
     return redirect('todo')
 
+@login_required
+@require_POST
+def bulk_add_tasks(request):
+    titles = request.POST.getlist('title') or request.POST.get('titles', '').splitlines()
+    rows = [{'title': title.strip()} for title in titles if title.strip()]
+
+    serializer = TodoSerializer(data=rows, many=True)
+    if rows and serializer.is_valid():
+        with transaction.atomic(using=shard_for(request.user.id)):
+            todos = Todo.objects.create_many(request.user, serializer.validated_data)
+            index_new_todos(todos)
+            record_changes(request.user.id, changed=[todo.id for todo in todos])
+            publish_event(request.user.id, 'created', todos=[todo_payload(todo) for todo in todos])
+        bump_list_version(request.user.id)
+        return redirect('todo')
+
+    if rows:
+        errors = [f"Task {i + 1}: {error['title'][0]}" for i, error in enumerate(list_errors(serializer)) if error]
+    else:
+        errors = ["Enter at least one task title."]
+    return render(request, 'todo.html', {
+        **_todo_list_context(request),
+        'errors': {'titles': errors},
+    })
+
+def _bulk_task_ids(request):
+    serializer = TaskIdsSerializer(data=request.POST)
+    if not serializer.is_valid():
+        return []
+    return serializer.validated_data['task_ids']
+
+def _owned_task_ids(user, task_ids):
+    """
+    Lock and return those of `task_ids` that are the user's todos, so ids of
+    other users' or missing todos are neither written, logged nor published.
+    Call inside the write's transaction.
+    """
+    return list(Todo.objects.owned_by(user).filter(id__in=task_ids).select_for_update().order_by('id').values_list('id', flat=True))
+
+@login_required
+@require_POST
+def bulk_toggle_tasks(request):
+    task_ids = _bulk_task_ids(request)
+    if not task_ids:
+        return redirect('todo')
+    with transaction.atomic(using=shard_for(request.user.id)):
+        task_ids = _owned_task_ids(request.user, task_ids)
+        if not task_ids:
+            return redirect('todo')
+        counted_toggle(Todo.objects.owned_by(request.user).filter(id__in=task_ids), request.user.id)
+        record_changes(request.user.id, changed=task_ids)
+        publish_event(request.user.id, 'toggled', ids=task_ids)
+    bump_list_version(request.user.id)
+    return redirect('todo')
+
+@login_required
+@require_POST
+def bulk_delete_tasks(request):
+    task_ids = _bulk_task_ids(request)
+    if not task_ids:
+        return redirect('todo')
+    with transaction.atomic(using=shard_for(request.user.id)):
+        task_ids = _owned_task_ids(request.user, task_ids)
+        if not task_ids:
+            return redirect('todo')
+        unindex_todos(request.user, task_ids)
+        counted_delete(Todo.objects.owned_by(request.user).filter(id__in=task_ids), request.user.id)
+        record_changes(request.user.id, deleted=task_ids)
+        publish_event(request.user.id, 'deleted', ids=task_ids)
+    bump_list_version(request.user.id)
+    return redirect('todo')
+
+def _move_task(user, task_id, after_id):
+    """
+    Place one of the user's todos right after `after_id` (first when None).
+    Rewrites the positions of the todos around it when the new one came out
+    too long.
+    """
+    with transaction.atomic(using=shard_for(user.id)):
+        todos = Todo.objects.owned_by(user)
+        try:
+            position = todos.place_after(task_id, after_id)
+        except Todo.DoesNotExist:
+            raise Http404('No Todo matches the given query.')
+        changed = [task_id]
+        if len(position) > REBALANCE_LENGTH:
+            changed = todos.rebalance_around(task_id)
+        record_changes(user.id, changed=changed)
+        publish_event(user.id, 'moved', ids=[task_id], after=after_id)
+    bump_list_version(user.id)
+
+
+def _after_id(value):
+    """The `after` todo id of a move: an int, or None for the top. Garbage is a ValueError."""
+    return int(value) if value not in (None, '') else None
+
+
+@login_required
+@require_POST
+def move_task(request, task_id):
+    """Drag and drop: move the todo to right after the todo in `after`, or to the top without one."""
+    try:
+        after_id = _after_id(request.POST.get('after'))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid todo id in "after".')
+    _move_task(request.user, task_id, after_id)
+    return redirect('todo')
+
+@login_required
+def search_tasks(request):
+    query = request.GET.get('q', '').strip()
+    return render(request, 'todo.html', {
+        'search_query': query,
+        'search_results': search(request.user, query) if query else [],
+    })
+
+@login_required
+def archived_tasks(request):
+    page_size = settings.TODO_PAGE_SIZE
+    try:
+        after = int(request.GET['after'])
+    except (KeyError, ValueError):
+        after = None
+
+    archived = ArchivedTodo.objects.for_shard_of(request.user.id).filter(user=request.user).order_by('-id').only('id', 'title', 'completed_at')
+    if after is not None:
+        archived = archived.filter(id__lt=after)
+    archived = list(archived[:page_size + 1])
+    return render(request, 'todo.html', {
+        'show_archived': True,
+        'archived': archived[:page_size],
+        'archived_after': after,
+        'archived_next': archived[page_size - 1].id if len(archived) > page_size else None,
+    })
+
+@staff_member_required
+def metrics(request):
+    return JsonResponse({
+        'fragment_cache': fragment_cache_stats(),
+        'hashing_pool': get_pool().stats(),
+        'db_pools': pool_stats(),
+        'server_timing': timing_stats(),
+        'events': get_broker().stats(),
+    })
+
+@login_required
+@require_safe
+def export_tasks(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Unknown export format.')
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    filename = f'todos.{export_format}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        export_stream(request.user, export_format, compress),
+        content_type='application/gzip' if compress else EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+@require_POST
+def import_tasks(request):
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Upload a CSV or NDJSON file as "file".'}, status=400)
+    import_format = request.POST.get('format') or guess_format(upload.name)
+    if import_format not in IMPORT_FORMATS:
+        return JsonResponse({'error': 'Unknown import format; use csv or ndjson.'}, status=400)
+
+    result = import_todos(request.user, parse_rows(open_upload(upload, upload.name), import_format))
+    if result.created:
+        bump_list_version(request.user.id)
+        publish_event(request.user.id, 'reset')
+    return JsonResponse(result.as_dict(), status=400 if result.aborted and not result.created else 200)
+
 @login_required
 def logout_view(request):
     logout(request)  # Log the user out
-    return redirect('login') 
+    return redirect('login')
+
+
+class TodoCursorPagination(CursorPagination):
+    ordering = 'id'
+
+    def get_page_size(self, request):
+        return settings.TODO_PAGE_SIZE
+
+
+class TodoViewSet(mixins.ListModelMixin,
+                  mixins.RetrieveModelMixin,
+                  mixins.CreateModelMixin,
+                  mixins.UpdateModelMixin,
+                  mixins.DestroyModelMixin,
+                  viewsets.GenericViewSet):
+    """
+    JSON API for the current user's todos.
+
+    `?fields=id,title` limits both the columns loaded and the fields returned;
+    naming a field the API does not have is a 400.
+    List responses carry an ETag derived from the user's list version, so an
+    unchanged list is answered with 304 before any row is loaded.
+
+    `sync/?since=<seq>` returns what changed after `seq`; see sync().
+    `<id>/move/` places a todo after the one in `after`; see move().
+    """
+    serializer_class = TodoSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TodoCursorPagination
+    http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+
+    def requested_fields(self):
+        # Writes load and return whole todos; an update of a deferred
+        # instance would load each missing field with a query of its own.
+        fields = self.request.query_params.get('fields')
+        if not fields or self.request.method not in ('GET', 'HEAD'):
+            return None
+        names = [name for name in fields.split(',') if name]
+        unknown = [name for name in names if name not in TodoSerializer.Meta.fields]
+        if unknown:
+            raise ValidationError({'fields': [f"Unknown fields: {', '.join(unknown)}."]})
+        return names
+
+    def get_queryset(self):
+        queryset = Todo.objects.owned_by(self.request.user)
+        fields = self.requested_fields()
+        if fields is not None:
+            queryset = queryset.only('id', *[name for name in fields if name != 'id'])
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list_etag(self):
+        key = '{}:{}:{}:{}'.format(
+            self.request.user.id,
+            list_version(self.request.user.id),
+            self.request.accepted_renderer.format,
+            self.request.get_full_path(),
+        )
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def list(self, request, *args, **kwargs):
+        etag = self.list_etag()
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    @action(detail=False)
+    def sync(self, request):
+        """
+        The todos changed and the ids of those deleted since the change log
+        sequence number `since`, and the `seq` to pass next time. With
+        `reset` set the client must download the whole list first; with
+        `more` set it should call again right away.
+        """
+        try:
+            since = int(request.query_params['since'])
+        except (KeyError, ValueError):
+            raise ValidationError({'since': ['Pass the seq of the last sync, or 0 for none.']})
+        # A replica may lag behind the log, and its older todos would then be
+        # filed under the newer seq.
+        with replica_reads(False):
+            changes = changes_since(request.user.id, since)
+            todos = self.get_queryset().filter(id__in=changes['changed']).order_by('id') if changes['changed'] else []
+            changed = self.get_serializer(todos, many=True).data
+        return Response({
+            'seq': changes['seq'],
+            'reset': changes['reset'],
+            'more': changes['more'],
+            'changed': changed,
+            'deleted': changes['deleted'],
+        })
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """Move the todo to right after the todo whose id is `after`, or to the top when it is null."""
+        try:
+            after_id = _after_id(request.data.get('after'))
+        except (TypeError, ValueError):
+            raise ValidationError({'after': ['Pass the id of a todo, or null for the top.']})
+        todo = self.get_object()
+        _move_task(request.user, todo.id, after_id)
+        todo.refresh_from_db(fields=['position'])
+        return Response(self.get_serializer(todo).data)
+
+    def perform_create(self, serializer):
+        with transaction.atomic(using=shard_for(self.request.user.id)):
+            todo = serializer.save(user=self.request.user)
+            index_new_todos([todo])
+            record_changes(self.request.user.id, changed=[todo.id])
+            publish_event(self.request.user.id, 'created', todos=[todo_payload(todo)])
+        bump_list_version(self.request.user.id)
+
+    def perform_update(self, serializer):
+        with transaction.atomic(using=shard_for(self.request.user.id)):
+            was_completed = Todo.objects.owned_by(self.request.user).select_for_update().values_list('completed', flat=True).get(id=serializer.instance.id)
+            todo = serializer.save()
+            index_todo(todo.user_id, todo.id, todo.title, todo.description)
+            adjust_counts(todo.user_id, completed=int(todo.completed) - int(was_completed))
+            record_changes(todo.user_id, changed=[todo.id])
+            publish_event(todo.user_id, 'edited', todos=[todo_payload(todo)])
+        bump_list_version(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(using=shard_for(self.request.user.id)):
+            unindex_todos(self.request.user, [instance.id])
+            counted_delete(Todo.objects.owned_by(self.request.user).filter(id=instance.id), self.request.user.id)
+            record_changes(self.request.user.id, deleted=[instance.id])
+            publish_event(self.request.user.id, 'deleted', ids=[instance.id])
+        bump_list_version(self.request.user.id)
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Live todo updates (auth/events/) are only served through this entrypoint;
+under WSGI every open stream would hold a worker thread.
 """
 
 import os
@@ -44,7 +44,10 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'auth.User' 
 
 MIDDLEWARE = [
+    'tasks.middleware.ServerTimingMiddleware',
+    'tasks.middleware.GZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'tasks.middleware.ReplicaReadMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,7 +60,7 @@ ROOT_URLCONF = 'todoProject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'tasks.timing.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,17 +80,83 @@ WSGI_APPLICATION = 'todoProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# The pooled engines (tasks.db.backends.mysql / tasks.db.backends.sqlite3) wrap
+# Django's own backends and reuse connections across requests. POOL sets the
+# pool size, how long idle connections are kept, how long a request waits for
+# a free connection and whether reused connections are pinged first.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'tasks.db.backends.mysql',
         'NAME':'userdetails',
         'USER': 'root',
         'PASSWORD': 'Makeitpossible123',
         'HOST': 'localhost',
-        'PORT':'3307'
+        'PORT':'3307',
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 20,
+            'MAX_IDLE': 300,
+            'TIMEOUT': 10,
+            'PRE_PING': True,
+        },
     }
 }
 
+# Sharding of the per-user todo tables (todos, search terms, counters and the
+# archive) by user id over the database aliases in ALIASES; users and sessions
+# stay on 'default'. Each user's shard is recorded on first use and cached in
+# CACHE, which must be shared by all processes when there is more than one
+# shard (`manage.py move_user_shard` updates it): `manage.py check --deploy`
+# rejects a LocMemCache outside DEBUG. Run `migrate --database` for every
+# alias. A single alias turns sharding off.
+
+TODO_SHARDS = {
+    'ALIASES': ['default'],
+    'CACHE': 'default',
+}
+
+# Read replicas. Add each replica to DATABASES, e.g.
+#     'replica': {'ENGINE': 'tasks.db.backends.mysql', 'NAME': 'userdetails', 'HOST': 'replica-host', ...},
+# and list its alias in ALIASES. Reads of MODELS in read-only requests are
+# spread over the replicas; a client that has just written reads from the
+# primary for PIN_SECONDS, which should cover the usual replication lag.
+# With more than one shard, todos are always read from their shard.
+
+DATABASE_ROUTERS = ['tasks.db.routers.ShardRouter', 'tasks.db.routers.ReplicaRouter']
+
+TODO_REPLICAS = {
+    'ALIASES': [],
+    'MODELS': ['tasks.todo', 'auth.user'],
+    'PIN_SECONDS': 5,
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered todo list fragments. Entries expire after TIMEOUT seconds and the
+    # least recently used ones are culled once MAX_ENTRIES is reached.
+    'todo_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'todo-fragments',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+# Holds the rendered todo lists and the per-user list versions that the todo
+# page's ETag and Last-Modified are cached under. Writes bump the version in
+# this cache, so with more than one worker it must be shared: `manage.py
+# check --deploy` rejects a LocMemCache outside DEBUG.
+TODO_FRAGMENT_CACHE = 'todo_fragments'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -107,6 +176,65 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Sessions are read from the cache and only fall back to the database on a
+# miss. Use 'django.contrib.sessions.backends.signed_cookies' to drop session
+# storage entirely.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Cache alias holding a small per-user record so request.user needs no
+# auth_user query. Set to None to always load the user from the database.
+# Records are invalidated from the process that saved the user, so with more
+# than one worker this must be a shared cache: `manage.py check --deploy`
+# rejects a LocMemCache outside DEBUG.
+
+TODO_USER_CACHE = 'default'
+TODO_USER_CACHE_TIMEOUT = 300
+
+AUTHENTICATION_BACKENDS = [
+    'tasks.backends.TodoModelBackend',
+]
+
+# Password hashing runs on a bounded pool (KIND 'thread' or 'process'). Once
+# WORKERS + MAX_QUEUE hashes are in flight, logins and signups get a 429.
+
+TODO_HASHING_POOL = {
+    'KIND': 'thread',
+    'WORKERS': 4,
+    'MAX_QUEUE': 16,
+    'TIMEOUT': 10,
+}
+
+
+# Per-request SQL, template and middleware timings, sent as a Server-Timing
+# header. Requests slower than SLOW_REQUEST_MS and queries repeated at least
+# REPEATED_QUERY_THRESHOLD times in one request are logged to 'tasks.timing';
+# the KEEP_SLOWEST slowest requests and up to KEEP_REPEATED repeated queries
+# are listed in auth/metrics/. The header exposes timings to clients, so keep
+# it off on public deployments.
+
+TODO_SERVER_TIMING = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'REPEATED_QUERY_THRESHOLD': 5,
+    'KEEP_SLOWEST': 20,
+    'KEEP_REPEATED': 100,
+}
+
+
+# Live todo list updates over Server-Sent Events (auth/events/, ASGI only).
+# BROKER fans events out to open streams; the in-process default only reaches
+# streams served by the same process. Streams send a comment every HEARTBEAT
+# seconds to keep proxies from closing them, and a client more than MAX_QUEUE
+# events behind is told to reload instead.
+
+TODO_EVENTS = {
+    'BROKER': 'tasks.events.InProcessBroker',
+    'HEARTBEAT': 15,
+    'MAX_QUEUE': 100,
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -123,8 +251,34 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Outside DEBUG, collectstatic writes content-hashed copies of every file
+# (style.css -> style.1a2b3c4d5e6f.css) plus gzip/brotli versions, and
+# tasks.storage.serve_static serves them with far-future cache headers.
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'tasks.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Number of todos rendered per page of the todo list.
+
+TODO_PAGE_SIZE = 50
+
+# Serve the todo views from tasks.async_views (async ORM) instead of tasks.views.
+# Only worth enabling when running under ASGI.
+
+TODO_ASYNC_VIEWS = False
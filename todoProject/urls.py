@@ -14,10 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
+
+from tasks.storage import serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('tasks.urls')),
 ]
+
+# Under DEBUG, runserver serves static files straight from the app directories.
+if not settings.DEBUG:
+    urlpatterns.append(re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_static))